@@ -1,4 +1,6 @@
 import asyncio
+import logging
+import re
 from os import environ
 
 import pytz
@@ -6,35 +8,64 @@ import uvloop
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
-from neobabix import tick, logger
+from neobabix import tick, prewarm_tick, logger
+from neobabix.execution.prewarm import prewarm_trigger
+from neobabix.notifications.digest import flush_digests
+from neobabix.notifications.dispatcher import drain_dispatchers
+from neobabix.notifications.registry import template_registry
+from neobabix.notifications.webhook import webhook_client
+from neobabix.runtime import BOTS_CONFIG, load_config, schedule_bots
+from neobabix.telemetry.loopmonitor import loop_monitor, start_loop_monitor
+from neobabix.telemetry.metrics import METRICS_PORT, start_metrics_server
+from neobabix.telemetry.profiling import tick_profiler
 
 RELEASE_LOCK_ON_ERROR = True if environ.get('RELEASE_LOCK_ON_ERROR') == '1' else False
 
+SECRET_NAMES = re.compile(r'KEY|SECRET|TOKEN|PASSWORD|PASSPHRASE|URL', re.IGNORECASE)
+
 
 def main():
     uvloop.install()
 
     trade_lock = asyncio.Lock()
 
-    logger.info('Environment Variables')
-    logger.info('---------------------')
-    for k, v in sorted(environ.items()):
-        logger.info(f'{k}={v}')
-    logger.info('---------------------\n')
+    if logger.isEnabledFor(logging.DEBUG):
+        # Credentials and URLs, which can carry tokens, never make it to the logs
+        logger.debug('Environment Variables: %s', ', '.join(f'{k}={"***" if SECRET_NAMES.search(k) else v}'
+                                                          for k, v in sorted(environ.items())))
+
+    template_registry.load()
 
     async def job():
         try:
-            await tick(trade_lock=trade_lock)
+            async with tick_profiler.profile(name='tick'):
+                await tick(trade_lock=trade_lock)
         except Exception as exc:
             if trade_lock.locked() and RELEASE_LOCK_ON_ERROR:
                 logger.info(f'Exception happened on tick, set to release lock.')
                 logger.error(f'{exc}')
                 trade_lock.release()
 
+    async def prewarm_job():
+        try:
+            await prewarm_tick(trade_lock=trade_lock)
+        except Exception as exc:
+            logger.error(f'Prewarm failed: {exc}')
+
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(job, IntervalTrigger(seconds=86400,
-                                           timezone=pytz.timezone('UTC')))
+    if BOTS_CONFIG:
+        logger.info(f'Loading bots from {BOTS_CONFIG}')
+        schedule_bots(scheduler=scheduler,
+                      config=load_config(path=BOTS_CONFIG),
+                      release_lock_on_error=RELEASE_LOCK_ON_ERROR)
+    else:
+        scheduler.add_job(job, IntervalTrigger(seconds=86400,
+                                               timezone=pytz.timezone('UTC')))
+        scheduler.add_job(prewarm_job, prewarm_trigger(interval=86400))
     scheduler.start()
+    if METRICS_PORT:
+        asyncio.get_event_loop().run_until_complete(start_metrics_server(port=int(METRICS_PORT)))
+    start_loop_monitor(loop=asyncio.get_event_loop())
     logger.info('Neobabix is running, press Ctrl+C to exit')
 
     try:
@@ -42,6 +73,15 @@ def main():
     except (KeyboardInterrupt, SystemExit):
         pass
 
+    loop_monitor.stop()
+
+    # Give queued notifications a chance to go out
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(flush_digests())
+    loop.run_until_complete(webhook_client.flush())
+    loop.run_until_complete(drain_dispatchers())
+    loop.run_until_complete(webhook_client.close())
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,35 @@
+import ccxt
+import requests
+
+from neobabix.telemetry.exchange import call_seconds, instrument, start_call_summary
+
+"""
+    Drives a request through an instrumented ccxt client, answered locally instead of by the exchange, and checks it
+    was recorded. Run it against the ccxt version in poetry.lock after upgrading ccxt: python exchange_metrics_check.py
+"""
+
+
+class CannedSession(requests.Session):
+    def request(self, method, url, *args, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers['Content-Type'] = 'application/json'
+        response._content = b'{"serverTime": 1600000000000}'
+        return response
+
+
+def main():
+    exchange = instrument(exchange=ccxt.binance({'session': CannedSession(), 'enableRateLimit': False}))
+    summary = start_call_summary()
+
+    assert exchange.fetch_time() == 1600000000000
+
+    recorded = [key for key in call_seconds.series if ('method', 'fetch_time') in key]
+    assert recorded, 'fetch_time was not recorded'
+    assert ('binance', 'fetch_time') in summary.calls, 'fetch_time is missing from the call summary'
+    print(f'ccxt {ccxt.__version__}: {summary}')
+
+
+if __name__ == '__main__':
+    main()
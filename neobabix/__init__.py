@@ -1,5 +1,7 @@
+import asyncio
+from datetime import datetime
 from os import environ, getcwd
-from typing import Dict, Type
+from typing import Dict, Optional, Set, Type
 from asyncio import Lock
 
 import ccxt
@@ -13,14 +15,27 @@ from neobabix.strategies.buyeveryweek import BuyEveryWeek
 from neobabix.strategies.moonphasebuy import MoonPhaseBuy
 from neobabix.strategies.dummylong import DummyLong
 from neobabix.strategies.dummyshort import DummyShort
-from neobabix.logging import logger
+from neobabix.logging import logger, set_log_context
 from neobabix.constants import USER_AGENT
 from neobabix.playbooks.hitandrun import HitAndRun
 from neobabix.playbooks.fractalism import Fractalism
 from neobabix.playbooks.fractalismfibo import FractalismFibo
 from neobabix.playbooks.dca import DCA
+from neobabix.playbooks.playbook import Playbook
+from neobabix.notifications.notification import Notification
 from neobabix.notifications.telegram import Telegram
 from neobabix.notifications.webhook import Webhook
+from neobabix.notifications.silent import Silent
+from neobabix.notifications.dispatcher import Dispatched
+from neobabix.notifications.composite import Composite
+from neobabix.notifications.digest import Digest, NOTIFY_DIGEST_WINDOW
+from neobabix.analytics.ledger import Ledger
+from neobabix.analytics.shadow import FillReport, SHADOW
+from neobabix.exchanges.simulated import market_feed, simulated_exchange
+from neobabix.execution.orders import run_sync
+from neobabix.execution.prewarm import prewarm
+from neobabix.telemetry.exchange import instrument, start_call_summary
+from neobabix.telemetry.metrics import signals_total, span, timed
 
 CANDLES_EXCHANGE = environ.get('CANDLES_EXCHANGE', 'bitfinex')
 TRADES_EXCHANGE = environ.get('TRADES_EXCHANGE', 'binance')
@@ -35,6 +50,16 @@ PLAYBOOK = environ.get('PLAYBOOK', 'HitAndRun')
 NOTIFY_USING = environ.get('NOTIFY_USING', 'telegram')
 LEVERAGE = environ.get('LEVERAGE', '1')
 TESTNET = environ.get('TESTNET', '0')
+SHADOW_STRATEGY = environ.get('SHADOW_STRATEGY')
+SHADOW_PLAYBOOK = environ.get('SHADOW_PLAYBOOK')
+SHADOW_LEDGER_FILE = environ.get('SHADOW_LEDGER_FILE')
+
+SHADOW_ENABLED = bool(SHADOW_STRATEGY or SHADOW_PLAYBOOK)
+fill_report = FillReport(logger=logger)
+shadow_ledger = Ledger(path=SHADOW_LEDGER_FILE)
+shadow_lock: Optional[Lock] = None
+shadow_tasks: Set[asyncio.Task] = set()
+trades_clients: Dict[bool, Exchange] = {}
 
 
 def get_ccxt_client(exchange: str, api_key: str = None, api_secret: str = None, testnet: bool = True) -> Exchange:
@@ -68,20 +93,33 @@ def get_ccxt_client(exchange: str, api_key: str = None, api_secret: str = None,
         else:
             raise NotImplementedError('Testnet is wanted but the exchange does not support testnet')
 
-    return exchange
+    return instrument(exchange=exchange)
+
+
+def get_trades_client(testnet: bool) -> Exchange:
+    # One client per process, the prewarmed state and its connections belong to it
+    if testnet not in trades_clients:
+        trades_clients[testnet] = get_ccxt_client(exchange=TRADES_EXCHANGE,
+                                                  api_key=API_KEY,
+                                                  api_secret=API_SECRET,
+                                                  testnet=testnet)
+    return trades_clients[testnet]
 
 
 async def fetch_candles(symbol: str, exchange: str, timeframe: str = '1h',
-                        trade_on_close: bool = True) -> Dict[str, np.ndarray]:
-    client = get_ccxt_client(exchange=exchange,
-                             testnet=False)
+                        trade_on_close: bool = True, client: Exchange = None) -> Dict[str, np.ndarray]:
+    if client is None:
+        client = get_ccxt_client(exchange=exchange,
+                                 testnet=False)
     if not client.has['fetchOHLCV']:
         raise TypeError(f'The exchange {exchange} does not let candles to be retrieved')
 
-    ohlcv = client.fetch_ohlcv(symbol=symbol,
-                               timeframe=timeframe,
-                               limit=100)
+    ohlcv = await run_sync(client.fetch_ohlcv,
+                           symbol=symbol,
+                           timeframe=timeframe,
+                           limit=100)
 
+    timestamps = list(map(lambda x: x[0], ohlcv))
     opens = list(map(lambda x: x[1], ohlcv))
     highs = list(map(lambda x: x[2], ohlcv))
     lows = list(map(lambda x: x[3], ohlcv))
@@ -89,6 +127,7 @@ async def fetch_candles(symbol: str, exchange: str, timeframe: str = '1h',
     volumes = list(map(lambda x: x[5], ohlcv))
 
     if trade_on_close:
+        timestamps.pop(1)
         opens.pop(1)
         highs.pop(1)
         lows.pop(1)
@@ -96,6 +135,7 @@ async def fetch_candles(symbol: str, exchange: str, timeframe: str = '1h',
         volumes.pop(1)
 
     return {
+        'timestamps': np.array(timestamps),
         'opens': np.array(opens),
         'highs': np.array(highs),
         'lows': np.array(lows),
@@ -121,7 +161,47 @@ def get_strategy(strategy: str) -> Type[Strategy]:
     return strategies.get(strategy)
 
 
-async def route_actions(action: Actions, trade_lock: Lock, testnet: bool, ohlcv: dict):
+def get_playbook(playbook: str) -> Type[Playbook]:
+    playbooks: Dict[str, Type[Playbook]] = {
+        'HitAndRun': HitAndRun,
+        'Fractalism': Fractalism,
+        'FractalismFibo': FractalismFibo,
+        'DCA': DCA,
+    }
+
+    _playbook = playbooks.get(playbook)
+    if not _playbook:
+        raise NotImplementedError(f'Playbook {playbook} is not yet implemented')
+
+    return _playbook
+
+
+def get_notification(notify_using: str, context: Dict[str, str] = None) -> Notification:
+    notification_channels: Dict[str, Type[Notification]] = {
+        'telegram': Telegram,
+        'webhook': Webhook
+    }
+
+    channels = []
+    for channel in notify_using.split(','):
+        _notification = notification_channels.get(channel.strip())
+        if not _notification:
+            raise NotImplementedError(f'The notification channel {channel} is not yet implemented')
+        notification = _notification(context=context)
+        dispatched = Dispatched(channel=notification) if notification.queued else notification
+        if float(NOTIFY_DIGEST_WINDOW) > 0:
+            dispatched = Digest(channel=dispatched,
+                                context=context)
+        channels.append(dispatched)
+
+    if len(channels) == 1:
+        return channels[0]
+    return Composite(channels=channels)
+
+
+@timed(stage='route')
+async def route_actions(action: Actions, trade_lock: Lock, testnet: bool, ohlcv: dict,
+                        signal_time: datetime = None):
     if trade_lock.locked():
         logger.info('There is an ongoing trade, bailing out')
         return
@@ -136,46 +216,105 @@ async def route_actions(action: Actions, trade_lock: Lock, testnet: bool, ohlcv:
         logger.info('Signal suggests doing nothing..')
         return
 
-    playbooks = {
-        'HitAndRun': HitAndRun,
-        'Fractalism': Fractalism,
-        'FractalismFibo': FractalismFibo,
-        'DCA': DCA,
-    }
-    _playbook = playbooks.get(PLAYBOOK)
-    if not _playbook:
-        raise NotImplementedError(f'Playbook {PLAYBOOK} is not yet implemented')
+    _playbook = get_playbook(playbook=PLAYBOOK)
 
-    exchange = get_ccxt_client(exchange=TRADES_EXCHANGE,
-                               api_key=API_KEY,
-                               api_secret=API_SECRET,
-                               testnet=testnet)
+    exchange = get_trades_client(testnet=testnet)
 
-    notification_channels = {
-        'telegram': Telegram,
-        'webhook': Webhook
-    }
-    _notification = notification_channels.get(NOTIFY_USING)
-    if not _notification:
-        raise NotImplementedError(f'The notification channel {NOTIFY_USING} is not yet implemented')
+    notification = get_notification(notify_using=NOTIFY_USING)
+
+    with span(stage='playbook'):
+        playbook = _playbook(action=action,
+                             exchange=exchange,
+                             trade_lock=trade_lock,
+                             logger=logger,
+                             symbol=TRADE_SYMBOL,
+                             timeframe=TIMEFRAME,
+                             notification=notification,
+                             leverage=int(LEVERAGE),
+                             ohlcv=ohlcv)
+    if SHADOW_ENABLED:
+        playbook.fill_report = fill_report
+    if signal_time:
+        playbook.signal_time = signal_time
+
+    await playbook.play()
+
+
+async def route_shadow(action: Actions, testnet: bool, ohlcv: dict, signal_time: datetime):
+    global shadow_lock
+    if shadow_lock is None:
+        shadow_lock = Lock()
+
+    if SHADOW_STRATEGY:
+        strategy = get_strategy(strategy=SHADOW_STRATEGY)(opens=ohlcv.get('opens'),
+                                                          highs=ohlcv.get('highs'),
+                                                          lows=ohlcv.get('lows'),
+                                                          closes=ohlcv.get('closes'),
+                                                          volumes=ohlcv.get('volumes'),
+                                                          logger=logger)
+        action = strategy.filter()
+
+    if action == Actions.NOTHING:
+        logger.info('Shadow: signal suggests doing nothing..')
+        return
+    if shadow_lock.locked():
+        logger.info('Shadow: there is an ongoing shadow trade, bailing out')
+        return
 
-    notification = _notification()
+    # The live client is only used for its class and, once, for markets nobody has fetched yet
+    live = get_trades_client(testnet=testnet)
 
+    _playbook = get_playbook(playbook=SHADOW_PLAYBOOK or PLAYBOOK)
     playbook = _playbook(action=action,
-                         exchange=exchange,
-                         trade_lock=trade_lock,
+                         exchange=simulated_exchange(live=live),
+                         trade_lock=shadow_lock,
                          logger=logger,
                          symbol=TRADE_SYMBOL,
                          timeframe=TIMEFRAME,
-                         notification=notification,
+                         notification=Silent(),
                          leverage=int(LEVERAGE),
                          ohlcv=ohlcv)
+    playbook.__name__ = f'Shadow {playbook.__name__}'
+    playbook.ledger = shadow_ledger
+    playbook.fill_report = fill_report
+    playbook.fill_source = SHADOW
+    playbook.signal_time = signal_time
 
     await playbook.play()
 
 
+def start_shadow(action: Actions, testnet: bool, ohlcv: dict, signal_time: datetime):
+    async def _run():
+        try:
+            await route_shadow(action=action,
+                               testnet=testnet,
+                               ohlcv=ohlcv,
+                               signal_time=signal_time)
+        except Exception as exc:
+            logger.error(f'Shadow: {exc}')
+            if shadow_lock is not None and shadow_lock.locked():
+                shadow_lock.release()
+
+    task = asyncio.ensure_future(_run())
+    shadow_tasks.add(task)
+    task.add_done_callback(shadow_tasks.discard)
+
+
+async def prewarm_tick(trade_lock: Lock):
+    if trade_lock.locked():
+        return
+
+    await prewarm(exchange=get_trades_client(testnet=TESTNET == '1'),
+                  symbol=TRADE_SYMBOL,
+                  leverage=int(LEVERAGE),
+                  logger=logger)
+
+
+@timed(stage='tick')
 async def tick(trade_lock: Lock):
+    set_log_context(symbol=TRADE_SYMBOL, trade_id=None)
     logger.info('<< Tick has started >>')
+    calls = start_call_summary()
 
     logger.info(f'Strategy: {STRATEGY}')
     logger.info(f'Playbook: {PLAYBOOK}')
@@ -185,33 +324,50 @@ async def tick(trade_lock: Lock):
     logger.info(f'Leverage: {LEVERAGE}')
     logger.info('--')
 
+    signal_time = datetime.utcnow()
     trade_on_close = True if TRADE_ON_CLOSE == '1' else False
     logger.info(f'Trade on Close: {trade_on_close}')
 
     logger.info(f'Fetching candles from {CANDLES_EXCHANGE.title()}')
-    candles = await fetch_candles(symbol=CANDLE_SYMBOL,
-                                  exchange=CANDLES_EXCHANGE,
-                                  timeframe=TIMEFRAME,
-                                  trade_on_close=trade_on_close)
+    with span(stage='candles'):
+        candles = await fetch_candles(symbol=CANDLE_SYMBOL,
+                                      exchange=CANDLES_EXCHANGE,
+                                      timeframe=TIMEFRAME,
+                                      trade_on_close=trade_on_close)
+    market_feed.update_candles(symbol=TRADE_SYMBOL,
+                               ohlcv=candles)
 
     logger.info(f'Using strategy: {STRATEGY}')
     strategy_type = get_strategy(strategy=STRATEGY)
     logger.info('Initializing strategy with OHLCV data')
-    strategy = strategy_type(opens=candles.get('lows'),
-                             highs=candles.get('highs'),
-                             lows=candles.get('lows'),
-                             closes=candles.get('closes'),
-                             volumes=candles.get('volumes'),
-                             logger=logger)
+    with span(stage='indicators'):
+        strategy = strategy_type(opens=candles.get('lows'),
+                                 highs=candles.get('highs'),
+                                 lows=candles.get('lows'),
+                                 closes=candles.get('closes'),
+                                 volumes=candles.get('volumes'),
+                                 logger=logger)
 
     logger.info('Filtering for entry actions')
-    action = strategy.filter()
+    with span(stage='filter'):
+        action = strategy.filter()
+    signals_total.inc(strategy=STRATEGY,
+                      action=action.name)
 
     logger.info('Routing actions')
     use_testnet = True if TESTNET == '1' else False
+    if SHADOW_ENABLED:
+        logger.info('Routing shadow actions')
+        start_shadow(action=action,
+                     testnet=use_testnet,
+                     ohlcv=candles,
+                     signal_time=signal_time)
+
     await route_actions(action=action,
                         trade_lock=trade_lock,
                         testnet=use_testnet,
-                        ohlcv=candles)
+                        ohlcv=candles,
+                        signal_time=signal_time)
 
+    logger.info(f'Exchange calls: {calls}')
     logger.info('<< Tick has ended >>')
@@ -0,0 +1,92 @@
+import csv
+from datetime import datetime, timezone
+from os import environ, path as ospath
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from neobabix.strategies.strategy import Actions
+
+LEDGER_FILE = environ.get('LEDGER_FILE')
+
+LEDGER_DTYPE = np.dtype([
+    ('opened_at', 'f8'),
+    ('closed_at', 'f8'),
+    ('side', 'i1'),
+    ('entry_price', 'f8'),
+    ('exit_price', 'f8'),
+    ('size', 'f8'),
+    ('fees', 'f8'),
+])
+
+
+def _timestamp(moment: datetime) -> float:
+    # Playbooks keep naive UTC datetimes
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+class Ledger:
+    """
+        Closed trades recorded by playbooks, one row per round trip.
+
+        Rows are kept as a numpy structured array (see LEDGER_DTYPE) so every metric can be computed in bulk.
+        Timestamps are UNIX seconds, side is 1 for longs and -1 for shorts, size and fees are in quote currency.
+
+        When a path is given, every recorded trade is appended to it as a CSV line and existing rows are loaded on
+        first access, so the ledger survives restarts.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._rows: List[Tuple] = []
+        self._array: Optional[np.ndarray] = None
+        self._loaded = path is None
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._rows)
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+
+        if not ospath.exists(self.path) or ospath.getsize(self.path) == 0:
+            return
+
+        rows = np.loadtxt(self.path, dtype=LEDGER_DTYPE, delimiter=',', ndmin=1)
+        self._rows = rows.tolist() + self._rows
+        self._array = None
+
+    def record(self, opened_at: datetime, closed_at: datetime, action: Actions,
+               entry_price: Union[float, str], exit_price: Union[float, str], size: Union[float, str],
+               fees: Union[float, str] = 0.0):
+        if action != Actions.LONG and action != Actions.SHORT:
+            raise ValueError('Only LONG and SHORT trades can be recorded')
+
+        row = (_timestamp(opened_at), _timestamp(closed_at), action.value, float(entry_price), float(exit_price),
+               float(size), float(fees))
+
+        self._load()
+        self._rows.append(row)
+        self._array = None
+
+        if self.path:
+            with open(self.path, 'a', newline='') as f:
+                csv.writer(f).writerow(row)
+
+    def extend(self, rows: np.ndarray):
+        self._load()
+        self._rows.extend(np.asarray(rows, dtype=LEDGER_DTYPE).tolist())
+        self._array = None
+
+    def to_array(self) -> np.ndarray:
+        self._load()
+        if self._array is None:
+            self._array = np.array(self._rows, dtype=LEDGER_DTYPE)
+        return self._array
+
+
+ledger = Ledger(path=LEDGER_FILE)
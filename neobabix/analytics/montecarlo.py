@@ -0,0 +1,122 @@
+from concurrent.futures import ProcessPoolExecutor
+from os import environ
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from neobabix.analytics.performance import equity_curve, max_drawdown, trade_returns
+
+MONTE_CARLO_WORKERS = environ.get('MONTE_CARLO_WORKERS', '0')
+MONTE_CARLO_CHUNK_SIZE = environ.get('MONTE_CARLO_CHUNK_SIZE', '10000')
+
+"""
+    Monte Carlo resampling of a strategy's trade sequence.
+
+    Historical trade returns are either bootstrapped (drawn with replacement) or reshuffled (same trades, different
+    order) into a (paths x trades) matrix. Each chunk of paths is evaluated with the vectorized metrics, chunks can be
+    spread over a process pool with MONTE_CARLO_WORKERS.
+
+    Sizing follows the live playbooks, either a fixed size per trade (MODAL_DUID) against an initial balance or a
+    compounding fraction of equity when no size is given. Leverage scales every return.
+"""
+
+METHODS = ('bootstrap', 'shuffle')
+
+
+def ledger_returns(ledger: np.ndarray) -> np.ndarray:
+    returns = trade_returns(ledger['entry_price'], ledger['exit_price'], ledger['side'])
+    fees = np.divide(ledger['fees'], ledger['size'], out=np.zeros(len(ledger)), where=ledger['size'] != 0)
+    return returns - fees
+
+
+def resample(returns: np.ndarray, paths: int, method: str = 'bootstrap',
+             rng: np.random.Generator = None) -> np.ndarray:
+    if method not in METHODS:
+        raise ValueError(f'Resampling method {method} is not supported')
+
+    rng = rng if rng is not None else np.random.default_rng()
+    returns = np.asarray(returns, dtype=np.float64)
+
+    if method == 'bootstrap':
+        return returns[rng.integers(0, len(returns), size=(paths, len(returns)))]
+
+    return rng.permuted(np.broadcast_to(returns, (paths, len(returns))), axis=1)
+
+
+def _simulate_chunk(returns: np.ndarray, paths: int, method: str, seed: np.random.SeedSequence, leverage: float,
+                    size: Optional[float], initial: float, ruin_level: float) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    sampled = resample(returns, paths=paths, method=method, rng=rng) * leverage
+
+    if size is None:
+        equity = equity_curve(sampled, initial=initial)
+    else:
+        equity = initial + np.cumsum(sampled * size, axis=1)
+
+    equity = np.concatenate((np.full((paths, 1), initial), equity), axis=1)
+
+    ruined = equity <= initial * ruin_level
+    ever_ruined = ruined.any(axis=1)
+    time_to_ruin = np.where(ever_ruined, ruined.argmax(axis=1), -1)
+
+    # Once ruined the account stays ruined
+    terminal = np.where(ever_ruined, np.minimum(equity[:, -1], initial * ruin_level), equity[:, -1])
+
+    return {
+        'max_drawdown': max_drawdown(np.maximum(equity, 0.0)),
+        'terminal_equity': terminal,
+        'time_to_ruin': time_to_ruin,
+    }
+
+
+def _chunks(paths: int, chunk_size: int) -> List[int]:
+    sizes = [chunk_size] * (paths // chunk_size)
+    if paths % chunk_size:
+        sizes.append(paths % chunk_size)
+    return sizes
+
+
+def simulate(returns: np.ndarray, paths: int = 10000, method: str = 'bootstrap', leverage: float = 1.0,
+             size: Optional[float] = None, initial: float = 1.0, ruin_level: float = 0.5, seed: int = None,
+             workers: int = None, chunk_size: int = None) -> Dict[str, np.ndarray]:
+    returns = np.asarray(returns, dtype=np.float64)
+    if len(returns) == 0:
+        raise ValueError('At least one trade is needed to run a simulation')
+
+    workers = int(MONTE_CARLO_WORKERS) if workers is None else workers
+    chunk_size = int(MONTE_CARLO_CHUNK_SIZE) if chunk_size is None else chunk_size
+
+    sizes = _chunks(paths, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(returns, n, method, s, leverage, size, initial, ruin_level) for n, s in zip(sizes, seeds)]
+
+    if workers and workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_chunk, *zip(*args)))
+    else:
+        results = [_simulate_chunk(*a) for a in args]
+
+    return {
+        key: np.concatenate([r.get(key) for r in results])
+        for key in ('max_drawdown', 'terminal_equity', 'time_to_ruin')
+    }
+
+
+def summarize_simulation(result: Dict[str, np.ndarray], initial: float = 1.0,
+                         percentiles: Sequence[float] = (5, 25, 50, 75, 95)) -> Dict[str, float]:
+    summary = {}
+
+    for key in ('max_drawdown', 'terminal_equity'):
+        values = np.percentile(result.get(key), percentiles)
+        summary.update({f'{key}_p{p:g}': float(v) for p, v in zip(percentiles, values)})
+
+    time_to_ruin = result.get('time_to_ruin')
+    ruined = time_to_ruin >= 0
+    summary.update({
+        'paths': int(len(time_to_ruin)),
+        'probability_of_ruin': float(ruined.mean()),
+        'median_time_to_ruin': float(np.median(time_to_ruin[ruined])) if ruined.any() else float('nan'),
+        'probability_of_loss': float((result.get('terminal_equity') < initial).mean()),
+    })
+
+    return summary
@@ -0,0 +1,149 @@
+from typing import Dict, Union
+
+import numpy as np
+
+"""
+    Vectorized performance metrics.
+
+    Every function works along the last axis, a 1D array is a single trade sequence while a 2D array holds many
+    sequences at once (parameter sweeps, Monte Carlo paths). Nothing here loops over trades in Python.
+"""
+
+ArrayLike = Union[np.ndarray, list, float]
+
+
+def trade_returns(entry_prices: ArrayLike, exit_prices: ArrayLike, sides: ArrayLike) -> np.ndarray:
+    entry_prices = np.asarray(entry_prices, dtype=np.float64)
+    exit_prices = np.asarray(exit_prices, dtype=np.float64)
+    sides = np.asarray(sides, dtype=np.float64)
+
+    return sides * (exit_prices / entry_prices - 1.0)
+
+
+def equity_curve(returns: np.ndarray, initial: float = 1.0, compound: bool = True) -> np.ndarray:
+    returns = np.asarray(returns, dtype=np.float64)
+    if compound:
+        return initial * np.cumprod(1.0 + returns, axis=-1)
+    return initial * (1.0 + np.cumsum(returns, axis=-1))
+
+
+def cumulative_pnl(pnl: np.ndarray) -> np.ndarray:
+    return np.cumsum(np.asarray(pnl, dtype=np.float64), axis=-1)
+
+
+def drawdowns(equity: np.ndarray) -> np.ndarray:
+    equity = np.asarray(equity, dtype=np.float64)
+    peaks = np.maximum.accumulate(equity, axis=-1)
+    return np.where(peaks > 0, equity / np.where(peaks > 0, peaks, 1.0) - 1.0, 0.0)
+
+
+def max_drawdown(equity: np.ndarray) -> Union[float, np.ndarray]:
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.shape[-1] == 0:
+        return np.zeros(equity.shape[:-1]) if equity.ndim > 1 else 0.0
+    return 0.0 - np.min(drawdowns(equity), axis=-1)
+
+
+def sharpe_ratio(returns: np.ndarray, periods_per_year: float = 1.0) -> Union[float, np.ndarray]:
+    returns = np.asarray(returns, dtype=np.float64)
+    std = np.std(returns, axis=-1, ddof=1) if returns.shape[-1] > 1 else np.zeros(returns.shape[:-1])
+    mean = np.mean(returns, axis=-1) if returns.shape[-1] > 0 else np.zeros(returns.shape[:-1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(std > 0, mean / np.where(std > 0, std, 1.0), 0.0) * np.sqrt(periods_per_year)
+    return ratio
+
+
+def sortino_ratio(returns: np.ndarray, periods_per_year: float = 1.0) -> Union[float, np.ndarray]:
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.shape[-1] == 0:
+        return np.zeros(returns.shape[:-1]) if returns.ndim > 1 else 0.0
+
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2, axis=-1))
+    mean = np.mean(returns, axis=-1)
+    ratio = np.where(downside > 0, mean / np.where(downside > 0, downside, 1.0), 0.0) * np.sqrt(periods_per_year)
+    return ratio
+
+
+def win_rate(returns: np.ndarray) -> Union[float, np.ndarray]:
+    returns = np.asarray(returns, dtype=np.float64)
+    if returns.shape[-1] == 0:
+        return np.zeros(returns.shape[:-1]) if returns.ndim > 1 else 0.0
+    return np.count_nonzero(returns > 0, axis=-1) / returns.shape[-1]
+
+
+def profit_factor(pnl: np.ndarray) -> Union[float, np.ndarray]:
+    pnl = np.asarray(pnl, dtype=np.float64)
+    gross_profit = np.sum(np.where(pnl > 0, pnl, 0.0), axis=-1)
+    gross_loss = -np.sum(np.where(pnl < 0, pnl, 0.0), axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(gross_loss > 0, gross_profit / np.where(gross_loss > 0, gross_loss, 1.0),
+                        np.where(gross_profit > 0, np.inf, 0.0))
+
+
+def exposure(opened_at: np.ndarray, closed_at: np.ndarray, start: float = None, end: float = None) -> float:
+    opened_at = np.asarray(opened_at, dtype=np.float64)
+    closed_at = np.asarray(closed_at, dtype=np.float64)
+    if len(opened_at) == 0:
+        return 0.0
+
+    start = float(opened_at.min()) if start is None else start
+    end = float(closed_at.max()) if end is None else end
+    if end <= start:
+        return 0.0
+
+    # Union of holding intervals, overlapping trades are only counted once
+    order = np.argsort(opened_at, kind='stable')
+    opens = np.clip(opened_at[order], start, end)
+    closes = np.clip(closed_at[order], start, end)
+    running_close = np.maximum.accumulate(closes)
+    previous_close = np.concatenate(([-np.inf], running_close[:-1]))
+    covered = np.maximum(closes - np.maximum(opens, previous_close), 0.0).sum()
+
+    return float(covered / (end - start))
+
+
+def fee_drag(pnl: np.ndarray, fees: np.ndarray) -> Union[float, np.ndarray]:
+    pnl = np.asarray(pnl, dtype=np.float64)
+    fees = np.asarray(fees, dtype=np.float64)
+    gross = np.abs(np.sum(pnl, axis=-1))
+    total_fees = np.sum(fees, axis=-1)
+    return np.where(gross > 0, total_fees / np.where(gross > 0, gross, 1.0), 0.0)
+
+
+def summarize(ledger: np.ndarray, periods_per_year: float = 1.0) -> Dict[str, float]:
+    """
+        Aggregate metrics for a ledger structured array (see neobabix.analytics.ledger.LEDGER_DTYPE).
+        PnL figures are in quote currency, net of fees.
+    """
+
+    returns = trade_returns(ledger['entry_price'], ledger['exit_price'], ledger['side'])
+    gross_pnl = returns * ledger['size']
+    net_pnl = gross_pnl - ledger['fees']
+    net_returns = np.divide(net_pnl, ledger['size'], out=np.zeros_like(net_pnl), where=ledger['size'] != 0)
+    equity = equity_curve(net_returns)
+
+    return {
+        'trades': int(len(ledger)),
+        'pnl': float(net_pnl.sum()),
+        'return': float(equity[-1] - 1.0) if len(equity) else 0.0,
+        'max_drawdown': float(max_drawdown(equity)),
+        'sharpe': float(sharpe_ratio(net_returns, periods_per_year=periods_per_year)),
+        'sortino': float(sortino_ratio(net_returns, periods_per_year=periods_per_year)),
+        'win_rate': float(win_rate(net_returns)),
+        'profit_factor': float(profit_factor(net_pnl)),
+        'exposure': exposure(ledger['opened_at'], ledger['closed_at']),
+        'fee_drag': float(fee_drag(gross_pnl, ledger['fees'])),
+    }
+
+
+def summarize_equity(equity: np.ndarray, periods_per_year: float = 1.0) -> Dict[str, float]:
+    equity = np.asarray(equity, dtype=np.float64)
+    returns = equity[1:] / equity[:-1] - 1.0
+
+    return {
+        'return': float(equity[-1] / equity[0] - 1.0) if len(equity) > 1 else 0.0,
+        'max_drawdown': float(max_drawdown(equity)),
+        'sharpe': float(sharpe_ratio(returns, periods_per_year=periods_per_year)),
+        'sortino': float(sortino_ratio(returns, periods_per_year=periods_per_year)),
+        'win_rate': float(win_rate(returns)),
+    }
@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timezone
+from logging import Logger
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from neobabix.strategies.strategy import Actions
+
+LIVE = 'live'
+SHADOW = 'shadow'
+
+"""
+    Pairs fills made by the live playbook with fills made by the shadow playbook for the same signal.
+
+    A signal is identified by the timestamp of the candle that produced it, both playbooks of a tick share the same
+    candles. Slippage is expressed in basis points, positive when the live fill was worse than the shadow fill. Latency
+    is the time between the signal and the fill, the gap is live latency minus shadow latency.
+"""
+
+
+class FillReport:
+    def __init__(self, logger: Logger, history: int = 1000):
+        self.logger = logger
+        self.history = history
+        self.pending: Dict[Tuple[int, str], Dict[str, dict]] = {}
+        self.comparisons: List[dict] = []
+
+    def record(self, source: str, signal_key: int, role: str, action: Actions, order: dict, signal_time: datetime):
+        price = order.get('average') or order.get('price')
+        if price is None:
+            return
+
+        # Entries are on the signal's side, exits and stops on the opposite side
+        side = action.value if role == 'entry' else -action.value
+        filled_at = order.get('lastTradeTimestamp') or order.get('timestamp')
+        filled_at = filled_at / 1000 if filled_at else time.time()
+
+        # Playbooks keep naive UTC datetimes
+        if signal_time.tzinfo is None:
+            signal_time = signal_time.replace(tzinfo=timezone.utc)
+
+        # Signals only one side acted on never pair up
+        if (signal_key, role) not in self.pending and len(self.pending) >= self.history:
+            self.pending.pop(next(iter(self.pending)))
+
+        fills = self.pending.setdefault((signal_key, role), {})
+        fills[source] = {
+            'price': float(price),
+            'side': side,
+            'latency': filled_at - signal_time.timestamp()
+        }
+
+        if LIVE in fills and SHADOW in fills:
+            self.compare(signal_key=signal_key,
+                         role=role,
+                         fills=self.pending.pop((signal_key, role)))
+
+    def compare(self, signal_key: int, role: str, fills: Dict[str, dict]):
+        live = fills.get(LIVE)
+        shadow = fills.get(SHADOW)
+
+        comparison = {
+            'signal': signal_key,
+            'role': role,
+            'live_price': live.get('price'),
+            'shadow_price': shadow.get('price'),
+            'slippage_bps': live.get('side') * (live.get('price') / shadow.get('price') - 1.0) * 10000.0,
+            'latency_gap': live.get('latency') - shadow.get('latency')
+        }
+        self.comparisons.append(comparison)
+        self.comparisons = self.comparisons[-self.history:]
+
+        self.logger.info(f'Shadow comparison for {role}: live {comparison.get("live_price")} vs shadow '
+                         f'{comparison.get("shadow_price")}, slippage {comparison.get("slippage_bps"):.2f} bps, '
+                         f'latency gap {comparison.get("latency_gap"):.3f}s')
+
+    def summary(self) -> Dict[str, float]:
+        if len(self.comparisons) == 0:
+            return {'fills': 0}
+
+        slippage = np.array([c.get('slippage_bps') for c in self.comparisons])
+        latency_gap = np.array([c.get('latency_gap') for c in self.comparisons])
+
+        return {
+            'fills': len(self.comparisons),
+            'slippage_bps_mean': float(slippage.mean()),
+            'slippage_bps_median': float(np.median(slippage)),
+            'slippage_bps_p95': float(np.percentile(slippage, 95)),
+            'latency_gap_mean': float(latency_gap.mean()),
+            'latency_gap_p95': float(np.percentile(latency_gap, 95)),
+        }
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from os import environ
+from typing import Dict, Optional, Tuple
+
+from ccxt.base.exchange import Exchange
+
+from neobabix.execution.orders import run_sync
+
+ACCOUNT_CACHE_REFRESH = environ.get('ACCOUNT_CACHE_REFRESH', '300')
+
+"""
+    Per account cache of leverage and position settings.
+
+    The whole settings payload of an account (leverage, and position or margin mode when the exchange reports them) is
+    fetched in one request and kept per symbol. It is refreshed once it gets older than ACCOUNT_CACHE_REFRESH seconds
+    and updated in place whenever we write a setting, so reading a setting only hits the network after a refresh
+    interval. Concurrent refreshes of the same account share a single request.
+"""
+
+
+def account_key(exchange: Exchange) -> Tuple[str, str]:
+    return exchange.id, getattr(exchange, 'apiKey', None) or str(id(exchange))
+
+
+class AccountState:
+    def __init__(self, settings: Dict[str, dict]):
+        self.settings = settings
+        self.refreshed_at = time.monotonic()
+
+    def get(self, market_id: str, name: str):
+        return self.settings.get(market_id, {}).get(name)
+
+    def update(self, market_id: str, name: str, value):
+        self.settings.setdefault(market_id, {})[name] = value
+
+
+class AccountCache:
+    def __init__(self, refresh: float = float(ACCOUNT_CACHE_REFRESH)):
+        self.refresh = refresh
+        self.states: Dict[Tuple[str, str], AccountState] = {}
+        self.inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def fresh_state(self, exchange: Exchange) -> Optional[AccountState]:
+        state = self.states.get(account_key(exchange))
+        if state is None or time.monotonic() - state.refreshed_at > self.refresh:
+            return None
+        return state
+
+    async def state(self, exchange: Exchange, get_name: str) -> AccountState:
+        state = self.fresh_state(exchange)
+        if state is not None:
+            self.hits += 1
+            return state
+
+        self.misses += 1
+        key = account_key(exchange)
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The caller fetching it was cancelled, not this one, fetch it here instead
+                return await self.state(exchange=exchange,
+                                        get_name=get_name)
+
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[key] = future
+        try:
+            response = await run_sync(getattr(exchange, get_name))
+            state = AccountState(settings=dict(response.get('result') or {}))
+            self.states[key] = state
+            future.set_result(state)
+        except Exception as exc:
+            future.set_exception(exc)
+            # Nobody else may be waiting, do not let the future log an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+            # Cancelled while fetching, callers waiting on this fetch must not wait forever
+            if not future.done():
+                future.cancel()
+
+        return state
+
+    async def get(self, exchange: Exchange, get_name: str, market_id: str, name: str):
+        state = await self.state(exchange=exchange,
+                                 get_name=get_name)
+        return state.get(market_id=market_id,
+                         name=name)
+
+    def update(self, exchange: Exchange, market_id: str, name: str, value):
+        state = self.states.get(account_key(exchange))
+        if state is not None:
+            state.update(market_id=market_id,
+                         name=name,
+                         value=value)
+
+    def invalidate(self, exchange: Exchange):
+        self.states.pop(account_key(exchange), None)
+
+    def stats(self) -> Dict[str, float]:
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0
+        }
+
+
+account_cache = AccountCache()
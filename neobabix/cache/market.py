@@ -0,0 +1,109 @@
+import asyncio
+import time
+from os import environ
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from ccxt.base.exchange import Exchange
+
+from neobabix.execution.orders import run_sync
+
+MARKET_CACHE_TTL = environ.get('MARKET_CACHE_TTL', '1')
+
+"""
+    Short lived cache for public market data shared by every playbook of the process.
+
+    Tickers and latest candles are kept for MARKET_CACHE_TTL seconds per exchange, symbol and timeframe, other data
+    like order books can be kept for their own TTL. Callers asking for the same data while a request is in flight wait
+    for that request instead of sending their own. Hits, misses and coalesced callers are counted to see how much
+    traffic the cache saves.
+"""
+
+
+def market_key(exchange: Exchange, *args) -> Tuple:
+    # Testnet and mainnet clients of the same exchange do not share data
+    return (exchange.id, str(exchange.urls.get('api'))) + args
+
+
+class MarketDataCache:
+    def __init__(self, ttl: float = float(MARKET_CACHE_TTL)):
+        self.ttl = ttl
+        self.entries: Dict[Tuple, Tuple[float, Any]] = {}
+        self.inflight: Dict[Tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_fetch(self, key: Tuple, fetch: Callable[[], Awaitable], ttl: float = None) -> Tuple[Any, bool]:
+        """
+            Returns the value and whether it was fetched by this call.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= ttl:
+            self.hits += 1
+            return entry[1], False
+
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight), False
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The caller fetching it was cancelled, not this one, fetch it here instead
+                return await self.get_or_fetch(key=key,
+                                               fetch=fetch,
+                                               ttl=ttl)
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await fetch()
+            self.entries[key] = (time.monotonic(), value)
+            future.set_result(value)
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+            # Cancelled while fetching, callers waiting on this fetch must not wait forever
+            if not future.done():
+                future.cancel()
+
+        return value, True
+
+    async def ticker(self, exchange: Exchange, symbol: str) -> Tuple[dict, bool]:
+        return await self.get_or_fetch(key=market_key(exchange, 'ticker', symbol),
+                                       fetch=lambda: run_sync(exchange.fetch_ticker, symbol=symbol))
+
+    async def latest_candle(self, exchange: Exchange, symbol: str, timeframe: str) -> Tuple[list, bool]:
+        candles, fetched = await self.get_or_fetch(key=market_key(exchange, 'candle', symbol, timeframe),
+                                                   fetch=lambda: run_sync(exchange.fetch_ohlcv,
+                                                                          symbol=symbol,
+                                                                          timeframe=timeframe,
+                                                                          limit=1))
+        return candles[0], fetched
+
+    async def order_book(self, exchange: Exchange, symbol: str, limit: int, ttl: float,
+                         fetch: Callable[[], Awaitable] = None) -> Tuple[dict, bool]:
+        # Snapshots are shared per depth, callers with their own rate limiting bring their own fetch
+        return await self.get_or_fetch(key=market_key(exchange, 'book', symbol, limit),
+                                       fetch=fetch or (lambda: run_sync(exchange.fetch_order_book,
+                                                                        symbol=symbol,
+                                                                        limit=limit)),
+                                       ttl=ttl)
+
+    def stats(self) -> Dict[str, float]:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / requests if requests else 0.0
+        }
+
+
+market_cache = MarketDataCache()
@@ -0,0 +1,172 @@
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import sys
+from os import environ
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+SIGNAL_CACHE_DIR = environ.get('SIGNAL_CACHE_DIR', '.cache/signals')
+SIGNAL_CACHE_MAX_BYTES = environ.get('SIGNAL_CACHE_MAX_BYTES', str(1024 ** 3))
+
+PACKAGE = __name__.split('.')[0]
+
+"""
+    Content addressed on disk cache for strategy signals and indicator outputs.
+
+    An entry is keyed by the source code of the module computing it and of the neobabix modules that module imports,
+    its parameters and a fingerprint of the candles it was computed from. Changing any of the three yields a new key,
+    stale entries are never read, they simply age out of the least recently used eviction once the cache grows past
+    SIGNAL_CACHE_MAX_BYTES.
+
+    Arrays are stored as .npy files and read back memory mapped, so large signal arrays are not copied into memory
+    until they are actually used.
+"""
+
+_code_versions: Dict[Any, str] = {}
+
+
+def imported_modules(module: ModuleType) -> List[ModuleType]:
+    # Modules of this package imported by the module, indicators behind a strategy for instance
+    names = []
+    for node in ast.walk(ast.parse(inspect.getsource(module))):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = importlib.util.resolve_name('.' * node.level + (node.module or ''), module.__package__) \
+                if node.level else node.module
+            # Imported names can be submodules as well as attributes
+            names.append(base)
+            names.extend(f'{base}.{alias.name}' for alias in node.names)
+
+    return [sys.modules[name] for name in names if name.split('.')[0] == PACKAGE and name in sys.modules]
+
+
+def code_version(obj: Any) -> str:
+    if obj not in _code_versions:
+        digest = hashlib.sha256()
+        module = inspect.getmodule(obj)
+        if module is None:
+            digest.update(inspect.getsource(obj).encode('utf-8'))
+        else:
+            # The module and everything of this package it imports, transitively, a change to any of them is a
+            # change to what the cached arrays were computed with
+            modules = {module.__name__: module}
+            pending = [module]
+            while pending:
+                for imported in imported_modules(pending.pop()):
+                    if imported.__name__ not in modules:
+                        modules[imported.__name__] = imported
+                        pending.append(imported)
+
+            for name in sorted(modules):
+                digest.update(name.encode('utf-8'))
+                digest.update(inspect.getsource(modules[name]).encode('utf-8'))
+
+        _code_versions[obj] = digest.hexdigest()
+
+    return _code_versions.get(obj)
+
+
+def candles_fingerprint(ohlcv: Dict[str, np.ndarray]) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(ohlcv.keys()):
+        values = np.ascontiguousarray(ohlcv.get(name))
+        digest.update(name.encode('utf-8'))
+        digest.update(str(values.dtype).encode('utf-8'))
+        digest.update(str(values.shape).encode('utf-8'))
+        digest.update(values.tobytes())
+
+    return digest.hexdigest()
+
+
+def cache_key(obj: Any, ohlcv: Dict[str, np.ndarray], params: dict = None) -> str:
+    digest = hashlib.sha256()
+    digest.update(f'{obj.__module__}.{obj.__qualname__}'.encode('utf-8'))
+    digest.update(code_version(obj).encode('utf-8'))
+    digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(candles_fingerprint(ohlcv).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+class SignalCache:
+    def __init__(self, directory: str = SIGNAL_CACHE_DIR, max_bytes: int = int(SIGNAL_CACHE_MAX_BYTES)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.npy')
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self.path(key)
+
+        try:
+            array = np.load(path, mmap_mode='r', allow_pickle=False)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+
+        # Access time is unreliable on noatime mounts, the modification time tracks recency instead
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return array
+
+    def put(self, key: str, array: np.ndarray) -> np.ndarray:
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self.path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(array), allow_pickle=False)
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+        return array
+
+    def get_or_compute(self, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        array = self.get(key)
+        if array is not None:
+            return array
+
+        return self.put(key, compute())
+
+    def cached(self, obj: Any, ohlcv: Dict[str, np.ndarray], compute: Callable[[], np.ndarray],
+               params: dict = None) -> np.ndarray:
+        return self.get_or_compute(key=cache_key(obj=obj, ohlcv=ohlcv, params=params),
+                                   compute=compute)
+
+    def evict(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.npy')]
+        except FileNotFoundError:
+            return
+
+        stats = [(stat.st_mtime, stat.st_size, entry.path) for entry, stat in ((e, e.stat()) for e in entries)]
+        total = sum(size for _, size, _ in stats)
+
+        for _, size, path in sorted(stats):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+signal_cache = SignalCache()
@@ -1,2 +1 @@
 USER_AGENT = 'NeoBabix'
-BETWEEN_ORDERS_SLEEP = 10
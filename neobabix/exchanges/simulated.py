@@ -0,0 +1,440 @@
+import itertools
+import time
+from collections import deque
+from os import environ
+from typing import Deque, Dict, List, Optional, Tuple
+
+import ccxt
+import numpy as np
+from ccxt.base.exchange import Exchange
+
+SIMULATED_BALANCE = environ.get('SIMULATED_BALANCE', '1000000')
+SIMULATED_PRICE_HISTORY = environ.get('SIMULATED_PRICE_HISTORY', '1000')
+SIMULATED_BOOK_LEVELS = environ.get('SIMULATED_BOOK_LEVELS', '20')
+SIMULATED_BOOK_STEP_BPS = environ.get('SIMULATED_BOOK_STEP_BPS', '1')
+SIMULATED_BOOK_LEVEL_AMOUNT = environ.get('SIMULATED_BOOK_LEVEL_AMOUNT', '1000')
+
+"""
+    Simulated exchange fed by the live process' market data.
+
+    The MarketFeed is filled by whatever the live process already fetched: candles on every tick, tickers and candles
+    fetched by playbooks, order books and the prices of live fills. A SimulatedExchange never calls the exchange for
+    market data, it only reads the feed. Markets are shared too, they are taken from the feed when a live playbook has
+    fetched them and only fetched once through the live client otherwise.
+
+    A SimulatedExchange holds no credentials and refuses any HTTP request, a ccxt method it does not simulate raises
+    NotSupported rather than reaching the exchange.
+
+    Orders are filled against price observations made after the order was created:
+        - Market orders fill at the last observed price
+        - Limit orders fill at their price once an observation crosses it
+        - Stop orders trigger once an observation crosses the stop price and then fill at their limit price
+
+    Order books are the last ones observed. Without any, a synthetic book of SIMULATED_BOOK_LEVELS levels spaced by
+    SIMULATED_BOOK_STEP_BPS around the last price is returned, each level holding SIMULATED_BOOK_LEVEL_AMOUNT.
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class MarketFeed:
+    def __init__(self, history: int = int(SIMULATED_PRICE_HISTORY)):
+        self.history = history
+        self.markets: Dict[str, List[dict]] = {}
+        self.candles: Dict[str, List[list]] = {}
+        self.tickers: Dict[str, dict] = {}
+        self.order_books: Dict[str, dict] = {}
+
+        # (sequence, low, high, last), the sequence orders observations against order creation
+        self.prices: Dict[str, Deque[Tuple[int, float, float, float]]] = {}
+        self.sequence = 0
+
+    def observe(self, symbol: str, low: float, high: float, last: float):
+        self.sequence += 1
+        prices = self.prices.setdefault(symbol, deque(maxlen=self.history))
+        prices.append((self.sequence, float(low), float(high), float(last)))
+
+    def update_markets(self, exchange_id: str, markets: List[dict]):
+        self.markets[exchange_id] = markets
+
+    def update_candles(self, symbol: str, ohlcv: Dict[str, np.ndarray]):
+        columns = [ohlcv.get(name) for name in ('timestamps', 'opens', 'highs', 'lows', 'closes', 'volumes')]
+        if any(column is None or len(column) == 0 for column in columns):
+            return
+
+        self.candles[symbol] = np.column_stack(columns).tolist()
+        self.observe(symbol=symbol,
+                     low=ohlcv.get('lows')[-1],
+                     high=ohlcv.get('highs')[-1],
+                     last=ohlcv.get('closes')[-1])
+
+    def update_candle(self, symbol: str, candle: list):
+        self.observe(symbol=symbol,
+                     low=candle[3],
+                     high=candle[2],
+                     last=candle[4])
+
+    def update_ticker(self, symbol: str, ticker: dict):
+        self.tickers[symbol] = ticker
+
+        last = ticker.get('last') or ticker.get('close')
+        if last is None:
+            return
+
+        self.observe(symbol=symbol,
+                     low=last,
+                     high=last,
+                     last=last)
+
+    def update_order_book(self, symbol: str, order_book: dict):
+        self.order_books[symbol] = order_book
+
+    def update_trade(self, symbol: str, price: float):
+        if price is None:
+            return
+
+        self.observe(symbol=symbol,
+                     low=price,
+                     high=price,
+                     last=price)
+
+    def last_price(self, symbol: str) -> Optional[float]:
+        prices = self.prices.get(symbol)
+        if not prices:
+            return None
+        return prices[-1][3]
+
+    def price_range_since(self, symbol: str, sequence: int) -> Optional[Tuple[float, float]]:
+        observations = [p for p in self.prices.get(symbol, []) if p[0] > sequence]
+        if len(observations) == 0:
+            return None
+
+        return min(p[1] for p in observations), max(p[2] for p in observations)
+
+
+market_feed = MarketFeed()
+
+
+class SimulatedExchange(Exchange):
+    def __init__(self, live: Exchange = None, feed: MarketFeed = market_feed, balance: float = None):
+        super().__init__({})
+
+        self.live = live
+        self.feed = feed
+        self.apiKey = ''
+        self.secret = ''
+        self.has = dict(self.has, createMarketOrder=True, fetchOHLCV=True, fetchTicker=True, fetchOrder=True,
+                        fetchOpenOrders=True, fetchClosedOrders=True, cancelOrder=True,
+                        fetchOrderBook=True)
+        if live is not None:
+            self.id = live.id
+            self.precisionMode = live.precisionMode
+
+        self.balance = float(SIMULATED_BALANCE) if balance is None else balance
+        self.leverages: Dict[str, int] = {}
+        self.orders: Dict[str, dict] = {}
+        self._ids = itertools.count(1)
+
+    def fetch(self, url, method='GET', headers=None, body=None):
+        raise ccxt.NotSupported(f'The simulated exchange does not send requests, {method} {url} was not simulated')
+
+    # Market data, read from the feed only
+
+    def fetch_markets(self, params={}):
+        markets = self.feed.markets.get(self.id)
+        if markets is None:
+            if self.live is None:
+                raise ccxt.ExchangeError('No markets have been observed for the simulated exchange')
+            markets = self.live.fetch_markets()
+            self.feed.update_markets(exchange_id=self.id, markets=markets)
+
+        return markets
+
+    def fetch_currencies(self, params={}):
+        # Derived from the markets by ccxt
+        return None
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        candles = self.feed.candles.get(symbol, [])
+        return candles[-limit:] if limit else candles
+
+    def fetch_ticker(self, symbol, params={}):
+        ticker = self.feed.tickers.get(symbol)
+        if ticker is not None:
+            return ticker
+
+        last = self._last_price(symbol)
+        return {
+            'symbol': symbol,
+            'timestamp': _now_ms(),
+            'last': last,
+            'close': last,
+            'bid': last,
+            'ask': last
+        }
+
+    def fetch_order_book(self, symbol, limit=None, params={}):
+        order_book = self.feed.order_books.get(symbol)
+        if order_book is None:
+            last = self._last_price(symbol)
+            levels = int(SIMULATED_BOOK_LEVELS)
+            step = last * float(SIMULATED_BOOK_STEP_BPS) / 10000.0
+            amount = float(SIMULATED_BOOK_LEVEL_AMOUNT)
+            order_book = {
+                'symbol': symbol,
+                'bids': [[last - step * (i + 1), amount] for i in range(levels)],
+                'asks': [[last + step * (i + 1), amount] for i in range(levels)],
+                'timestamp': _now_ms(),
+                'nonce': None
+            }
+
+        if limit:
+            return dict(order_book, bids=order_book.get('bids')[:limit], asks=order_book.get('asks')[:limit])
+        return order_book
+
+    def fetch_free_balance(self, params={}):
+        quotes = set(symbol.split('/')[1] for symbol in self.feed.prices.keys() if '/' in symbol)
+        return {quote.upper(): self.balance for quote in quotes}
+
+    # Orders
+
+    def _last_price(self, symbol: str) -> float:
+        price = self.feed.last_price(symbol)
+        if price is None:
+            raise ccxt.ExchangeError(f'No price has been observed for {symbol}')
+        return price
+
+    def _symbol_from_id(self, market_id: str) -> str:
+        for symbol in self.feed.prices.keys():
+            if symbol.replace('/', '') == market_id:
+                return symbol
+        return market_id
+
+    def _new_order(self, symbol: str, type: str, side: str, amount, price=None, stop_price=None,
+                   params: dict = None) -> dict:
+        timestamp = _now_ms()
+        order = {
+            'id': str(next(self._ids)),
+            'clientOrderId': (params or {}).get('clientOrderId'),
+            'timestamp': timestamp,
+            'datetime': self.iso8601(timestamp),
+            'lastTradeTimestamp': None,
+            'symbol': symbol,
+            'type': type,
+            'side': side,
+            'price': float(price) if price is not None else None,
+            'stopPrice': float(stop_price) if stop_price is not None else None,
+            'amount': float(amount),
+            'filled': 0.0,
+            'remaining': float(amount),
+            'average': None,
+            'cost': 0.0,
+            'status': 'open',
+            'fee': None,
+            'trades': [],
+            'info': {'simulated': True, 'sequence': self.feed.sequence}
+        }
+        self.orders[order.get('id')] = order
+
+        return order
+
+    def _fill(self, order: dict, price: float):
+        order.update({
+            'status': 'closed',
+            'price': price if order.get('price') is None else order.get('price'),
+            'average': price,
+            'filled': order.get('amount'),
+            'remaining': 0.0,
+            'cost': price * order.get('amount'),
+            'lastTradeTimestamp': _now_ms()
+        })
+
+    def _evaluate(self, order: dict):
+        if order.get('status') != 'open':
+            return
+
+        price_range = self.feed.price_range_since(symbol=order.get('symbol'),
+                                                  sequence=order.get('info').get('sequence'))
+        if price_range is None:
+            return
+        low, high = price_range
+
+        is_buy = order.get('side') == 'buy'
+        stop_price = order.get('stopPrice')
+        if stop_price is not None and not order.get('info').get('triggered'):
+            triggered = high >= stop_price if is_buy else low <= stop_price
+            if not triggered:
+                return
+
+            # Once triggered the limit leg only sees the current price and whatever comes after it
+            order.get('info').update({'triggered': True, 'sequence': self.feed.sequence})
+            low = high = self.feed.last_price(order.get('symbol'))
+
+        price = order.get('price')
+        crossed = low <= price if is_buy else high >= price
+        if crossed:
+            self._fill(order=order, price=price)
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        order = self._new_order(symbol=symbol,
+                                type=type,
+                                side=side,
+                                amount=amount,
+                                price=price,
+                                params=params)
+
+        if type == 'market':
+            self._fill(order=order, price=self._last_price(symbol))
+        else:
+            # Marketable limit orders fill right away
+            last = self._last_price(symbol)
+            if (side == 'buy' and last <= order.get('price')) or (side == 'sell' and last >= order.get('price')):
+                self._fill(order=order, price=order.get('price'))
+
+        return dict(order)
+
+    def create_market_buy_order(self, symbol, amount, params={}):
+        return self.create_order(symbol=symbol, type='market', side='buy', amount=amount, params=params)
+
+    def create_market_sell_order(self, symbol, amount, params={}):
+        return self.create_order(symbol=symbol, type='market', side='sell', amount=amount, params=params)
+
+    def create_limit_buy_order(self, symbol, amount, price, params={}):
+        return self.create_order(symbol=symbol, type='limit', side='buy', amount=amount, price=price, params=params)
+
+    def create_limit_sell_order(self, symbol, amount, price, params={}):
+        return self.create_order(symbol=symbol, type='limit', side='sell', amount=amount, price=price, params=params)
+
+    def fetch_order(self, id, symbol=None, params={}):
+        order = self.orders.get(str(id))
+        if order is None:
+            raise ccxt.OrderNotFound(f'Order {id} does not exist')
+
+        self._evaluate(order)
+        return dict(order)
+
+    def _orders_with_status(self, symbol: Optional[str], status: str) -> List[dict]:
+        orders = []
+        for order in self.orders.values():
+            if symbol is not None and order.get('symbol') != symbol:
+                continue
+            self._evaluate(order)
+            if order.get('status') == status:
+                orders.append(dict(order))
+
+        return orders
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self._orders_with_status(symbol=symbol, status='open')
+
+    def fetch_closed_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self._orders_with_status(symbol=symbol, status='closed')
+
+    def cancel_order(self, id, symbol=None, params={}):
+        order = self.orders.get(str(id))
+        if order is None:
+            raise ccxt.OrderNotFound(f'Order {id} does not exist')
+
+        self._evaluate(order)
+        if order.get('status') == 'open':
+            order.update({'status': 'canceled'})
+
+        return dict(order)
+
+    # Bybit endpoints used by playbooks
+
+    def userGetLeverage(self, params={}):
+        market_ids = [symbol.replace('/', '') for symbol in self.feed.prices.keys()]
+        return {
+            'ret_code': 0,
+            'ret_msg': 'ok',
+            'result': {market_id: {'leverage': self.leverages.get(market_id, 1)} for market_id in market_ids}
+        }
+
+    def userPostLeverageSave(self, params={}):
+        self.leverages[params.get('symbol')] = params.get('leverage')
+        return {
+            'ret_code': 0,
+            'ret_msg': 'ok',
+            'result': params.get('leverage')
+        }
+
+    def openapiPostStopOrderCreate(self, params={}):
+        order = self._new_order(symbol=self._symbol_from_id(params.get('symbol')),
+                                type='limit',
+                                side=params.get('side').lower(),
+                                amount=params.get('qty'),
+                                price=params.get('price'),
+                                stop_price=params.get('stop_px'),
+                                params={'clientOrderId': params.get('order_link_id')})
+
+        return {
+            'ret_code': 0,
+            'ret_msg': 'ok',
+            'result': {
+                'stop_order_id': order.get('id'),
+                'price': order.get('price')
+            }
+        }
+
+    def v2PrivateGetStopOrder(self, params={}):
+        for order in self.orders.values():
+            if order.get('clientOrderId') and order.get('clientOrderId') == params.get('order_link_id'):
+                self._evaluate(order)
+                return {
+                    'ret_code': 0,
+                    'ret_msg': 'ok',
+                    'result': {
+                        'stop_order_id': order.get('id'),
+                        'order_link_id': order.get('clientOrderId'),
+                        'price': order.get('price')
+                    }
+                }
+
+        raise ccxt.OrderNotFound(f'Order {params.get("order_link_id")} does not exist')
+
+    def v2PrivateGetStopOrderList(self, params={}):
+        symbol = self._symbol_from_id(params.get('symbol'))
+        data = []
+        for order in self.orders.values():
+            if order.get('symbol') != symbol or order.get('stopPrice') is None:
+                continue
+            self._evaluate(order)
+            if order.get('status') == 'open' and not order.get('info').get('triggered'):
+                data.append({
+                    'stop_order_id': order.get('id'),
+                    'order_link_id': order.get('clientOrderId') or '',
+                    'stop_order_status': 'Untriggered',
+                    'price': order.get('price'),
+                    'stop_px': order.get('stopPrice')
+                })
+
+        return {
+            'ret_code': 0,
+            'ret_msg': 'ok',
+            'result': {
+                'data': data
+            }
+        }
+
+    def openapiPostStopOrderCancel(self, params={}):
+        order = self.cancel_order(id=params.get('stop_order_id'))
+        return {
+            'ret_code': 0,
+            'ret_msg': 'ok',
+            'result': {
+                'stop_order_id': order.get('id')
+            }
+        }
+
+
+def simulated_exchange(live: Exchange = None, feed: MarketFeed = market_feed) -> SimulatedExchange:
+    if live is None:
+        return SimulatedExchange(feed=feed)
+
+    # Subclass the live exchange class so exchange specific code paths in playbooks are taken in simulation too
+    simulated_type = type(f'Simulated{type(live).__name__}', (SimulatedExchange, type(live)), {})
+
+    return simulated_type(live=live, feed=feed)
@@ -0,0 +1,301 @@
+import asyncio
+import time
+from decimal import Decimal
+from logging import Logger
+from os import environ
+from typing import Dict, List, Optional, Type
+
+from ccxt.base.exchange import Exchange
+
+from neobabix.cache.market import market_cache
+from neobabix.exchanges.simulated import SimulatedExchange, market_feed
+from neobabix.execution.orders import run_sync
+from neobabix.execution.sizing import OrderSizer
+from neobabix.execution.slippage import ORDER_BOOK_TTL, SLIPPAGE_BOOK_DEPTH, book_levels
+from neobabix.execution.watcher import get_order_watcher
+
+EXECUTION_ALGORITHM = environ.get('EXECUTION_ALGORITHM', 'market')
+EXECUTION_SLICES = environ.get('EXECUTION_SLICES', '5')
+EXECUTION_DURATION = environ.get('EXECUTION_DURATION', '60')
+EXECUTION_CONCURRENCY = environ.get('EXECUTION_CONCURRENCY', '2')
+EXECUTION_CHILD_TIMEOUT = environ.get('EXECUTION_CHILD_TIMEOUT', '30')
+
+"""
+    Execution algorithms for orders playbooks would otherwise send as one market order.
+
+        - market: a single market order, the default
+        - twap: EXECUTION_SLICES market orders spread evenly over EXECUTION_DURATION seconds
+        - iceberg: limit orders at the touch showing one slice at a time, re-priced when a slice is not filled within
+          EXECUTION_CHILD_TIMEOUT seconds
+        - book: limit orders at the price levels of an order book snapshot, one level at a time from the best one, as
+          many levels as needed to cover the amount
+
+    Child orders run up to EXECUTION_CONCURRENCY at a time and never faster than the exchange rate limit. Every
+    algorithm ends with the whole amount filled, whatever limit orders leave unfilled is sent as a market order. The
+    result is a single order dict averaging its children, with the arrival price and the slippage against it in info.
+"""
+
+
+class ExecutionAlgorithm:
+    name = 'market'
+
+    def __init__(self, exchange: Exchange, symbol: str, sizer: OrderSizer, logger: Logger,
+                 slices: int = int(EXECUTION_SLICES), duration: float = float(EXECUTION_DURATION),
+                 concurrency: int = int(EXECUTION_CONCURRENCY), child_timeout: float = float(EXECUTION_CHILD_TIMEOUT)):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.sizer = sizer
+        self.logger = logger
+        self.slices = max(slices, 1)
+        self.duration = duration
+        self.child_timeout = child_timeout
+
+        self.semaphore = asyncio.Semaphore(max(concurrency, 1))
+        self.spacing = (getattr(exchange, 'rateLimit', 0) or 0) / 1000
+        self.last_request = 0.0
+        self.request_lock = asyncio.Lock()
+
+    async def request(self, fn, *args, **kwargs):
+        async with self.semaphore:
+            async with self.request_lock:
+                wait = self.last_request + self.spacing - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.last_request = time.monotonic()
+
+            return await run_sync(fn, *args, **kwargs)
+
+    async def ticker(self) -> dict:
+        if isinstance(self.exchange, SimulatedExchange):
+            return self.exchange.fetch_ticker(symbol=self.symbol)
+
+        ticker, _ = await market_cache.ticker(exchange=self.exchange,
+                                              symbol=self.symbol)
+        return ticker
+
+    async def arrival_price(self, side: str) -> Optional[float]:
+        # What crossing the spread would have cost when the order arrived
+        ticker = await self.ticker()
+        price = ticker.get('ask') if side == 'buy' else ticker.get('bid')
+        return price or ticker.get('last')
+
+    async def touch_price(self, side: str) -> Optional[float]:
+        ticker = await self.ticker()
+        price = ticker.get('bid') if side == 'buy' else ticker.get('ask')
+        return price or ticker.get('last')
+
+    def split(self, amount: Decimal, parts: int) -> List[Decimal]:
+        # Slices below the market minimum are merged, the last slice takes the rounding remainder
+        parts = max(min(parts, int(amount / self.sizer.min_amount) if self.sizer.min_amount else parts), 1)
+        child = self.sizer.amount(amount / parts)
+        if child <= 0:
+            return [amount]
+
+        amounts = [child] * (parts - 1)
+        amounts.append(amount - child * (parts - 1))
+        return amounts
+
+    async def market(self, side: str, amount: Decimal) -> dict:
+        return await self.request(self.exchange.create_order,
+                                  symbol=self.symbol,
+                                  type='market',
+                                  side=side,
+                                  amount=float(amount))
+
+    async def limit(self, side: str, amount: Decimal, price: Decimal) -> dict:
+        order = await self.request(self.exchange.create_order,
+                                   symbol=self.symbol,
+                                   type='limit',
+                                   side=side,
+                                   amount=float(amount),
+                                   price=float(price))
+        if order.get('status') == 'closed':
+            return order
+
+        # Wait for the fill through the shared order watcher, then give up on what is left
+        watcher = get_order_watcher(exchange=self.exchange,
+                                    logger=self.logger)
+        try:
+            orders = await asyncio.wait_for(watcher.wait_any(symbol=self.symbol, orders=[order]),
+                                            timeout=self.child_timeout)
+            return orders.get(str(order.get('id')))
+        except asyncio.TimeoutError:
+            await self.request(self.exchange.cancel_order, id=order.get('id'), symbol=self.symbol)
+            return await self.request(self.exchange.fetch_order, id=order.get('id'), symbol=self.symbol)
+
+    async def children(self, side: str, amount: Decimal) -> List[dict]:
+        return [await self.market(side=side, amount=amount)]
+
+    async def complete(self, side: str, amount: Decimal, children: List[dict]) -> List[dict]:
+        remaining = amount - sum(Decimal(str(filled_amount(child))) for child in children)
+        remaining = self.sizer.amount(remaining)
+        if remaining > 0:
+            self.logger.info(f'{self.name}: sending the remaining {remaining} as a market order')
+            children.append(await self.market(side=side, amount=remaining))
+        return children
+
+    async def execute(self, side: str, amount) -> dict:
+        amount = self.sizer.amount(amount)
+        started_at = time.time()
+        arrival = await self.arrival_price(side=side)
+
+        children = await self.children(side=side, amount=amount)
+        children = await self.complete(side=side, amount=amount, children=children)
+
+        order = aggregate(symbol=self.symbol,
+                          side=side,
+                          algorithm=self.name,
+                          children=children,
+                          arrival=arrival,
+                          started_at=started_at)
+        self.logger.info(f'{self.name}: {len(children)} child orders filled {order.get("filled")} at '
+                         f'{order.get("average")}, arrival {arrival}, slippage '
+                         f'{order.get("info").get("slippage_bps")} bps')
+
+        return order
+
+
+class TWAP(ExecutionAlgorithm):
+    name = 'twap'
+
+    async def children(self, side: str, amount: Decimal) -> List[dict]:
+        amounts = self.split(amount=amount, parts=self.slices)
+        interval = self.duration / len(amounts)
+
+        async def child(index: int, child_amount: Decimal):
+            await asyncio.sleep(index * interval)
+            return await self.market(side=side, amount=child_amount)
+
+        return list(await asyncio.gather(*[child(i, a) for i, a in enumerate(amounts)]))
+
+
+class Iceberg(ExecutionAlgorithm):
+    name = 'iceberg'
+
+    async def children(self, side: str, amount: Decimal) -> List[dict]:
+        children = []
+        remaining = amount
+        clip = self.split(amount=amount, parts=self.slices)[0]
+
+        # Give up on resting orders after as many attempts as there are slices, twice
+        for _ in range(self.slices * 2):
+            if remaining <= 0:
+                break
+
+            touch = await self.touch_price(side=side)
+            child = await self.limit(side=side,
+                                     amount=min(clip, remaining),
+                                     price=self.sizer.price(touch))
+            children.append(child)
+            remaining = self.sizer.amount(remaining - Decimal(str(filled_amount(child))))
+
+        return children
+
+
+class BookSlicing(ExecutionAlgorithm):
+    name = 'book'
+
+    async def order_book(self) -> dict:
+        depth = int(SLIPPAGE_BOOK_DEPTH)
+        if isinstance(self.exchange, SimulatedExchange):
+            return self.exchange.fetch_order_book(symbol=self.symbol, limit=depth)
+
+        # The snapshot the slippage guard took, when it has just taken one, fetched within the rate limit otherwise
+        order_book, fetched = await market_cache.order_book(exchange=self.exchange,
+                                                            symbol=self.symbol,
+                                                            limit=depth,
+                                                            ttl=float(ORDER_BOOK_TTL),
+                                                            fetch=lambda: self.request(self.exchange.fetch_order_book,
+                                                                                       symbol=self.symbol,
+                                                                                       limit=depth))
+        if fetched:
+            market_feed.update_order_book(symbol=self.symbol,
+                                          order_book=order_book)
+
+        return order_book
+
+    async def children(self, side: str, amount: Decimal) -> List[dict]:
+        book = await self.order_book()
+        levels = book_levels(book.get('asks') if side == 'buy' else book.get('bids'))
+
+        # A deeper level's order is marketable and would sweep the shallower levels, so one level at a time, each child
+        # sent once the previous one is done
+        children = []
+        remaining = amount
+        for price, size in levels:
+            if remaining <= 0:
+                break
+            child_amount = self.sizer.amount(min(Decimal(str(float(size))), remaining))
+            if child_amount <= 0 or child_amount < self.sizer.min_amount:
+                continue
+            child = await self.limit(side=side,
+                                     amount=child_amount,
+                                     price=self.sizer.price(float(price)))
+            children.append(child)
+            remaining = self.sizer.amount(remaining - Decimal(str(filled_amount(child))))
+
+        return children
+
+
+def filled_amount(order: dict) -> float:
+    filled = order.get('filled')
+    if filled is None:
+        # Market orders may come back without fill details, they are filled by definition
+        filled = order.get('amount') if order.get('type') == 'market' else 0
+    return float(filled or 0)
+
+
+def aggregate(symbol: str, side: str, algorithm: str, children: List[dict], arrival: Optional[float],
+              started_at: float) -> dict:
+    filled = 0.0
+    cost = 0.0
+    priced = 0.0
+    for child in children:
+        amount = filled_amount(child)
+        price = child.get('average') or child.get('price')
+        filled += amount
+        if price is not None and amount > 0:
+            priced += amount
+            cost += amount * float(price)
+
+    average = cost / priced if priced > 0 else arrival
+    slippage_bps = None
+    if average is not None and arrival:
+        direction = 1 if side == 'buy' else -1
+        slippage_bps = round(direction * (average / arrival - 1.0) * 10000.0, 2)
+
+    return {
+        'id': ','.join(str(child.get('id')) for child in children),
+        'symbol': symbol,
+        'type': algorithm,
+        'side': side,
+        'price': average,
+        'average': average,
+        'amount': filled,
+        'filled': filled,
+        'remaining': 0.0,
+        'cost': cost,
+        'status': 'closed',
+        'timestamp': int(started_at * 1000),
+        'lastTradeTimestamp': int(time.time() * 1000),
+        'info': {
+            'children': children,
+            'arrival_price': arrival,
+            'slippage_bps': slippage_bps
+        }
+    }
+
+
+def get_execution_algorithm(name: str) -> Type[ExecutionAlgorithm]:
+    algorithms: Dict[str, Type[ExecutionAlgorithm]] = {
+        'market': ExecutionAlgorithm,
+        'twap': TWAP,
+        'iceberg': Iceberg,
+        'book': BookSlicing
+    }
+
+    algorithm = algorithms.get(name)
+    if not algorithm:
+        raise NotImplementedError(f'Execution algorithm {name} is not yet implemented')
+
+    return algorithm
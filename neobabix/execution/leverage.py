@@ -0,0 +1,48 @@
+import ccxt
+from ccxt.base.exchange import Exchange
+
+from neobabix.cache.account import account_cache
+from neobabix.execution.orders import run_sync
+
+
+def leverage_endpoints(exchange: Exchange, symbol: str):
+    if isinstance(exchange, ccxt.bybit):
+        return 'userGetLeverage', 'userPostLeverageSave', symbol.replace('/', '')
+
+    raise NotImplementedError('Unsupported exchange')
+
+
+async def ensure_leverage(exchange: Exchange, symbol: str, leverage: int) -> int:
+    get_name, post_name, normalized_symbol = leverage_endpoints(exchange=exchange,
+                                                                symbol=symbol)
+
+    # Get leverage, from the account cache unless it is due for a refresh
+    current = await account_cache.get(exchange=exchange,
+                                      get_name=get_name,
+                                      market_id=normalized_symbol,
+                                      name='leverage')
+    if current == leverage:
+        return leverage
+
+    # Post leverage
+    method = getattr(exchange, post_name)
+    try:
+        response = await run_sync(method, params={
+            'symbol': normalized_symbol,
+            'leverage': leverage
+        })
+    except ccxt.BaseError:
+        # The write may or may not have gone through
+        account_cache.invalidate(exchange=exchange)
+        raise
+
+    if response.get('ret_code') != 0 or response.get('ret_msg') != 'ok':
+        account_cache.invalidate(exchange=exchange)
+        raise AssertionError('Got error message while setting leverage')
+
+    account_cache.update(exchange=exchange,
+                         market_id=normalized_symbol,
+                         name='leverage',
+                         value=leverage)
+
+    return leverage
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+from functools import partial
+from logging import Logger
+from os import environ
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import ccxt
+from ccxt.base.exchange import Exchange
+
+ORDER_SUBMIT_RETRIES = environ.get('ORDER_SUBMIT_RETRIES', '3')
+ORDER_SUBMIT_BACKOFF = environ.get('ORDER_SUBMIT_BACKOFF', '0.5')
+
+"""
+    Order submission with idempotent client order IDs.
+
+    Protective orders (take profit and stop) are submitted concurrently right after the entry fills. Every leg carries
+    a client order ID derived from the trade, when a submission fails on the network we cannot know whether the
+    exchange accepted it, so open orders, then closed ones as the leg may have filled meanwhile, are looked up by that
+    ID before retrying with the very same ID. Exchanges reject duplicated client order IDs, a retry can never produce a
+    second order. Legs the exchange does not list with open or closed orders, like Bybit conditional orders, bring
+    their own lookup.
+
+    A bracket with only one leg placed leaves the position half protected, the placed leg is unwound along with the
+    position before the failure is raised.
+"""
+
+SubmitLeg = Callable[[str], Awaitable[dict]]
+LookupLeg = Callable[[str], Awaitable[Optional[dict]]]
+UnwindBracket = Callable[[Dict[str, dict]], Awaitable[None]]
+
+
+def client_order_id(trade_id: str, leg: str) -> str:
+    # Bybit caps order_link_id at 36 characters
+    return f'nbx-{trade_id}-{leg}'[:36]
+
+
+async def run_sync(fn: Callable, *args, **kwargs):
+    # ccxt clients are synchronous, run them off the event loop so legs can be in flight together
+    loop = asyncio.get_event_loop()
+    # The caller's context goes along, per tick telemetry follows the call into the executor thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, partial(context.run, fn, *args, **kwargs))
+
+
+class OrderSubmitter:
+    def __init__(self, exchange: Exchange, symbol: str, logger: Logger, retries: int = int(ORDER_SUBMIT_RETRIES),
+                 backoff: float = float(ORDER_SUBMIT_BACKOFF)):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.logger = logger
+        self.retries = retries
+        self.backoff = backoff
+
+    def order_listings(self) -> List[Callable]:
+        # A leg that filled before the retry is no longer listed with open orders
+        listings = [self.exchange.fetch_open_orders]
+        if self.exchange.has.get('fetchClosedOrders'):
+            listings.append(self.exchange.fetch_closed_orders)
+        return listings
+
+    async def reconcile(self, client_id: str, lookup: Optional[LookupLeg] = None) -> Optional[dict]:
+        try:
+            if lookup is not None:
+                return await lookup(client_id)
+
+            for fetch_orders in self.order_listings():
+                orders = await run_sync(fetch_orders, symbol=self.symbol)
+                for order in orders:
+                    if order.get('clientOrderId') == client_id:
+                        return order
+        except ccxt.OrderNotFound:
+            return None
+        except ccxt.BaseError as exc:
+            self.logger.error(f'Could not reconcile order {client_id}: {exc}')
+            return None
+
+        return None
+
+    async def submit(self, client_id: str, submit: SubmitLeg, lookup: Optional[LookupLeg] = None) -> dict:
+        for attempt in range(1, self.retries + 1):
+            try:
+                return await submit(client_id)
+            except ccxt.NetworkError as exc:
+                self.logger.error(f'Submitting {client_id} failed on attempt {attempt}: {exc}')
+
+                order = await self.reconcile(client_id=client_id,
+                                             lookup=lookup)
+                if order is not None:
+                    self.logger.info(f'Order {client_id} was accepted by the exchange, reconciled')
+                    return order
+
+                if attempt == self.retries:
+                    raise
+
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+    async def submit_bracket(self, trade_id: str, exit_leg: SubmitLeg, stop_leg: SubmitLeg,
+                             stop_lookup: Optional[LookupLeg] = None,
+                             unwind: Optional[UnwindBracket] = None) -> Tuple[dict, dict]:
+        exit_order, stop_order = await asyncio.gather(
+            self.submit(client_id=client_order_id(trade_id=trade_id, leg='tp'), submit=exit_leg),
+            self.submit(client_id=client_order_id(trade_id=trade_id, leg='sl'), submit=stop_leg, lookup=stop_lookup),
+            return_exceptions=True
+        )
+
+        failed = [order for order in (exit_order, stop_order) if isinstance(order, BaseException)]
+        if failed:
+            placed = {leg: order for leg, order in (('tp', exit_order), ('sl', stop_order)) if isinstance(order, dict)}
+            self.logger.error(f'Bracket for trade {trade_id} is incomplete, placed legs: {list(placed)}')
+
+            if unwind is not None:
+                try:
+                    await unwind(placed)
+                except Exception as exc:
+                    self.logger.error(f'Could not unwind the bracket for trade {trade_id}, the position needs '
+                                      f'attention: {exc}')
+
+            raise RuntimeError(f'Bracket for trade {trade_id} is incomplete, placed orders: '
+                               f'{[order.get("id") for order in placed.values()]}') from failed[0]
+
+        return exit_order, stop_order
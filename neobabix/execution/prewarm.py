@@ -0,0 +1,88 @@
+import time
+from datetime import datetime, timedelta
+from logging import Logger
+from os import environ
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from apscheduler.triggers.interval import IntervalTrigger
+from ccxt.base.exchange import Exchange
+
+from neobabix.cache.account import account_key
+from neobabix.exchanges.simulated import SimulatedExchange, market_feed
+from neobabix.execution.leverage import ensure_leverage
+from neobabix.execution.orders import run_sync
+from neobabix.models.ccxt import Market, find_market
+
+PREWARM_SECONDS = environ.get('PREWARM_SECONDS', '30')
+
+"""
+    Work done ahead of the candle close so the entry after a signal is a single order request.
+
+    A prewarm runs PREWARM_SECONDS before every tick. It loads markets and parses the traded market, confirms the
+    leverage through the account cache and, as a side effect, opens the keep-alive connection of the trading client.
+    Playbooks built afterwards with the same client read the warm market instead of fetching markets again.
+
+    Warm state expires after twice the prewarm lead, a tick that was not prewarmed falls back to fetching everything.
+"""
+
+
+class WarmState:
+    def __init__(self, ttl: float = 2 * float(PREWARM_SECONDS)):
+        self.ttl = ttl
+        self.currency_info: Dict[Tuple[str, str, str], Tuple[float, Market]] = {}
+
+    def fresh(self, entry: Optional[tuple]):
+        if entry is None:
+            return None
+
+        warmed_at, value = entry
+        if time.monotonic() - warmed_at > self.ttl:
+            return None
+        return value
+
+    def update_currency_info(self, exchange: Exchange, symbol: str, currency_info: Market):
+        self.currency_info[account_key(exchange) + (symbol,)] = (time.monotonic(), currency_info)
+
+    def get_currency_info(self, exchange: Exchange, symbol: str) -> Optional[Market]:
+        return self.fresh(self.currency_info.get(account_key(exchange) + (symbol,)))
+
+
+warm_state = WarmState()
+
+
+async def prewarm(exchange: Exchange, symbol: str, leverage: Optional[int], logger: Logger,
+                  state: WarmState = warm_state):
+    started_at = time.monotonic()
+
+    markets = await run_sync(exchange.fetch_markets)
+    if not isinstance(exchange, SimulatedExchange):
+        market_feed.update_markets(exchange_id=exchange.id, markets=markets)
+
+    currency_info = find_market(exchange_id=exchange.id,
+                                markets=markets,
+                                symbol=symbol)
+    if currency_info is not None:
+        state.update_currency_info(exchange=exchange,
+                                   symbol=symbol,
+                                   currency_info=currency_info)
+
+    if leverage is not None:
+        try:
+            await ensure_leverage(exchange=exchange,
+                                  symbol=symbol,
+                                  leverage=leverage)
+        except NotImplementedError:
+            logger.debug('Prewarm: leverage is not supported on %s', exchange.id)
+
+    logger.info(f'Prewarmed {symbol} on {exchange.id} in {time.monotonic() - started_at:.2f}s')
+
+
+def prewarm_trigger(interval: int, lead: float = float(PREWARM_SECONDS)) -> IntervalTrigger:
+    # Ticks fire every interval from now, prewarms fire the same way but lead seconds earlier
+    lead = min(lead, interval / 2)
+    start_date = datetime.now(tz=pytz.utc) + timedelta(seconds=interval - lead)
+
+    return IntervalTrigger(seconds=interval,
+                           start_date=start_date,
+                           timezone=pytz.timezone('UTC'))
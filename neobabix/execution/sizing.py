@@ -0,0 +1,122 @@
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import ccxt
+
+from neobabix.models.ccxt import Market
+
+Number = Union[Decimal, float, int, str]
+
+"""
+    Exact order sizing for one market.
+
+    Quantizers for the price tick and the amount step are derived once from the market's precision, as decimal places
+    or as tick sizes depending on the exchange's precision mode. Prices and amounts are rounded down on those quantizers
+    with Decimal arithmetic, so what we send is exactly what the exchange accepts. Take profit and stop prices are
+    rounded away from the market instead, never closer to the price the position was entered at.
+"""
+
+
+def to_decimal(value: Number) -> Decimal:
+    if isinstance(value, Decimal):
+        return value
+    # Going through str keeps floats at their shortest representation, 0.1 stays 0.1
+    return Decimal(str(value))
+
+
+def quantum(precision: Union[float, int, None], precision_mode: Optional[int]) -> Decimal:
+    if precision is None:
+        return Decimal(1).scaleb(-8)
+
+    tick_size = precision_mode == ccxt.TICK_SIZE or (precision_mode is None and not isinstance(precision, int))
+    # A zero tick size is not a tick size, some markets report decimal places whatever the precision mode
+    if tick_size and precision > 0:
+        return to_decimal(precision)
+    return Decimal(1).scaleb(-int(precision))
+
+
+def decimals_of(quantizer: Decimal) -> int:
+    return max(-quantizer.normalize().as_tuple().exponent, 0)
+
+
+class OrderSizer:
+    def __init__(self, currency_info: Market, precision_mode: int = None):
+        self.symbol = currency_info.symbol
+        self.price_tick = quantum(precision=currency_info.precision.price,
+                                  precision_mode=precision_mode)
+        self.amount_step = quantum(precision=currency_info.precision.amount,
+                                   precision_mode=precision_mode)
+        self.price_decimals = decimals_of(self.price_tick)
+        self.amount_decimals = decimals_of(self.amount_step)
+
+        limits = currency_info.limits
+        self.min_price = to_decimal(limits.price.min) if limits.price.min is not None else None
+        self.max_price = to_decimal(limits.price.max) if limits.price.max is not None else None
+        self.min_amount = to_decimal(limits.amount.min) if limits.amount.min else Decimal(0)
+        self.max_amount = to_decimal(limits.amount.max) if limits.amount.max else Decimal(10**9)
+        self.min_cost = to_decimal(limits.cost.min) if limits.cost.min else None
+
+    @staticmethod
+    def quantize(value: Number, quantizer: Decimal, rounding: str) -> Decimal:
+        value = to_decimal(value)
+        return (value / quantizer).to_integral_value(rounding=rounding) * quantizer
+
+    @staticmethod
+    def round_down(value: Number, quantizer: Decimal) -> Decimal:
+        return OrderSizer.quantize(value=value,
+                                   quantizer=quantizer,
+                                   rounding=ROUND_DOWN)
+
+    def price(self, value: Number, rounding: str = ROUND_DOWN) -> Decimal:
+        return self.quantize(value=value,
+                             quantizer=self.price_tick,
+                             rounding=rounding)
+
+    def price_away(self, value: Number, above: bool) -> Decimal:
+        """
+            Price of an order resting above the market, rounded up, or below it, rounded down.
+        """
+        return self.price(value=value,
+                          rounding=ROUND_UP if above else ROUND_DOWN)
+
+    def amount(self, value: Number) -> Decimal:
+        return self.round_down(value=value,
+                               quantizer=self.amount_step)
+
+    def amount_for_cost(self, cost: Number, price: Number) -> Decimal:
+        return self.amount(to_decimal(cost) / to_decimal(price))
+
+    def within_limits(self, amount: Decimal, price: Decimal = None) -> bool:
+        if amount <= 0 or amount < self.min_amount or amount > self.max_amount:
+            return False
+        if price is not None and self.min_cost is not None and amount * price < self.min_cost:
+            return False
+        return True
+
+    def size(self, cost: Number, price: Number, markup: Number = 0) -> Tuple[Decimal, Decimal]:
+        """
+            Price marked up by a ratio and the amount buying cost worth at that price, both quantized.
+        """
+        price = self.price(to_decimal(price) * (1 + to_decimal(markup)))
+        return price, self.amount_for_cost(cost=cost, price=price)
+
+    def size_many(self, costs: Sequence[Number], prices: Sequence[Number],
+                  markup: Number = 0) -> List[Tuple[Decimal, Decimal]]:
+        markup = to_decimal(markup)
+        return [self.size(cost=cost, price=price, markup=markup) for cost, price in zip(costs, prices)]
+
+
+_sizers: Dict[Tuple, OrderSizer] = {}
+
+
+def get_order_sizer(currency_info: Market, precision_mode: int = None) -> OrderSizer:
+    # Markets are immutable and hashable, a changed market gets its own sizer
+    key = (currency_info, precision_mode)
+
+    sizer = _sizers.get(key)
+    if sizer is None:
+        sizer = OrderSizer(currency_info=currency_info,
+                           precision_mode=precision_mode)
+        _sizers[key] = sizer
+
+    return sizer
@@ -0,0 +1,174 @@
+from logging import Logger
+from os import environ
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from ccxt.base.exchange import Exchange
+
+from neobabix.cache.market import market_cache
+from neobabix.exchanges.simulated import SimulatedExchange, market_feed
+from neobabix.execution.sizing import OrderSizer
+
+SLIPPAGE_MAX_BPS = environ.get('SLIPPAGE_MAX_BPS')
+SLIPPAGE_ACTION = environ.get('SLIPPAGE_ACTION', 'abort')
+SLIPPAGE_BOOK_DEPTH = environ.get('SLIPPAGE_BOOK_DEPTH', '50')
+ORDER_BOOK_TTL = environ.get('ORDER_BOOK_TTL', '2')
+
+DOWNSIZE = 'downsize'
+LIMIT = 'limit'
+ABORT = 'abort'
+
+"""
+    Pre-trade slippage estimate for market orders.
+
+    The order book snapshot is walked level by level with cumulative sums, giving the average fill price of the
+    intended amount and its slippage in basis points against the mid price. Snapshots are shared for ORDER_BOOK_TTL
+    seconds, an estimate costs at most one request.
+
+    When the slippage goes past SLIPPAGE_MAX_BPS the order is, depending on SLIPPAGE_ACTION:
+        - downsize: reduced to the largest amount within the threshold
+        - limit: sent as a limit order at the worst price allowed by the threshold
+        - abort: not sent at all
+"""
+
+
+class SlippageEstimate(NamedTuple):
+    reference: float
+    average: float
+    fillable: float
+    slippage_bps: float
+
+
+class SlippagePlan(NamedTuple):
+    action: Optional[str]
+    amount: float
+    price: Optional[float]
+    estimate: Optional[SlippageEstimate]
+
+
+def book_levels(levels: Optional[List[list]]) -> np.ndarray:
+    # Some exchanges add an order count after price and amount
+    return np.array([level[:2] for level in levels or []], dtype=float).reshape(-1, 2)
+
+
+def walk_book(levels: np.ndarray, amount: float) -> Tuple[float, float]:
+    """
+        Average price and fillable amount of taking amount from levels, a (price, amount) array best first.
+    """
+    if len(levels) == 0 or amount <= 0:
+        return float('nan'), 0.0
+
+    prices = levels[:, 0]
+    sizes = levels[:, 1]
+    before = np.cumsum(sizes) - sizes
+    taken = np.clip(amount - before, 0.0, sizes)
+
+    fillable = float(taken.sum())
+    if fillable == 0:
+        return float('nan'), 0.0
+    return float(np.dot(taken, prices) / fillable), fillable
+
+
+def max_amount_within(levels: np.ndarray, direction: int, reference: float, max_bps: float) -> float:
+    """
+        Largest amount whose average fill price stays within max_bps of the reference.
+    """
+    if len(levels) == 0:
+        return 0.0
+
+    limit = reference * (1.0 + direction * max_bps / 10000.0)
+    prices = levels[:, 0]
+    sizes = levels[:, 1]
+    cumulative = np.cumsum(sizes)
+    averages = np.cumsum(prices * sizes) / cumulative
+
+    within = direction * (averages - limit) <= 0
+    if not within[0]:
+        # Even the best level is past the limit
+        return 0.0
+    if within.all():
+        return float(cumulative[-1])
+
+    # Every level before the first outside one is taken whole, that level partially
+    k = int(np.argmin(within))
+    cost = float(np.dot(prices[:k], sizes[:k]))
+    amount = float(cumulative[k - 1])
+    partial = (limit * amount - cost) / (prices[k] - limit)
+
+    return amount + max(min(partial, float(sizes[k])), 0.0)
+
+
+class SlippageGuard:
+    def __init__(self, exchange: Exchange, symbol: str, sizer: OrderSizer, logger: Logger, max_bps: float,
+                 action: str = SLIPPAGE_ACTION, depth: int = int(SLIPPAGE_BOOK_DEPTH),
+                 ttl: float = float(ORDER_BOOK_TTL)):
+        if action not in (DOWNSIZE, LIMIT, ABORT):
+            raise NotImplementedError(f'Slippage action {action} is not yet implemented')
+
+        self.exchange = exchange
+        self.symbol = symbol
+        self.sizer = sizer
+        self.logger = logger
+        self.max_bps = max_bps
+        self.action = action
+        self.depth = depth
+        self.ttl = ttl
+
+    async def order_book(self) -> dict:
+        if isinstance(self.exchange, SimulatedExchange):
+            return self.exchange.fetch_order_book(symbol=self.symbol, limit=self.depth)
+
+        order_book, fetched = await market_cache.order_book(exchange=self.exchange,
+                                                            symbol=self.symbol,
+                                                            limit=self.depth,
+                                                            ttl=self.ttl)
+        if fetched:
+            market_feed.update_order_book(symbol=self.symbol,
+                                          order_book=order_book)
+
+        return order_book
+
+    async def estimate(self, side: str, amount: float) -> Tuple[SlippageEstimate, np.ndarray]:
+        order_book = await self.order_book()
+        bids = book_levels(order_book.get('bids'))
+        asks = book_levels(order_book.get('asks'))
+        if len(bids) == 0 or len(asks) == 0:
+            raise ValueError(f'The order book of {self.symbol} is empty')
+
+        levels = asks if side == 'buy' else bids
+        direction = 1 if side == 'buy' else -1
+        reference = float(bids[0, 0] + asks[0, 0]) / 2.0
+
+        average, fillable = walk_book(levels=levels,
+                                      amount=amount)
+        slippage_bps = float(direction * (average / reference - 1.0) * 10000.0)
+
+        return SlippageEstimate(reference=reference,
+                                average=average,
+                                fillable=fillable,
+                                slippage_bps=slippage_bps), levels
+
+    async def plan(self, side: str, amount) -> SlippagePlan:
+        amount = float(amount)
+        estimate, levels = await self.estimate(side=side,
+                                               amount=amount)
+        self.logger.info(f'Expected fill for {side} {amount} {self.symbol}: {estimate.average:.8f}, slippage '
+                         f'{estimate.slippage_bps:.2f} bps against mid {estimate.reference:.8f}')
+
+        if estimate.fillable >= amount and estimate.slippage_bps <= self.max_bps:
+            return SlippagePlan(action=None, amount=amount, price=None, estimate=estimate)
+
+        direction = 1 if side == 'buy' else -1
+        if self.action == DOWNSIZE:
+            within = max_amount_within(levels=levels,
+                                       direction=direction,
+                                       reference=estimate.reference,
+                                       max_bps=self.max_bps)
+            downsized = float(self.sizer.amount(min(within, amount)))
+            if downsized > 0 and self.sizer.within_limits(amount=self.sizer.amount(downsized)):
+                return SlippagePlan(action=DOWNSIZE, amount=downsized, price=None, estimate=estimate)
+        elif self.action == LIMIT:
+            price = estimate.reference * (1.0 + direction * self.max_bps / 10000.0)
+            return SlippagePlan(action=LIMIT, amount=amount, price=float(self.sizer.price(price)), estimate=estimate)
+
+        return SlippagePlan(action=ABORT, amount=0.0, price=None, estimate=estimate)
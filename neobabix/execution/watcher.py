@@ -0,0 +1,230 @@
+import asyncio
+from logging import Logger
+from os import environ
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import ccxt
+from ccxt.base.exchange import Exchange
+
+from neobabix.cache.market import market_cache
+from neobabix.exchanges.simulated import SimulatedExchange, market_feed
+from neobabix.execution.orders import run_sync
+
+ORDER_WATCH_MIN_INTERVAL = environ.get('ORDER_WATCH_MIN_INTERVAL', '2')
+ORDER_WATCH_MAX_INTERVAL = environ.get('ORDER_WATCH_MAX_INTERVAL', '60')
+ORDER_WATCH_PROXIMITY = environ.get('ORDER_WATCH_PROXIMITY', '0.01')
+
+ENDED_STATUSES = ('closed', 'canceled', 'expired', 'rejected')
+
+"""
+    One order watcher per exchange account, shared by every playbook.
+
+    Each cycle costs one fetch_open_orders and one fetch_ticker per symbol, however many orders are watched. Orders an
+    exchange never lists as open, like Bybit conditional orders, are looked up through the listing of conditional
+    orders the playbook provides, once per cycle and symbol as well. Only orders missing from both are fetched one by
+    one, to learn how they ended.
+
+    The polling interval follows price proximity: the closer the last price is to any watched order, the shorter the
+    interval, from ORDER_WATCH_MAX_INTERVAL down to ORDER_WATCH_MIN_INTERVAL once within ORDER_WATCH_PROXIMITY.
+
+    Exchanges exposing a private order stream (ccxt pro's watch_orders) are followed through it instead of polling.
+"""
+
+ListOrders = Callable[[], Awaitable[List[dict]]]
+
+
+class OrderGroup:
+    def __init__(self, symbol: str, orders: List[dict], conditional: Optional[ListOrders] = None):
+        self.symbol = symbol
+        self.orders: Dict[str, dict] = {str(order.get('id')): order for order in orders}
+        self.conditional = conditional
+        self.future: asyncio.Future = asyncio.get_event_loop().create_future()
+
+    def update(self, order: dict):
+        order_id = str(order.get('id'))
+        if order_id not in self.orders:
+            return
+
+        # Keep fields only known at submission time, like Bybit's stop order price
+        self.orders[order_id] = dict(self.orders.get(order_id), **{k: v for k, v in order.items() if v is not None})
+
+        if order.get('status') in ENDED_STATUSES and not self.future.done():
+            self.future.set_result(self.orders)
+
+
+class OrderWatcher:
+    def __init__(self, exchange: Exchange, logger: Logger, min_interval: float = float(ORDER_WATCH_MIN_INTERVAL),
+                 max_interval: float = float(ORDER_WATCH_MAX_INTERVAL),
+                 proximity: float = float(ORDER_WATCH_PROXIMITY)):
+        self.exchange = exchange
+        self.logger = logger
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.proximity = proximity
+
+        self.groups: List[OrderGroup] = []
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup = asyncio.Event()
+
+    @property
+    def streams_orders(self) -> bool:
+        return hasattr(self.exchange, 'watch_orders') and bool(self.exchange.has.get('watchOrders'))
+
+    @property
+    def symbols(self) -> Set[str]:
+        return set(group.symbol for group in self.groups)
+
+    async def wait_any(self, symbol: str, orders: List[dict],
+                       conditional: Optional[ListOrders] = None) -> Dict[str, dict]:
+        group = OrderGroup(symbol=symbol,
+                           orders=orders,
+                           conditional=conditional)
+        self.groups.append(group)
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+        self.wakeup.set()
+
+        try:
+            return await group.future
+        finally:
+            self.groups.remove(group)
+            if not self.groups:
+                release_order_watcher(watcher=self)
+
+    def update(self, order: dict):
+        for group in self.groups:
+            group.update(order)
+
+    async def run(self):
+        while self.groups:
+            try:
+                if self.streams_orders:
+                    await self.stream()
+                    continue
+
+                interval = self.max_interval
+                for symbol in self.symbols:
+                    interval = min(interval, await self.poll(symbol=symbol))
+            except Exception as exc:
+                self.logger.error(f'Order watcher failed to poll: {exc}')
+                interval = self.max_interval
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stream(self):
+        symbols = self.symbols
+        if len(symbols) == 1:
+            orders = await self.exchange.watch_orders(symbol=next(iter(symbols)))
+        else:
+            orders = await self.exchange.watch_orders()
+
+        for order in orders:
+            self.update(order)
+
+    def watched(self, symbol: str) -> Dict[str, dict]:
+        watched = {}
+        for group in self.groups:
+            if group.symbol == symbol and not group.future.done():
+                watched.update(group.orders)
+        return watched
+
+    async def poll(self, symbol: str) -> float:
+        watched = self.watched(symbol=symbol)
+        if not watched:
+            return self.max_interval
+
+        open_orders = await run_sync(self.exchange.fetch_open_orders, symbol=symbol)
+        open_ids = set()
+        for order in open_orders:
+            order_id = str(order.get('id'))
+            if order_id in watched:
+                open_ids.add(order_id)
+                self.update(order)
+
+        missing = [order_id for order_id in watched.keys() if order_id not in open_ids]
+        if missing:
+            open_ids.update(await self.poll_conditional(symbol=symbol, watched=watched))
+
+        for order_id in missing:
+            if order_id in open_ids:
+                continue
+
+            # Either gone from the open orders or never listed there, ask for the order itself
+            order = await run_sync(self.exchange.fetch_order, id=order_id, symbol=symbol)
+            self.update(order)
+
+        return await self.next_interval(symbol=symbol, orders=list(self.watched(symbol=symbol).values()))
+
+    async def poll_conditional(self, symbol: str, watched: Dict[str, dict]) -> Set[str]:
+        # Every group of the symbol lists the same conditional orders, one of them is enough
+        conditional = next((group.conditional for group in self.groups
+                            if group.symbol == symbol and group.conditional is not None), None)
+        if conditional is None:
+            return set()
+
+        try:
+            orders = await conditional()
+        except ccxt.BaseError as exc:
+            self.logger.error(f'Order watcher could not list conditional orders of {symbol}: {exc}')
+            return set()
+
+        listed = set()
+        for order in orders:
+            order_id = str(order.get('id'))
+            if order_id in watched:
+                listed.add(order_id)
+                self.update(order)
+
+        return listed
+
+    async def next_interval(self, symbol: str, orders: List[dict]) -> float:
+        if not orders:
+            return self.max_interval
+
+        try:
+            if isinstance(self.exchange, SimulatedExchange):
+                ticker, fetched = await run_sync(self.exchange.fetch_ticker, symbol=symbol), False
+            else:
+                ticker, fetched = await market_cache.ticker(exchange=self.exchange, symbol=symbol)
+        except ccxt.BaseError:
+            return self.max_interval
+
+        last = ticker.get('last') or ticker.get('close')
+        if not last:
+            return self.max_interval
+        if fetched:
+            market_feed.update_ticker(symbol=symbol, ticker=ticker)
+
+        prices = [float(p) for p in (o.get('stopPrice') or o.get('price') for o in orders) if p is not None]
+        if not prices:
+            return self.max_interval
+
+        distance = min(abs(price - last) / last for price in prices)
+        ratio = min(distance / self.proximity, 1.0) if self.proximity > 0 else 1.0
+
+        return self.min_interval + (self.max_interval - self.min_interval) * ratio
+
+
+_watchers: Dict[Tuple[str, str], OrderWatcher] = {}
+
+
+def get_order_watcher(exchange: Exchange, logger: Logger) -> OrderWatcher:
+    key = (exchange.id, getattr(exchange, 'apiKey', None) or str(id(exchange)))
+
+    watcher = _watchers.get(key)
+    if watcher is None:
+        watcher = OrderWatcher(exchange=exchange, logger=logger)
+        _watchers[key] = watcher
+
+    return watcher
+
+
+def release_order_watcher(watcher: OrderWatcher):
+    for key, value in list(_watchers.items()):
+        if value is watcher:
+            _watchers.pop(key)
@@ -0,0 +1,59 @@
+from typing import Tuple
+
+import numpy as np
+
+"""
+    Calendar indicators evaluated over arrays of candle timestamps.
+
+    Timestamps are either ccxt's UNIX milliseconds or numpy datetime64 values, all computations are done in UTC.
+"""
+
+MOON_AGES = np.array([18, 0, 11, 22, 3, 14, 25, 6, 17, 28, 9, 20, 1, 12, 23, 4, 15, 26, 7])
+MOON_OFFSETS = np.array([-1, 1, 0, 1, 2, 3, 4, 5, 7, 7, 9, 9])
+
+
+def _to_days(timestamps: np.ndarray) -> np.ndarray:
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        return timestamps.astype('datetime64[D]')
+    return timestamps.astype('int64').astype('datetime64[ms]').astype('datetime64[D]')
+
+
+def CalendarDate(timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    days = _to_days(timestamps)
+    months = days.astype('datetime64[M]')
+    years = days.astype('datetime64[Y]')
+
+    return (years.astype('int64') + 1970,
+            (months - years).astype('int64') + 1,
+            (days - months).astype('int64') + 1)
+
+
+def MoonDaysIntoPhase(years: np.ndarray, months: np.ndarray, days: np.ndarray) -> np.ndarray:
+    years = np.asarray(years, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+
+    days = np.where(days == 31, 1, days)
+    return (MOON_AGES[(years + 1) % 19] + ((days + MOON_OFFSETS[months - 1]) % 30) + (years < 1900)) % 30
+
+
+def MoonPhase(timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    days_into_phase = MoonDaysIntoPhase(*CalendarDate(timestamps))
+
+    index = np.minimum(((days_into_phase + 2) * 16 / 59.0).astype(np.int64), 7)
+
+    # light should be 100% 15 days into phase
+    light = (2 * days_into_phase * 100 / 29).astype(np.int64)
+    light = np.where(light > 100, np.abs(light - 200), light)
+
+    return light, index
+
+
+def Weekday(timestamps: np.ndarray) -> np.ndarray:
+    # 1970-01-01 was a Thursday, Monday is 0 just like datetime.weekday()
+    return (_to_days(timestamps).astype('int64') + 3) % 7
+
+
+def WeekdayMask(timestamps: np.ndarray, weekday: int) -> np.ndarray:
+    return Weekday(timestamps) == weekday
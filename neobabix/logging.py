@@ -1,21 +1,119 @@
+import atexit
+import json
 import logging
+import queue
 import sys
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from os import environ
+from typing import Optional
 
 DEBUG = environ.get('DEBUG', '1')
+LOG_FORMAT = environ.get('LOG_FORMAT', 'text')
+LOG_QUEUE = environ.get('LOG_QUEUE', '1')
 
+CONTEXT_FIELDS = ('bot', 'symbol', 'trade_id')
+
+"""
+    Logging for neobabix.
+
+    Records are put on a queue by the caller and written to stdout by a listener thread, so a slow terminal or pipe
+    never blocks the event loop. LOG_QUEUE=0 writes from the caller as before.
+
+    LOG_FORMAT=json writes one JSON object per line, with the bot, symbol and trade id the record was logged for when
+    known. They are set with set_log_context and, being context variables, follow each bot's task and the threads it
+    runs ccxt calls in. LOG_FORMAT=text keeps the plain format and appends them in brackets.
+
+    Messages are only formatted when written, pass arguments rather than f-strings to debug so that debug messages cost
+    a level check when DEBUG=0.
+"""
+
+log_context = {field: ContextVar(f'log_{field}', default=None) for field in CONTEXT_FIELDS}
+
+
+def set_log_context(**fields):
+    for field, value in fields.items():
+        log_context[field].set(None if value is None else str(value))
+
+
+class ContextFilter(logging.Filter):
+    # Runs in the caller, where the context variables are set, before the record is queued
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, var in log_context.items():
+            if not hasattr(record, field):
+                setattr(record, field, var.get())
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = ' '.join(f'{field}={getattr(record, field)}' for field in CONTEXT_FIELDS
+                           if getattr(record, field, None) is not None)
+        return f'{line} [{context}]' if context else line
 
-def setup_custom_logger(name) -> logging.Logger:
-    formatter = logging.Formatter(fmt='%(asctime)s - %(levelname)-2s - %(message)s',
-                                  datefmt='%Y-%m-%d %H:%M:%S')
 
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler formats records before queueing them, here only the message is merged with its arguments, in
+        # the caller as the arguments may change afterwards, formatting is left to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def get_formatter(log_format: str = LOG_FORMAT) -> logging.Formatter:
+    if log_format == 'json':
+        return JsonFormatter()
+
+    return TextFormatter(fmt='%(asctime)s - %(levelname)-2s - %(message)s',
+                         datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def setup_custom_logger(name) -> logging.Logger:
     screen_handler = logging.StreamHandler(stream=sys.stdout)
-    screen_handler.setFormatter(formatter)
+    screen_handler.setFormatter(get_formatter())
+
+    handler: logging.Handler = screen_handler
+    listener: Optional[QueueListener] = None
+    if LOG_QUEUE == '1':
+        handler = DeferredQueueHandler(queue.SimpleQueue())
+        listener = QueueListener(handler.queue, screen_handler, respect_handler_level=True)
+    handler.addFilter(ContextFilter())
 
     lg = logging.getLogger(name)
     log_level = logging.DEBUG if DEBUG == '1' else logging.INFO
     lg.setLevel(log_level)
-    lg.addHandler(screen_handler)
+    lg.addHandler(handler)
+
+    if listener is not None:
+        listener.start()
+        # Records still queued are written before exiting
+        atexit.register(listener.stop)
 
     return lg
 
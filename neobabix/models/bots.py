@@ -0,0 +1,44 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, validator
+
+
+class AccountConfig(BaseModel):
+    exchange: str
+    api_key_env: Optional[str]
+    api_secret_env: Optional[str]
+    testnet: bool = False
+
+
+class BotConfig(BaseModel):
+    name: str
+    strategy: str = 'WiseWilliams'
+    playbook: str = 'HitAndRun'
+    account: str
+    candles_exchange: str = 'bitfinex'
+    candle_symbol: str = 'BTC/USDT'
+    trade_symbol: str = 'BTC/USD'
+    timeframe: str = '1h'
+    trade_on_close: bool = True
+    leverage: Optional[int]
+    notify_using: str = 'telegram'
+    lock: str = 'symbol'
+    interval: int = 86400
+    params: Dict[str, str] = {}
+
+    @validator('lock')
+    def lock_scope(cls, value):
+        if value not in ('symbol', 'account'):
+            raise ValueError('lock must be either symbol or account')
+        return value
+
+
+class RuntimeConfig(BaseModel):
+    accounts: Dict[str, AccountConfig]
+    bots: List[BotConfig]
+
+    @validator('bots', each_item=True)
+    def known_account(cls, value, values):
+        if value.account not in values.get('accounts', {}):
+            raise ValueError(f'Bot {value.name} uses the unknown account {value.account}')
+        return value
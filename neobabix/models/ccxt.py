@@ -1,4 +1,5 @@
-from typing import Optional, Union
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
 from pydantic import BaseModel
 
@@ -37,3 +38,87 @@ class CurrencyInfo(BaseModel):
     inverse: Optional[bool]
     limits: LimitsField
     info: dict
+
+
+"""
+    Compact market model.
+
+    CurrencyInfo validates the whole market object, including the raw exchange payload in info. Playbooks only need
+    precision, limits and fees, Market keeps just those in immutable tuples without a per instance __dict__. Markets are
+    interned per exchange and symbol, parsing the same market again returns the instance already held.
+"""
+
+
+class MarketPrecision(NamedTuple):
+    amount: Union[float, int, None]
+    price: Union[float, int, None]
+
+
+class MarketLimit(NamedTuple):
+    min: Optional[float]
+    max: Optional[float]
+
+
+class MarketLimits(NamedTuple):
+    amount: MarketLimit
+    price: MarketLimit
+    cost: MarketLimit
+
+
+class Market(NamedTuple):
+    id: str
+    symbol: str
+    base: str
+    quote: str
+    active: Optional[bool]
+    precision: MarketPrecision
+    limits: MarketLimits
+    taker: Optional[float]
+    maker: Optional[float]
+    # Contracts are worth contract_size base units, or quote units for inverse markets
+    inverse: Optional[bool] = None
+    contract_size: Optional[float] = None
+
+    @classmethod
+    def parse(cls, market: dict) -> 'Market':
+        precision = market.get('precision') or {}
+        limits = market.get('limits') or {}
+
+        def limit(name: str) -> MarketLimit:
+            values = limits.get(name) or {}
+            return MarketLimit(min=values.get('min'), max=values.get('max'))
+
+        return cls(id=market.get('id'),
+                   symbol=sys.intern(market.get('symbol')),
+                   base=sys.intern(market.get('base')),
+                   quote=sys.intern(market.get('quote')),
+                   active=market.get('active'),
+                   precision=MarketPrecision(amount=precision.get('amount'), price=precision.get('price')),
+                   limits=MarketLimits(amount=limit('amount'), price=limit('price'), cost=limit('cost')),
+                   taker=market.get('taker'),
+                   maker=market.get('maker'),
+                   inverse=market.get('inverse'),
+                   contract_size=market.get('contractSize'))
+
+
+_markets: Dict[Tuple[str, str], Market] = {}
+
+
+def intern_market(exchange_id: str, market: dict) -> Market:
+    parsed = Market.parse(market)
+
+    key = (exchange_id, parsed.symbol)
+    interned = _markets.get(key)
+    if interned == parsed:
+        return interned
+
+    _markets[key] = parsed
+    return parsed
+
+
+def find_market(exchange_id: str, markets: List[dict], symbol: str) -> Optional[Market]:
+    for market in markets:
+        if market.get('symbol') == symbol:
+            return intern_market(exchange_id=exchange_id,
+                                 market=market)
+    return None
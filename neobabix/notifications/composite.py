@@ -0,0 +1,53 @@
+import asyncio
+from typing import Awaitable, Callable, List, Union
+
+from neobabix.logging import logger
+from neobabix.notifications.notification import Notification
+
+"""
+    Sends every notification to several channels, NOTIFY_USING=telegram,webhook for instance.
+
+    Channels are sent to concurrently and independently, a channel failing is logged and does not keep the others from
+    being notified. Channels are expected to be dispatched, each on its own queue, so the playbook only waits for the
+    notifications to be queued.
+"""
+
+
+class Composite(Notification):
+    def __init__(self, channels: List[Notification]):
+        self.channels = channels
+        self.name = ','.join(channel.name for channel in channels)
+        self.timeout = max(channel.timeout for channel in channels)
+        self.app_name = channels[0].app_name
+        self.silent = all(channel.silent for channel in channels)
+
+    async def fan_out(self, kind: str, send: Callable[[Notification], Awaitable]):
+        results = await asyncio.gather(*[send(channel) for channel in self.channels],
+                                       return_exceptions=True)
+
+        for channel, result in zip(self.channels, results):
+            if isinstance(result, BaseException):
+                logger.error(f'Could not notify {kind} through {channel.name}: {result}')
+
+    async def send_message(self, message: str):
+        await self.fan_out(kind='message',
+                           send=lambda channel: channel.send_message(message=message))
+
+    async def send_entry_notification(self, entry_price: str, modal_duid: str, order: dict = None):
+        await self.fan_out(kind='entry',
+                           send=lambda channel: channel.send_entry_notification(entry_price=entry_price,
+                                                                                modal_duid=modal_duid,
+                                                                                order=order))
+
+    async def send_exit_notification(self, entry_price: str, modal_duid: str, exit_price: str, stop_limit_price: str,
+                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None,
+                                     stopped: bool = None):
+        await self.fan_out(kind='exit',
+                           send=lambda channel: channel.send_exit_notification(entry_price=entry_price,
+                                                                               modal_duid=modal_duid,
+                                                                               exit_price=exit_price,
+                                                                               stop_limit_price=stop_limit_price,
+                                                                               settled=settled,
+                                                                               pnl_in_percent=pnl_in_percent,
+                                                                               stopped=stopped,
+                                                                               order=order))
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from os import environ
+from typing import Dict, List, Optional, Union
+
+from neobabix.logging import logger
+from neobabix.notifications.notification import Notification
+
+NOTIFY_DIGEST_WINDOW = environ.get('NOTIFY_DIGEST_WINDOW', '0')
+NOTIFY_DIGEST_MAX_EVENTS = environ.get('NOTIFY_DIGEST_MAX_EVENTS', '50')
+
+"""
+    Digest mode for fleets of bots sharing notification channels.
+
+    With NOTIFY_DIGEST_WINDOW set to a number of seconds, entries and exits of every playbook are collected per channel
+    and sent as one summary message when the window ends, or sooner once NOTIFY_DIGEST_MAX_EVENTS events are waiting.
+    A channel gets at most one message per window however many bots trade, which keeps Telegram under its per chat
+    rate limits.
+
+    Urgent events skip the window and are sent right away: exits settled by a stop, as flagged by the playbook whatever
+    the P&L, and exits without a P&L, which are orders canceled by hand. Exits not flagged either way are urgent when
+    settled at a loss.
+"""
+
+
+def is_urgent(event: dict) -> bool:
+    if event.get('notification_type') != 'exit' or not event.get('settled'):
+        return False
+
+    # A stop hit at breakeven or better is still a stop
+    if event.get('stopped'):
+        return True
+
+    try:
+        pnl = float(event.get('pnl_in_percent'))
+    except (TypeError, ValueError):
+        return True
+
+    return event.get('stopped') is None and pnl < 0
+
+
+def describe(event: dict) -> str:
+    if event.get('notification_type') == 'entry':
+        return f'Entry at <b>{event.get("entry_price")}</b> for {event.get("modal_duid")}'
+    if not event.get('settled'):
+        return f'Exit at <b>{event.get("exit_price")}</b>, stop at <b>{event.get("stop_limit_price")}</b>'
+    return f'Settled from <b>{event.get("entry_price")}</b>, P&L <b>{event.get("pnl_in_percent")}</b>%'
+
+
+def digest_message(app_name: str, events: List[dict], window: float) -> str:
+    entries = len([event for event in events if event.get('notification_type') == 'entry'])
+    exits = len(events) - entries
+
+    lines = [f'<b>{app_name}</b>', '', f'{entries} entries and {exits} exits in the last {window:g}s', '']
+    for event in events:
+        lines.append(f'{event.get("bot")}: {describe(event=event)}')
+
+    return '\n'.join(lines)
+
+
+class DigestBuffer:
+    def __init__(self, channel: Notification, window: float = float(NOTIFY_DIGEST_WINDOW),
+                 max_events: int = int(NOTIFY_DIGEST_MAX_EVENTS)):
+        self.channel = channel
+        self.window = window
+        self.max_events = max(max_events, 1)
+
+        self.events: List[dict] = []
+        self.flush_task: Optional[asyncio.Task] = None
+
+    async def add(self, event: dict):
+        self.events.append(event)
+
+        if len(self.events) >= self.max_events:
+            await self.flush()
+        elif self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.window)
+        await self.flush()
+
+    async def flush(self):
+        if not self.events:
+            return
+
+        events, self.events = self.events, []
+        try:
+            await self.channel.send_digest(message=digest_message(app_name=self.channel.app_name,
+                                                                  events=events,
+                                                                  window=self.window),
+                                           events=events)
+        except Exception as exc:
+            logger.error(f'Could not send a digest of {len(events)} events to {self.channel.name}: {exc}')
+
+
+_buffers: Dict[str, DigestBuffer] = {}
+
+
+def get_digest_buffer(channel: Notification) -> DigestBuffer:
+    # The first channel instance of a kind sends the digests of all bots notifying through that kind
+    buffer = _buffers.get(channel.name)
+    if buffer is None:
+        buffer = DigestBuffer(channel=channel)
+        _buffers[channel.name] = buffer
+
+    return buffer
+
+
+async def flush_digests():
+    await asyncio.gather(*[buffer.flush() for buffer in _buffers.values()])
+
+
+class Digest(Notification):
+    """
+        Collects the entries and exits of a channel into its digest, urgent events are sent right away.
+    """
+
+    def __init__(self, channel: Notification, context: Dict[str, str] = None):
+        self.channel = channel
+        self.buffer = get_digest_buffer(channel=channel)
+        self.name = channel.name
+        self.timeout = channel.timeout
+        self.app_name = channel.app_name
+        self.silent = channel.silent
+
+        context = context or {}
+        self.bot = context.get('bot') or (f'{context.get("playbook", environ.get("PLAYBOOK"))} '
+                                          f'{context.get("trade_symbol", environ.get("TRADE_SYMBOL"))}')
+
+    async def send_message(self, message: str):
+        await self.channel.send_message(message=message)
+
+    async def send_entry_notification(self, entry_price: str, modal_duid: str, order: dict = None):
+        await self.buffer.add({
+            'bot': self.bot,
+            'notification_type': 'entry',
+            'entry_price': entry_price,
+            'modal_duid': modal_duid,
+            'time': time.time()
+        })
+
+    async def send_exit_notification(self, entry_price: str, modal_duid: str, exit_price: str, stop_limit_price: str,
+                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None,
+                                     stopped: bool = None):
+        event = {
+            'bot': self.bot,
+            'notification_type': 'exit',
+            'entry_price': entry_price,
+            'modal_duid': modal_duid,
+            'exit_price': exit_price,
+            'stop_limit_price': stop_limit_price,
+            'settled': settled,
+            'pnl_in_percent': pnl_in_percent,
+            'stopped': stopped,
+            'time': time.time()
+        }
+        if not is_urgent(event=event):
+            return await self.buffer.add(event)
+
+        await self.channel.send_exit_notification(entry_price=entry_price,
+                                                  modal_duid=modal_duid,
+                                                  exit_price=exit_price,
+                                                  stop_limit_price=stop_limit_price,
+                                                  settled=settled,
+                                                  pnl_in_percent=pnl_in_percent,
+                                                  stopped=stopped,
+                                                  order=order)
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from os import environ
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Union
+
+from neobabix.logging import logger
+from neobabix.notifications.notification import Notification
+
+NOTIFY_QUEUE_SIZE = environ.get('NOTIFY_QUEUE_SIZE', '100')
+NOTIFY_WORKERS = environ.get('NOTIFY_WORKERS', '2')
+NOTIFY_RETRIES = environ.get('NOTIFY_RETRIES', '3')
+NOTIFY_BACKOFF = environ.get('NOTIFY_BACKOFF', '1')
+NOTIFY_OVERFLOW = environ.get('NOTIFY_OVERFLOW', 'drop_oldest')
+NOTIFY_DRAIN_TIMEOUT = environ.get('NOTIFY_DRAIN_TIMEOUT', '10')
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'
+
+"""
+    Notifications are queued and sent by background workers, playbooks never wait for them.
+
+    Every channel has a queue of its own, holding up to NOTIFY_QUEUE_SIZE notifications for NOTIFY_WORKERS workers, a
+    slow or failing channel never delays the others. Every delivery is bounded by its channel's timeout (NOTIFY_TIMEOUT,
+    TELEGRAM_TIMEOUT, WEBHOOK_TIMEOUT) and retried NOTIFY_RETRIES times with an exponential backoff starting at
+    NOTIFY_BACKOFF seconds. Delivery latency, from queued to sent, is kept per channel.
+
+    When the queue is full NOTIFY_OVERFLOW decides what happens:
+        - drop_oldest: the oldest queued notification is dropped for the new one, the default
+        - drop_newest: the new notification is dropped
+        - block: the caller waits for room in the queue
+"""
+
+
+class NotificationJob(NamedTuple):
+    channel: str
+    kind: str
+    send: Callable[[], Awaitable]
+    timeout: float
+    queued_at: float = 0.0
+
+
+class NotificationDispatcher:
+    def __init__(self, size: int = int(NOTIFY_QUEUE_SIZE), workers: int = int(NOTIFY_WORKERS),
+                 retries: int = int(NOTIFY_RETRIES), backoff: float = float(NOTIFY_BACKOFF),
+                 overflow: str = NOTIFY_OVERFLOW):
+        if overflow not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise NotImplementedError(f'Notification overflow policy {overflow} is not yet implemented')
+
+        self.size = size
+        self.concurrency = max(workers, 1)
+        self.retries = max(retries, 1)
+        self.backoff = backoff
+        self.overflow = overflow
+
+        # Created on first use, the queue belongs to the running event loop
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.size)
+
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < self.concurrency:
+            self.workers.append(asyncio.ensure_future(self.work()))
+
+    async def submit(self, job: NotificationJob):
+        self.start()
+        job = job._replace(queued_at=time.monotonic())
+
+        if self.queue.full():
+            if self.overflow == BLOCK:
+                await self.queue.put(job)
+                return
+            if self.overflow == DROP_NEWEST:
+                self.dropped += 1
+                logger.error(f'Notification queue is full, dropped {job.kind} notification for {job.channel}')
+                return
+
+            oldest = self.queue.get_nowait()
+            self.queue.task_done()
+            self.dropped += 1
+            logger.error(f'Notification queue is full, dropped {oldest.kind} notification for {oldest.channel}')
+
+        self.queue.put_nowait(job)
+
+    async def deliver(self, job: NotificationJob):
+        for attempt in range(1, self.retries + 1):
+            try:
+                await asyncio.wait_for(job.send(), timeout=job.timeout)
+                self.record(latency=time.monotonic() - job.queued_at)
+                return
+            except Exception as exc:
+                reason = f'timed out after {job.timeout}s' if isinstance(exc, asyncio.TimeoutError) else str(exc)
+                logger.error(f'Sending {job.kind} notification to {job.channel} failed on attempt {attempt}: {reason}')
+
+                if attempt == self.retries:
+                    self.failed += 1
+                    return
+
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def record(self, latency: float):
+        # From queued to sent, retries included
+        self.sent += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    async def work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.deliver(job=job)
+            finally:
+                self.queue.task_done()
+
+    async def drain(self, timeout: float = float(NOTIFY_DRAIN_TIMEOUT)):
+        if self.queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f'{self.queue.qsize()} notifications were not sent before exiting')
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+            'latency_max': self.latency_max
+        }
+
+
+_dispatchers: Dict[str, NotificationDispatcher] = {}
+
+
+def get_dispatcher(channel: str) -> NotificationDispatcher:
+    dispatcher = _dispatchers.get(channel)
+    if dispatcher is None:
+        dispatcher = NotificationDispatcher()
+        _dispatchers[channel] = dispatcher
+
+    return dispatcher
+
+
+async def drain_dispatchers(timeout: float = float(NOTIFY_DRAIN_TIMEOUT)):
+    await asyncio.gather(*[dispatcher.drain(timeout=timeout) for dispatcher in _dispatchers.values()])
+
+
+def dispatcher_stats() -> Dict[str, Dict[str, float]]:
+    return {channel: dispatcher.stats() for channel, dispatcher in _dispatchers.items()}
+
+
+class Dispatched(Notification):
+    """
+        Queues the notifications of a channel on the dispatcher instead of sending them right away.
+    """
+
+    def __init__(self, channel: Notification, dispatcher: NotificationDispatcher = None):
+        self.channel = channel
+        self.dispatcher = dispatcher or get_dispatcher(channel=channel.name)
+        self.name = channel.name
+        self.timeout = channel.timeout
+        self.app_name = channel.app_name
+        self.silent = channel.silent
+
+    async def dispatch(self, kind: str, send: Callable[[], Awaitable]):
+        await self.dispatcher.submit(NotificationJob(channel=self.name,
+                                                     kind=kind,
+                                                     send=send,
+                                                     timeout=self.timeout))
+
+    async def send_message(self, message: str):
+        await self.dispatch(kind='message',
+                            send=lambda: self.channel.send_message(message=message))
+
+    async def send_entry_notification(self, entry_price: str, modal_duid: str, order: dict = None):
+        await self.dispatch(kind='entry',
+                            send=lambda: self.channel.send_entry_notification(entry_price=entry_price,
+                                                                              modal_duid=modal_duid,
+                                                                              order=order))
+
+    async def send_exit_notification(self, entry_price: str, modal_duid: str, exit_price: str, stop_limit_price: str,
+                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None,
+                                     stopped: bool = None):
+        await self.dispatch(kind='exit',
+                            send=lambda: self.channel.send_exit_notification(entry_price=entry_price,
+                                                                             modal_duid=modal_duid,
+                                                                             exit_price=exit_price,
+                                                                             stop_limit_price=stop_limit_price,
+                                                                             settled=settled,
+                                                                             pnl_in_percent=pnl_in_percent,
+                                                                             stopped=stopped,
+                                                                             order=order))
+
+    async def send_digest(self, message: str, events: List[dict]):
+        await self.dispatch(kind='digest',
+                            send=lambda: self.channel.send_digest(message=message,
+                                                                  events=events))
@@ -1,18 +1,35 @@
 from abc import ABC, abstractmethod
-from os import getcwd
-from typing import Union
+from functools import lru_cache
+from os import environ, getcwd
+from typing import Dict, List, Union
+from neobabix.execution.orders import run_sync
 from neobabix.notifications.jokes import jokes
 import random
 import requests
 
+NOTIFY_TIMEOUT = environ.get('NOTIFY_TIMEOUT', '10')
+CHUCKNORRIS_TIMEOUT = environ.get('CHUCKNORRIS_TIMEOUT', '3')
+
+
+@lru_cache(maxsize=None)
+def app_version() -> str:
+    current_path = getcwd()
+    with open(f'{current_path}/version.txt', 'r') as f:
+        return f.readline()
+
 
 class Notification(ABC):
-    def __init__(self):
-        current_path = getcwd()
-        with open(f'{current_path}/version.txt', 'r') as f:
-            version = f.readline()
+    name = 'notification'
+    # Seconds a single delivery may take before the dispatcher gives up on it
+    timeout = float(NOTIFY_TIMEOUT)
+    # Whether sends go through the notification dispatcher, channels queueing on their own opt out
+    queued = True
 
-        self.app_name = f'NeoBabix/v{version}'
+    def __init__(self, context: Dict[str, str] = None):
+        # What this channel reports about, like the strategy and playbook, when it differs from the env vars
+        self.context = context or {}
+
+        self.app_name = f'NeoBabix/v{app_version()}'
         self.silent = False
 
     @abstractmethod
@@ -25,16 +42,21 @@ class Notification(ABC):
 
     @abstractmethod
     async def send_exit_notification(self, entry_price: str, modal_duid: str, exit_price: str, stop_limit_price: str,
-                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None):
+                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None,
+                                     stopped: bool = None):
         pass
 
-    def chucknorris(self):
+    async def send_digest(self, message: str, events: List[dict]):
+        # Channels taking structured payloads can send the events instead of the summary
+        await self.send_message(message=message)
+
+    async def chucknorris(self):
         url = 'https://api.chucknorris.io/jokes/random'
 
         try:
-            resp = requests.get(url)
+            resp = await run_sync(requests.get, url, timeout=float(CHUCKNORRIS_TIMEOUT))
             json = resp.json()
             joke = json.get('value')
             return joke
-        except requests.exceptions.RequestException:
+        except (requests.exceptions.RequestException, ValueError):
             return random.choice(jokes)
@@ -0,0 +1,95 @@
+import os
+from os import environ
+from string import Template
+from typing import Dict, Optional, Tuple
+
+from neobabix.logging import logger
+
+NOTIFY_TEMPLATES_DIR = environ.get('NOTIFY_TEMPLATES_DIR',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+NOTIFY_TEMPLATES_RELOAD = environ.get('NOTIFY_TEMPLATES_RELOAD', '0')
+
+StaticFields = Tuple[Tuple[str, str], ...]
+
+"""
+    Notification templates, read and compiled once.
+
+    Every template in NOTIFY_TEMPLATES_DIR is loaded on first use. Fields that never change for a channel, like the app
+    name, strategy, playbook and exchanges, are bound once per channel into a template of its own, a message only fills
+    in the per trade values.
+
+    With NOTIFY_TEMPLATES_RELOAD=1 templates are reloaded when their file changes, to edit messages without a restart.
+"""
+
+
+def static_fields(**fields) -> StaticFields:
+    return tuple(sorted((k, str(v)) for k, v in fields.items()))
+
+
+def bind(template: Template, fields: StaticFields) -> Template:
+    # Escape bound values, a dollar sign in a strategy name must not become a placeholder
+    return Template(template.safe_substitute({k: v.replace('$', '$$') for k, v in fields}))
+
+
+class TemplateRegistry:
+    def __init__(self, path: str = NOTIFY_TEMPLATES_DIR, reload: bool = NOTIFY_TEMPLATES_RELOAD == '1'):
+        self.path = path
+        self.reload = reload
+        self.templates: Dict[str, Template] = {}
+        self.mtimes: Dict[str, float] = {}
+        self.bound: Dict[Tuple[str, StaticFields], Template] = {}
+        self.loaded = False
+
+    def filename(self, name: str) -> str:
+        return os.path.join(self.path, f'{name}.txt')
+
+    def compile(self, name: str):
+        filename = self.filename(name=name)
+        with open(filename, 'r') as f:
+            self.templates[name] = Template(f.read())
+        self.mtimes[name] = os.path.getmtime(filename)
+
+        # Templates bound from the previous version are stale
+        for key in [key for key in self.bound.keys() if key[0] == name]:
+            self.bound.pop(key)
+
+    def load(self):
+        for entry in sorted(os.listdir(self.path)):
+            name, extension = os.path.splitext(entry)
+            if extension == '.txt':
+                self.compile(name=name)
+        self.loaded = True
+
+    def changed(self, name: str) -> bool:
+        try:
+            return os.path.getmtime(self.filename(name=name)) != self.mtimes.get(name)
+        except OSError:
+            return False
+
+    def get(self, name: str, fields: Optional[StaticFields] = None) -> Template:
+        if not self.loaded:
+            self.load()
+        if self.reload and self.changed(name=name):
+            logger.info(f'Reloading notification template {name}')
+            self.compile(name=name)
+
+        template = self.templates.get(name)
+        if template is None:
+            raise NotImplementedError(f'Notification template {name} does not exist')
+        if not fields:
+            return template
+
+        key = (name, fields)
+        bound = self.bound.get(key)
+        if bound is None:
+            bound = bind(template=template,
+                         fields=fields)
+            self.bound[key] = bound
+
+        return bound
+
+    def render(self, name: str, fields: Optional[StaticFields] = None, **values) -> str:
+        return self.get(name=name, fields=fields).substitute(values)
+
+
+template_registry = TemplateRegistry()
@@ -0,0 +1,23 @@
+from typing import Union
+
+from neobabix.logging import logger
+from neobabix.notifications.notification import Notification
+
+
+class Silent(Notification):
+    """
+        Logs notifications instead of sending them, used by shadow playbooks.
+    """
+    name = 'silent'
+
+    async def send_message(self, message: str):
+        logger.debug('Silent notification: %s', message)
+
+    async def send_entry_notification(self, entry_price: str, modal_duid: str, order: dict = None):
+        await self.send_message(message=f'entry at {entry_price} for {modal_duid}')
+
+    async def send_exit_notification(self, entry_price: str, modal_duid: str, exit_price: str, stop_limit_price: str,
+                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None,
+                                     stopped: bool = None):
+        await self.send_message(message=f'exit at {exit_price} / stop at {stop_limit_price} for entry {entry_price}, '
+                                        f'settled: {settled}, pnl: {pnl_in_percent}')
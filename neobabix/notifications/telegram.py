@@ -1,13 +1,15 @@
 from os import environ
-from string import Template
-from typing import Union
+from typing import Dict, Union
 
 import telepot
 
-from neobabix.notifications.notification import Notification
+from neobabix.execution.orders import run_sync
+from neobabix.notifications.notification import Notification, NOTIFY_TIMEOUT
+from neobabix.notifications.registry import static_fields, template_registry
 
 TELEGRAM_TOKEN = environ.get('TELEGRAM_TOKEN')
 TELEGRAM_USER_ID = environ.get('TELEGRAM_USER_ID')
+TELEGRAM_TIMEOUT = environ.get('TELEGRAM_TIMEOUT', NOTIFY_TIMEOUT)
 
 """
     How to create your own Telegram bot and get its token:
@@ -26,6 +28,21 @@ TELEGRAM_USER_ID = environ.get('TELEGRAM_USER_ID')
 
 
 class Telegram(Notification):
+    name = 'telegram'
+    timeout = float(TELEGRAM_TIMEOUT)
+
+    def __init__(self, context: Dict[str, str] = None):
+        super().__init__(context=context)
+
+        # Bound into the templates once, messages only fill in the trade
+        self.fields = static_fields(appname=self.app_name,
+                                    strategy=self.context.get('strategy', environ.get('STRATEGY')),
+                                    playbook=self.context.get('playbook', environ.get('PLAYBOOK')),
+                                    candles_exchange=self.context.get('candles_exchange',
+                                                                      environ.get('CANDLES_EXCHANGE')),
+                                    trades_exchange=self.context.get('trades_exchange',
+                                                                     environ.get('TRADES_EXCHANGE')))
+
     async def send_message(self, message: str):
         global TELEGRAM_TOKEN, TELEGRAM_USER_ID
         if not TELEGRAM_TOKEN:
@@ -38,68 +55,38 @@ class Telegram(Notification):
 
         bot = telepot.Bot(token=TELEGRAM_TOKEN)
 
-        bot.sendMessage(chat_id=TELEGRAM_USER_ID,
-                        text=message,
-                        parse_mode='HTML')
+        # telepot is synchronous, keep it off the event loop
+        await run_sync(bot.sendMessage,
+                       chat_id=TELEGRAM_USER_ID,
+                       text=message,
+                       parse_mode='HTML')
 
     async def send_entry_notification(self, entry_price: str, modal_duid: str, order: dict = None):
-        with open('neobabix/notifications/templates/telegram-entry-notification.txt', 'r') as f:
-            src = Template(f.read())
-            values = {
-                'appname': self.app_name,
-                'entryprice': entry_price,
-                'modalduid': modal_duid,
-                'strategy': environ.get('STRATEGY'),
-                'playbook': environ.get('PLAYBOOK'),
-                'candles_exchange': environ.get('CANDLES_EXCHANGE'),
-                'trades_exchange': environ.get('TRADES_EXCHANGE'),
-                'chucknorris': self.chucknorris()
-            }
-
-            message = src.substitute(values)
-
-            await self.send_message(message=message)
+        message = template_registry.render(name='telegram-entry-notification',
+                                           fields=self.fields,
+                                           entryprice=entry_price,
+                                           modalduid=modal_duid,
+                                           chucknorris=await self.chucknorris())
+
+        await self.send_message(message=message)
 
     async def send_exit_notification(self, entry_price: str, modal_duid: str, exit_price: str, stop_limit_price: str,
-                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None):
-        if not settled:
-            with open('neobabix/notifications/templates/telegram-exit-notification.txt', 'r') as f:
-                src = Template(f.read())
-                values = {
-                    'appname': self.app_name,
-                    'entryprice': entry_price,
-                    'modalduid': modal_duid,
-                    'stopprice': stop_limit_price,
-                    'exitprice': exit_price,
-                    'settled': 'Yes' if settled else 'No',
-                    'strategy': environ.get('STRATEGY'),
-                    'playbook': environ.get('PLAYBOOK'),
-                    'candles_exchange': environ.get('CANDLES_EXCHANGE'),
-                    'trades_exchange': environ.get('TRADES_EXCHANGE'),
-                    'chucknorris': self.chucknorris()
-                }
-
-                message = src.substitute(values)
-
-                await self.send_message(message=message)
-        else:
-            with open('neobabix/notifications/templates/telegram-exit-notification-settled.txt', 'r') as f:
-                src = Template(f.read())
-                values = {
-                    'appname': self.app_name,
-                    'entryprice': entry_price,
-                    'modalduid': modal_duid,
-                    'stopprice': stop_limit_price,
-                    'exitprice': exit_price,
-                    'settled': 'Yes' if settled else 'No',
-                    'pnl': pnl_in_percent,
-                    'strategy': environ.get('STRATEGY'),
-                    'playbook': environ.get('PLAYBOOK'),
-                    'candles_exchange': environ.get('CANDLES_EXCHANGE'),
-                    'trades_exchange': environ.get('TRADES_EXCHANGE'),
-                    'chucknorris': self.chucknorris()
-                }
-
-                message = src.substitute(values)
-
-                await self.send_message(message=message)
+                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None,
+                                     stopped: bool = None):
+        values = {
+            'entryprice': entry_price,
+            'modalduid': modal_duid,
+            'stopprice': stop_limit_price,
+            'exitprice': exit_price,
+            'settled': 'Yes' if settled else 'No',
+            'chucknorris': await self.chucknorris()
+        }
+        if settled:
+            values['pnl'] = pnl_in_percent
+
+        message = template_registry.render(name='telegram-exit-notification-settled' if settled
+                                           else 'telegram-exit-notification',
+                                           fields=self.fields,
+                                           **values)
+
+        await self.send_message(message=message)
@@ -1,48 +1,129 @@
-from os import environ, getcwd
-from typing import Union
+import asyncio
+from os import environ
+from typing import List, Optional, Union
 import json
 
 import aiohttp
 
 from neobabix.logging import logger
 from neobabix.constants import USER_AGENT
-from neobabix.notifications.notification import Notification
+from neobabix.notifications.dispatcher import NotificationJob, get_dispatcher
+from neobabix.notifications.notification import Notification, NOTIFY_TIMEOUT, app_version
 
 WEBHOOK_URL = environ.get('WEBHOOK_URL')
+WEBHOOK_TIMEOUT = environ.get('WEBHOOK_TIMEOUT', NOTIFY_TIMEOUT)
+WEBHOOK_CONCURRENCY = environ.get('WEBHOOK_CONCURRENCY', '4')
+WEBHOOK_BATCH_WINDOW = environ.get('WEBHOOK_BATCH_WINDOW', '0')
+WEBHOOK_BATCH_SIZE = environ.get('WEBHOOK_BATCH_SIZE', '50')
 
+"""
+    Webhook notifications are posted as JSON through one long lived HTTP session, connections are kept alive and at
+    most WEBHOOK_CONCURRENCY posts are in flight at once. Payloads are serialized once, when the event happens.
 
-class Webhook(Notification):
-    @staticmethod
-    async def post_webhook(data: dict):
-        global WEBHOOK_URL
-        if not WEBHOOK_URL:
+    With WEBHOOK_BATCH_WINDOW set to a number of seconds, events within that window are posted together as one JSON
+    array, up to WEBHOOK_BATCH_SIZE events per post. Candle closes make many bots notify at once, batching turns those
+    bursts into a few requests. Batched events are buffered here and only whole batches are queued on the dispatcher,
+    every event is queued once.
+
+    Failed posts, on network errors, timeouts, 429 and 5xx responses, are retried by the notification dispatcher.
+"""
+
+
+class WebhookClient:
+    def __init__(self, url: Optional[str] = WEBHOOK_URL, timeout: float = float(WEBHOOK_TIMEOUT),
+                 concurrency: int = int(WEBHOOK_CONCURRENCY), batch_window: float = float(WEBHOOK_BATCH_WINDOW),
+                 batch_size: int = int(WEBHOOK_BATCH_SIZE)):
+        self.url = url
+        self.timeout = timeout
+        self.concurrency = max(concurrency, 1)
+        self.batch_window = batch_window
+        self.batch_size = max(batch_size, 1)
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.pending: List[str] = []
+        self.flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_window > 0
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # Created on first use, the session belongs to the running event loop
+        if self.session is None or self.session.closed:
+            headers = {
+                'User-Agent': f'{USER_AGENT}/v{app_version()}',
+                'Content-Type': 'application/json'
+            }
+            self.session = aiohttp.ClientSession(headers=headers,
+                                                 connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def post(self, body: str):
+        async with self.get_session().post(self.url, data=body.encode('utf-8')) as response:
+            if response.status == 429 or response.status >= 500:
+                raise aiohttp.ClientResponseError(request_info=response.request_info,
+                                                  history=response.history,
+                                                  status=response.status,
+                                                  message=response.reason)
+            if response.status >= 400:
+                # The receiver will not take it better the second time
+                logger.error(f'Webhook was rejected with HTTP {response.status}')
+                return
+
+            logger.info('HTTP Webhook sent')
+
+    async def send(self, body: str):
+        if not self.url:
             return
 
-        current_path = getcwd()
-        with open(f'{current_path}/version.txt', 'r') as f:
-            version = f.readline()
-
-        headers = {
-            'User-Agent': f'{USER_AGENT}/v{version}',
-            'Content-Type': 'application/json'
-        }
-
-        try:
-            async with aiohttp.ClientSession(headers=headers) as session:
-                async with session.post(WEBHOOK_URL,
-                                        json=data):
-                    logger.info('HTTP Webhook sent')
-        except aiohttp.client.ClientError:
-            logger.error('Error while trying to post webhook')
-        except Exception:
-            logger.error('Unrecoverable error while trying to post webhook')
+        if not self.batching:
+            return await self.post(body=body)
 
-    async def send_message(self, message: str):
-        data = json.loads(message)
-        if data.get('notification_type') == 'entry':
-            return await Webhook.post_webhook(data=data)
+        self.pending.append(body)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        elif self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.batch_window)
+        await self.flush()
 
-        return await Webhook.post_webhook(data=data)
+    async def flush(self):
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            self.pending = self.pending[self.batch_size:]
+
+            # Events are already serialized, the batch is only joined
+            body = f'[{",".join(batch)}]'
+            await get_dispatcher(channel=Webhook.name).submit(NotificationJob(channel=Webhook.name,
+                                                                              kind=f'batch of {len(batch)}',
+                                                                              send=lambda b=body: self.post(body=b),
+                                                                              timeout=self.timeout))
+
+    async def close(self):
+        if self.flush_task is not None and not self.flush_task.done():
+            self.flush_task.cancel()
+        await self.flush()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+webhook_client = WebhookClient()
+
+
+class Webhook(Notification):
+    name = 'webhook'
+    timeout = float(WEBHOOK_TIMEOUT)
+
+    @property
+    def queued(self) -> bool:
+        # Batches are queued by the client, queueing events as well would queue them twice
+        return not webhook_client.batching
+
+    async def send_message(self, message: str):
+        await webhook_client.send(body=message)
 
     async def send_entry_notification(self, entry_price: str, modal_duid: str, order: dict = None):
         message = json.dumps({
@@ -50,11 +131,12 @@ class Webhook(Notification):
             'modal_duid': modal_duid,
             'notification_type': 'entry',
             'order': order
-        })
+        }, default=str)
         await self.send_message(message=message)
 
     async def send_exit_notification(self, entry_price: str, modal_duid: str, exit_price: str, stop_limit_price: str,
-                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None):
+                                     settled: bool, pnl_in_percent: Union[int, float, str] = None, order: dict = None,
+                                     stopped: bool = None):
         message = json.dumps({
             'entry_price': entry_price,
             'modal_duid': modal_duid,
@@ -62,7 +144,14 @@ class Webhook(Notification):
             'stop_limit_price': stop_limit_price,
             'settled': settled,
             'pnl_in_percent': pnl_in_percent,
+            'stopped': stopped,
             'notification_type': 'exit',
             'order': order
-        })
+        }, default=str)
         await self.send_message(message=message)
+
+    async def send_digest(self, message: str, events: List[dict]):
+        await self.send_message(message=json.dumps({
+            'notification_type': 'digest',
+            'events': events
+        }, default=str))
@@ -1,7 +1,6 @@
 from asyncio import Lock
 from logging import Logger
 from decimal import Decimal
-from os import environ
 
 from ccxt.base.exchange import Exchange
 
@@ -9,8 +8,6 @@ from neobabix import Actions
 from neobabix.playbooks.playbook import Playbook
 from neobabix.notifications.notification import Notification
 
-MODAL_DUID = environ.get('MODAL_DUID')
-
 
 class DCA(Playbook):
     __name__ = 'DCA'
@@ -19,16 +16,17 @@ class DCA(Playbook):
 
     def __init__(self, action: Actions, exchange: Exchange, trade_lock: Lock, logger: Logger, symbol: str,
                  timeframe: str, notification: Notification, recursive: bool = False, leverage: int = None,
-                 ohlcv: dict = None):
+                 ohlcv: dict = None, params: dict = None):
         super().__init__(action, exchange, trade_lock, logger, symbol, timeframe, notification, recursive, leverage,
-                         ohlcv)
+                         ohlcv, params)
 
         if action == Actions.SHORT:
             raise RuntimeError('DCA Playbook is not configured to Short')
-        if not MODAL_DUID:
+        modal_duid = self.env('MODAL_DUID')
+        if not modal_duid:
             raise ValueError('MODAL_DUID env var must be present')
 
-        self.modal_duid = Decimal(MODAL_DUID)
+        self.modal_duid = Decimal(modal_duid)
 
     @property
     def base_currency(self) -> str:
@@ -51,35 +49,36 @@ class DCA(Playbook):
             self.logger.info(f'Not going to enter trade, not enough balance: {free_balance}')
             return
 
-        # Safe amount
-        amount = Decimal(self.modal_duid)
-        assert amount > self.min_amount
-        assert amount < self.max_amount
-
         if self.action == Actions.LONG:
             self.logger.info('Entering a LONG position')
 
+            closes = self.ohlcv.get('closes')
+            if len(closes) == 0:
+                raise ValueError('No close price detected')
+            price = closes[-1]
+
             try:
-                price = self.ohlcv.get('closes')[-1]
-                amount = self.round_decimals_down(float(self.modal_duid / Decimal(price)))
+                amount = self.sizer.amount_for_cost(cost=self.modal_duid,
+                                                    price=price)
+                if not self.sizer.within_limits(amount=amount, price=Decimal(str(price))):
+                    self.logger.info(f'Not going to enter trade, amount {amount} is out of the market limits')
+                    return
+
                 self.logger.info(f'Trying to market buy at {price} with amount {amount}')
-                self.order_entry = await self.market_buy_order(amount=amount)
+                self.order_entry = await self.market_buy_order(amount=float(amount))
             except AttributeError:
-                price = self.ohlcv.get('closes')
-                if len(price) == 0:
-                    raise ValueError('No close price detected')
+                marked_up, amount = self.sizer.size(cost=self.modal_duid,
+                                                    price=price,
+                                                    markup='0.01')
+                if not self.sizer.within_limits(amount=amount, price=marked_up):
+                    self.logger.info(f'Not going to enter trade, amount {amount} is out of the market limits')
+                    return
 
-                marked_up = self.round_decimals_down(number=float(Decimal(price[0]) * Decimal(1.01)),
-                                                     decimals=self.price_precision)
                 self.logger.info(f'Buying using marked up price: {marked_up} / Precision: {self.price_precision}')
+                self.logger.info(f'Amount: {amount} / Precision: {self.amount_precision}')
 
-                amount = self.round_decimals_down(number=float(Decimal(amount) / Decimal(marked_up)),
-                                                  decimals=self.amount_precision)
-                self.logger.info(f'Amount: {amount:.8f} / Precision: {self.amount_precision}')
-
-                entry = await self.limit_buy_order(price=marked_up,
-                                                   amount=amount)
-                print(entry)
+                entry = await self.limit_buy_order(price=float(marked_up),
+                                                   amount=float(amount))
                 self.order_entry = await self.get_order(order_id=entry.get('id'))
 
     async def after_entry(self):
@@ -1,17 +1,14 @@
 from asyncio import Lock
 from logging import Logger
-from os import environ
 from decimal import Decimal
 
-from ccxt import Exchange, TRUNCATE
+from ccxt import Exchange
 
+from neobabix.execution.sizing import to_decimal
 from neobabix.playbooks.playbook import Playbook
 from neobabix.strategies.strategy import Actions
 from neobabix.notifications.notification import Notification
 from neobabix.indicators.billwilliams import UpFractal, DownFractal
-from neobabix.constants import BETWEEN_ORDERS_SLEEP
-
-import asyncio
 
 
 class Fractalism(Playbook):
@@ -29,27 +26,23 @@ class Fractalism(Playbook):
         Env Vars:
             - TAKE_PROFIT_IN_PERCENT - required - float - ex: 1.0
             - MODAL_DUID - required - float - ex: 1000.0
-            - PRICE_DECIMAL_PLACES - required - integer - ex: 0
     """
 
     def __init__(self, action: Actions, exchange: Exchange, trade_lock: Lock, logger: Logger, symbol: str,
-                 timeframe: str, notification: Notification, ohlcv, recursive: bool = False, leverage: int = None):
+                 timeframe: str, notification: Notification, ohlcv, recursive: bool = False, leverage: int = None,
+                 params: dict = None):
         super().__init__(action, exchange, trade_lock, logger, symbol, timeframe, notification, recursive, leverage,
-                         ohlcv)
+                         ohlcv, params)
 
-        self.tp_in_percent = environ.get('TAKE_PROFIT_IN_PERCENT')
+        self.tp_in_percent = self.env('TAKE_PROFIT_IN_PERCENT')
         if not self.tp_in_percent:
             raise NotImplementedError('Required env var TAKE_PROFIT_IN_PERCENT must be set')
         self.tp_in_percent = float(self.tp_in_percent)
 
-        self.modal_duid = environ.get('MODAL_DUID')
+        self.modal_duid = self.env('MODAL_DUID')
         if not self.modal_duid:
             raise NotImplementedError('Required env var MODAL_DUID must be set')
 
-        self.price_decimal_places = int(environ.get('PRICE_DECIMAL_PLACES'))
-        if not self.price_decimal_places and not self.price_decimal_places == 0:
-            raise NotImplementedError('Required env var PRICE_DECIMAL_PLACES must be set')
-
         self.up_fractals = UpFractal(highs=ohlcv.get('highs'))
         self.down_fractals = DownFractal(lows=ohlcv.get('lows'))
 
@@ -78,17 +71,13 @@ class Fractalism(Playbook):
 
         exit_price = None
         if self.action == Actions.LONG:
-            exit_price = Decimal(self.entry_price) * Decimal(self.tp_in_percent + 100.0) / Decimal(100)
-            exit_price = float(exit_price)
-            exit_price = self.exchange.decimal_to_precision(n=exit_price,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
+            exit_price = to_decimal(self.entry_price) * to_decimal(self.tp_in_percent + 100.0) / Decimal(100)
+            exit_price = self.sizer.price_away(value=exit_price,
+                                               above=True)
         elif self.action == Actions.SHORT:
-            exit_price = Decimal(self.entry_price) * Decimal(100.0 - self.tp_in_percent) / Decimal(100)
-            exit_price = float(exit_price)
-            exit_price = self.exchange.decimal_to_precision(n=exit_price,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
+            exit_price = to_decimal(self.entry_price) * to_decimal(100.0 - self.tp_in_percent) / Decimal(100)
+            exit_price = self.sizer.price_away(value=exit_price,
+                                               above=False)
         return exit_price
 
     @property
@@ -98,13 +87,11 @@ class Fractalism(Playbook):
 
         stop_price = None
         if self.action == Actions.LONG:
-            stop_price = self.exchange.decimal_to_precision(n=self.last_valid_down_fractal,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
+            stop_price = self.sizer.price_away(value=self.last_valid_down_fractal,
+                                               above=False)
         elif self.action == Actions.SHORT:
-            stop_price = self.exchange.decimal_to_precision(n=self.last_valid_up_fractal,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
+            stop_price = self.sizer.price_away(value=self.last_valid_up_fractal,
+                                               above=True)
         return stop_price
 
     @property
@@ -114,15 +101,13 @@ class Fractalism(Playbook):
 
         stop_action_price = None
         if self.action == Actions.LONG:
-            stop_action_price = self.last_valid_down_fractal - 10.0
-            stop_action_price = self.exchange.decimal_to_precision(n=stop_action_price,
-                                                                   rounding_mode=TRUNCATE,
-                                                                   precision=self.price_decimal_places)
+            stop_action_price = to_decimal(self.last_valid_down_fractal) - Decimal(10)
+            stop_action_price = self.sizer.price_away(value=stop_action_price,
+                                                      above=False)
         elif self.action == Actions.SHORT:
-            stop_action_price = self.last_valid_up_fractal + 10.0
-            stop_action_price = self.exchange.decimal_to_precision(n=stop_action_price,
-                                                                   rounding_mode=TRUNCATE,
-                                                                   precision=self.price_decimal_places)
+            stop_action_price = to_decimal(self.last_valid_up_fractal) + Decimal(10)
+            stop_action_price = self.sizer.price_away(value=stop_action_price,
+                                                      above=True)
 
         return stop_action_price
 
@@ -147,9 +132,6 @@ class Fractalism(Playbook):
         await self.notification.send_entry_notification(entry_price=str(self.order_entry.get('price')),
                                                         modal_duid=str(self.modal_duid))
 
-        self.info(f'Sleeping for {BETWEEN_ORDERS_SLEEP} seconds before submitting exit/stop orders')
-        await asyncio.sleep(BETWEEN_ORDERS_SLEEP)
-
     async def exit(self):
         self.info('Going to execute exit')
 
@@ -166,18 +148,13 @@ class Fractalism(Playbook):
         self.info(f'Stop Price: {self.stop_price}')
         self.info(f'Stop Sell Price: {self.stop_action_price}')
 
-        # TP
-        self.order_exit = await exit_order_method(amount=self.modal_duid,
-                                                  price=self.exit_price)
-
-        self.info(f'Sleeping for {BETWEEN_ORDERS_SLEEP} seconds before submitting stop order')
-        await asyncio.sleep(BETWEEN_ORDERS_SLEEP)
-
-        # Stop
-        self.order_stop = await stop_order_method(amount=self.modal_duid,
-                                                  stop_price=self.stop_price,
-                                                  stop_action_price=self.stop_action_price,
-                                                  base_price=self.entry_price)
+        await self.submit_exit_and_stop(exit_order_method=exit_order_method,
+                                        stop_order_method=stop_order_method,
+                                        amount=self.entry_amount,
+                                        exit_price=self.exit_price,
+                                        stop_price=self.stop_price,
+                                        stop_action_price=self.stop_action_price,
+                                        base_price=self.entry_price)
 
         self.info('TP and SL orders are created')
 
@@ -225,18 +202,11 @@ class Fractalism(Playbook):
                                                            pnl_in_percent='n/a')
             return
 
-        pnl = None
-
-        if self.action == Actions.LONG and won:
-            pnl = exit_price / entry_price * Decimal(100) - Decimal(100)
-        elif self.action == Actions.LONG and not won:
-            pnl = (entry_price / exit_price * Decimal(100) - Decimal(100)) * Decimal(-1)
-        elif self.action == Actions.SHORT and won:
-            pnl = entry_price / exit_price * Decimal(100) - Decimal(100)
-        elif self.action == Actions.SHORT and not won:
-            pnl = (exit_price / entry_price * Decimal(100) - Decimal(100)) * Decimal(-1)
-
-        pnl = float(pnl)
+        pnl = float(self.notified_pnl_in_percent(entry_price=entry_price,
+                                                 exit_price=exit_price,
+                                                 won=won))
+        self.record_trade(exit_price=exit_price,
+                          amount=self.entry_amount)
 
         self.info('Sending exit notification')
         await self.notification.send_exit_notification(entry_price=str(self.entry_price),
@@ -244,4 +214,5 @@ class Fractalism(Playbook):
                                                        stop_limit_price=str(self.stop_price),
                                                        modal_duid=str(self.modal_duid),
                                                        settled=True,
-                                                       pnl_in_percent=pnl)
+                                                       pnl_in_percent=pnl,
+                                                       stopped=not won)
@@ -1,16 +1,14 @@
 from asyncio import Lock
 from logging import Logger
-from os import environ
 from decimal import Decimal
 
-from ccxt import Exchange, TRUNCATE
+from ccxt import Exchange
 
+from neobabix.execution.sizing import to_decimal
 from neobabix.playbooks.playbook import Playbook
 from neobabix.strategies.strategy import Actions
 from neobabix.notifications.notification import Notification
 
-import asyncio
-
 
 class HitAndRun(Playbook):
     __name__ = 'HitAndRun Playbook'
@@ -28,35 +26,30 @@ class HitAndRun(Playbook):
             - TAKE_PROFIT_IN_PERCENT - required - float - ex: 1.0
             - STOP_IN_PERCENT - required - float - ex: 0.5
             - MODAL_DUID - required - float - ex: 1000.0
-            - PRICE_DECIMAL_PLACES - required - integer - ex: 0
             - STOP_LIMIT_DIFF - required - float - ex: 10.0
     """
 
     def __init__(self, action: Actions, exchange: Exchange, trade_lock: Lock, logger: Logger, symbol: str,
                  timeframe: str, notification: Notification, recursive: bool = False, leverage: int = None,
-                 ohlcv: dict = None):
+                 ohlcv: dict = None, params: dict = None):
         super().__init__(action, exchange, trade_lock, logger, symbol, timeframe, notification, recursive, leverage,
-                         ohlcv)
+                         ohlcv, params)
 
-        self.tp_in_percent = environ.get('TAKE_PROFIT_IN_PERCENT')
+        self.tp_in_percent = self.env('TAKE_PROFIT_IN_PERCENT')
         if not self.tp_in_percent:
             raise NotImplementedError('Required env var TAKE_PROFIT_IN_PERCENT must be set')
         self.tp_in_percent = float(self.tp_in_percent)
 
-        self.stop_in_percent = environ.get('STOP_IN_PERCENT')
+        self.stop_in_percent = self.env('STOP_IN_PERCENT')
         if not self.stop_in_percent:
             raise NotImplementedError('Required env var STOP_IN_PERCENT must be set')
         self.stop_in_percent = float(self.stop_in_percent)
 
-        self.modal_duid = environ.get('MODAL_DUID')
+        self.modal_duid = self.env('MODAL_DUID')
         if not self.modal_duid:
             raise NotImplementedError('Required env var MODAL_DUID must be set')
 
-        self.price_decimal_places = int(environ.get('PRICE_DECIMAL_PLACES'))
-        if not self.price_decimal_places and not self.price_decimal_places == 0:
-            raise NotImplementedError('Required env var PRICE_DECIMAL_PLACES must be set')
-
-        self.stop_limit_diff = environ.get('STOP_LIMIT_DIFF')
+        self.stop_limit_diff = self.env('STOP_LIMIT_DIFF')
         if not self.stop_limit_diff:
             raise NotImplementedError('Required env var STOP_LIMIT_DIFF must be set')
         self.stop_limit_diff = float(self.stop_limit_diff)
@@ -82,73 +75,54 @@ class HitAndRun(Playbook):
         await self.notification.send_entry_notification(entry_price=str(self.order_entry.get('price')),
                                                         modal_duid=str(self.modal_duid))
 
-        await asyncio.sleep(1)
-
     async def exit(self):
         self.info('Going to execute exit')
 
+        entry_price = to_decimal(self.order_entry.get('price'))
         if self.action == Actions.LONG:
-            exit_price = Decimal(self.order_entry.get('price')) * Decimal(self.tp_in_percent + 100.0) / Decimal(100)
-            exit_price = float(exit_price)
-            exit_price = self.exchange.decimal_to_precision(n=exit_price,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
+            exit_price = entry_price * to_decimal(self.tp_in_percent + 100.0) / Decimal(100)
+            exit_price = self.sizer.price_away(value=exit_price,
+                                               above=True)
             self.info(f'Exit Price: {exit_price}')
 
-            stop_price = Decimal(self.order_entry.get('price')) * Decimal(100.0 - self.stop_in_percent) / Decimal(100)
-            stop_price = float(stop_price)
-            stop_sell_price = stop_price - self.stop_limit_diff
-            stop_price = self.exchange.decimal_to_precision(n=stop_price,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
-            stop_sell_price = self.exchange.decimal_to_precision(n=stop_sell_price,
-                                                                 rounding_mode=TRUNCATE,
-                                                                 precision=self.price_decimal_places)
+            stop_price = entry_price * to_decimal(100.0 - self.stop_in_percent) / Decimal(100)
+            stop_sell_price = stop_price - to_decimal(self.stop_limit_diff)
+            stop_price = self.sizer.price_away(value=stop_price,
+                                               above=False)
+            stop_sell_price = self.sizer.price_away(value=stop_sell_price,
+                                                    above=False)
             self.info(f'Stop Price: {stop_price}')
             self.info(f'Stop Sell Price: {stop_sell_price}')
 
-            # TP
-            self.order_exit = await self.limit_sell_order(amount=self.modal_duid,
-                                                          price=exit_price)
-
-            await asyncio.sleep(1)
-
-            # Stop
-            self.order_stop = await self.limit_stop_sell_order(amount=self.modal_duid,
-                                                               stop_price=stop_price,
-                                                               sell_price=stop_sell_price,
-                                                               base_price=self.order_entry.get('price'))
+            await self.submit_exit_and_stop(exit_order_method=self.limit_sell_order,
+                                            stop_order_method=self.limit_stop_sell_order,
+                                            amount=self.entry_amount,
+                                            exit_price=exit_price,
+                                            stop_price=stop_price,
+                                            stop_action_price=stop_sell_price,
+                                            base_price=self.order_entry.get('price'))
         elif self.action == Actions.SHORT:
-            exit_price = Decimal(self.order_entry.get('price')) * Decimal(100.0 - self.tp_in_percent) / Decimal(100)
-            exit_price = float(exit_price)
-            exit_price = self.exchange.decimal_to_precision(n=exit_price,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
+            exit_price = entry_price * to_decimal(100.0 - self.tp_in_percent) / Decimal(100)
+            exit_price = self.sizer.price_away(value=exit_price,
+                                               above=False)
             self.info(f'Exit Price: {exit_price}')
 
-            stop_price = Decimal(self.order_entry.get('price')) * Decimal(self.tp_in_percent + 100.0) / Decimal(100)
-            stop_price = float(stop_price)
-            stop_buy_price = stop_price + self.stop_limit_diff
-            stop_price = self.exchange.decimal_to_precision(n=stop_price,
-                                                            rounding_mode=TRUNCATE,
-                                                            precision=self.price_decimal_places)
-            stop_buy_price = self.exchange.decimal_to_precision(n=stop_buy_price,
-                                                                rounding_mode=TRUNCATE,
-                                                                precision=self.price_decimal_places)
+            stop_price = entry_price * to_decimal(self.tp_in_percent + 100.0) / Decimal(100)
+            stop_buy_price = stop_price + to_decimal(self.stop_limit_diff)
+            stop_price = self.sizer.price_away(value=stop_price,
+                                               above=True)
+            stop_buy_price = self.sizer.price_away(value=stop_buy_price,
+                                                   above=True)
             self.info(f'Stop Price: {stop_price}')
             self.info(f'Stop Buy Price: {stop_buy_price}')
 
-            # TP
-            self.order_exit = await self.limit_buy_order(amount=self.modal_duid,
-                                                         price=exit_price)
-
-            await asyncio.sleep(1)
-
-            # Stop
-            self.order_stop = await self.limit_stop_buy_order(amount=self.modal_duid,
-                                                              stop_price=stop_price,
-                                                              buy_price=stop_buy_price,
-                                                              base_price=self.order_entry.get('price'))
+            await self.submit_exit_and_stop(exit_order_method=self.limit_buy_order,
+                                            stop_order_method=self.limit_stop_buy_order,
+                                            amount=self.entry_amount,
+                                            exit_price=exit_price,
+                                            stop_price=stop_price,
+                                            stop_action_price=stop_buy_price,
+                                            base_price=self.order_entry.get('price'))
 
             self.info('TP and SL orders are created')
 
@@ -196,18 +170,11 @@ class HitAndRun(Playbook):
                                                            pnl_in_percent='n/a')
             return
 
-        pnl = None
-
-        if self.action == Actions.LONG and won:
-            pnl = exit_price / entry_price * Decimal(100) - Decimal(100)
-        elif self.action == Actions.LONG and not won:
-            pnl = (entry_price / exit_price * Decimal(100) - Decimal(100)) * Decimal(-1)
-        elif self.action == Actions.SHORT and won:
-            pnl = entry_price / exit_price * Decimal(100) - Decimal(100)
-        elif self.action == Actions.SHORT and not won:
-            pnl = (exit_price / entry_price * Decimal(100) - Decimal(100)) * Decimal(-1)
-
-        pnl = int(pnl)
+        pnl = float(self.notified_pnl_in_percent(entry_price=entry_price,
+                                                 exit_price=exit_price,
+                                                 won=won))
+        self.record_trade(exit_price=exit_price,
+                          amount=self.entry_amount)
 
         self.info('Sending exit notification')
         await self.notification.send_exit_notification(entry_price=self.order_entry.get('price'),
@@ -215,4 +182,5 @@ class HitAndRun(Playbook):
                                                        stop_limit_price=self.order_stop.get('price'),
                                                        modal_duid=self.modal_duid,
                                                        settled=True,
-                                                       pnl_in_percent=pnl)
+                                                       pnl_in_percent=pnl,
+                                                       stopped=not won)
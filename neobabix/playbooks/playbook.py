@@ -1,19 +1,34 @@
 import asyncio
-import math
 from abc import ABC, abstractmethod
 from asyncio import Lock
-from datetime import datetime
-from logging import Logger
-from typing import Union
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from logging import DEBUG, Logger
+from os import environ
+from typing import Dict, List, Optional, Union
 from decimal import Decimal
 
 import ccxt
 from ccxt.base.exchange import Exchange
-from functional import seq
 
-from neobabix.models.ccxt import CurrencyInfo, PrecisionField
+from neobabix.analytics.ledger import Ledger, ledger as default_ledger
+from neobabix.analytics.performance import summarize
+from neobabix.analytics.shadow import FillReport, LIVE
+from neobabix.cache.market import market_cache
+from neobabix.exchanges.simulated import SimulatedExchange, market_feed
+from neobabix.execution.algorithms import ExecutionAlgorithm, get_execution_algorithm, EXECUTION_ALGORITHM, \
+    EXECUTION_SLICES, EXECUTION_DURATION, EXECUTION_CONCURRENCY, EXECUTION_CHILD_TIMEOUT
+from neobabix.execution.leverage import ensure_leverage
+from neobabix.execution.orders import OrderSubmitter, run_sync
+from neobabix.execution.prewarm import warm_state
+from neobabix.execution.sizing import OrderSizer, get_order_sizer
+from neobabix.execution.slippage import SlippageGuard, SLIPPAGE_MAX_BPS, SLIPPAGE_ACTION, ABORT, DOWNSIZE, LIMIT
+from neobabix.execution.watcher import get_order_watcher
+from neobabix.logging import set_log_context
+from neobabix.models.ccxt import Market, find_market
 from neobabix.notifications.notification import Notification
 from neobabix.strategies.strategy import Actions
+from neobabix.telemetry.metrics import orders_total, span
 
 
 class Playbook(ABC):
@@ -32,7 +47,7 @@ class Playbook(ABC):
 
     def __init__(self, action: Actions, exchange: Exchange, trade_lock: Lock, logger: Logger, symbol: str,
                  timeframe: str, notification: Notification, recursive: bool = False, leverage: int = None,
-                 ohlcv: dict = None):
+                 ohlcv: dict = None, params: dict = None):
         self.action = action
         if self.action != Actions.LONG and self.action != Actions.SHORT:
             raise NotImplementedError('Supported actions are LONG and SHORT')
@@ -41,38 +56,76 @@ class Playbook(ABC):
         self.trade_lock = trade_lock
         self.logger = logger
         self.recursive = recursive
+        # Locks can be shared by several bots, only the playbook which acquired it releases it
+        self.holds_trade_lock = False
         self.symbol = symbol
         self.timeframe = timeframe
         self.leverage = leverage
         self.notification = notification
         self.ohlcv = ohlcv
-
-        # Currency Info
-        market_info = seq(self.exchange.fetch_markets()) \
-            .filter(lambda x: x.get('symbol') == symbol) \
-            .map(lambda x: CurrencyInfo(**x)) \
-            .to_list()
-        if len(market_info) == 0:
+        self.params = params or {}
+
+        # Currency Info, prewarmed ahead of the candle close when possible
+        currency_info = warm_state.get_currency_info(exchange=self.exchange,
+                                                     symbol=symbol)
+        if currency_info is None:
+            markets = self.exchange.fetch_markets()
+            if self.publishes_market_data:
+                market_feed.update_markets(exchange_id=self.exchange.id, markets=markets)
+            currency_info = find_market(exchange_id=self.exchange.id,
+                                        markets=markets,
+                                        symbol=symbol)
+        if currency_info is None:
             raise NotImplementedError('Market info is not implemented in this exchange, bailing')
-        self.currency_info: CurrencyInfo = market_info[0]
+        self.currency_info: Market = currency_info
+        self.sizer = get_order_sizer(currency_info=currency_info,
+                                     precision_mode=self.exchange.precisionMode)
 
         # Orders
         self.order_entry = {}
         self.order_exit = {}
         self.order_stop = {}
+        self.order_submitter = OrderSubmitter(exchange=exchange,
+                                              symbol=symbol,
+                                              logger=logger)
 
         self.execution_start_time = datetime.utcnow()
+        self.ledger: Ledger = default_ledger
+
+        # Shadow trading
+        self.fill_report: Union[FillReport, None] = None
+        self.fill_source = LIVE
+        self.signal_time = self.execution_start_time
 
     async def play(self):
+        set_log_context(symbol=self.symbol, trade_id=self.trade_id)
+
         # Acquire lock immediately
         if not self.trade_lock.locked():
             self.info('Acquiring trade lock')
             await self.trade_lock.acquire()
-
-        await self.entry()
-        await self.after_entry()
-        await self.exit()
-        await self.after_exit()
+            self.holds_trade_lock = True
+
+        with self.span(stage='entry'):
+            await self.entry()
+        if not self.order_entry:
+            self.info('No entry was made, bailing out')
+            if not self.recursive:
+                await self.release_trade_lock()
+            return
+
+        self.count_order(role='entry', order=self.order_entry)
+        self.record_fill(role='entry', order=self.order_entry)
+        with self.span(stage='after_entry'):
+            await self.after_entry()
+        with self.span(stage='exit'):
+            await self.exit()
+        self.count_order(role='exit', order=self.order_exit)
+        self.count_order(role='stop', order=self.order_stop)
+        with self.span(stage='after_exit'):
+            await self.after_exit()
+        self.record_fill(role='exit', order=self.order_exit)
+        self.record_fill(role='stop', order=self.order_stop)
 
         if not self.recursive:
             await self.release_trade_lock()
@@ -93,6 +146,29 @@ class Playbook(ABC):
     async def after_exit(self):
         pass
 
+    def span(self, stage: str):
+        # Shadow plays run against the simulated exchange, their timings say nothing about the live path
+        return span(stage=stage) if self.fill_source == LIVE else nullcontext()
+
+    def count_order(self, role: str, order: dict):
+        if order and self.fill_source == LIVE:
+            orders_total.inc(role=role)
+
+    @property
+    def publishes_market_data(self) -> bool:
+        return not isinstance(self.exchange, SimulatedExchange)
+
+    @property
+    def trade_id(self) -> str:
+        started_at = self.execution_start_time.replace(tzinfo=timezone.utc)
+        return f'{self.symbol.replace("/", "")[:8]}{int(started_at.timestamp() * 1000)}'
+
+    @property
+    def entry_amount(self):
+        # Entries can be downsized or partially filled, exits follow what was actually filled
+        filled = self.order_entry.get('filled') if self.order_entry else None
+        return filled if filled else getattr(self, 'modal_duid', None)
+
     @property
     def current_price(self):
         return float(self.ohlcv.get('closes')[-1])
@@ -105,38 +181,27 @@ class Playbook(ABC):
 
     @property
     def price_precision(self) -> int:
-        if type(self.currency_info.precision.price) == int:
-            return self.currency_info.precision.price
-
-        sp = str(self.currency_info.precision.price).split('.')
-        if len(sp) != 2:
-            raise ValueError('Unrecognized precision given from the exchange')
-
-        return len(sp[1])
+        return self.sizer.price_decimals
 
     @property
     def amount_precision(self) -> int:
-        return int(self.currency_info.precision.amount)
+        return self.sizer.amount_decimals
 
     @property
     def min_price(self) -> Decimal:
-        return Decimal(self.currency_info.limits.price.min)
+        return self.sizer.min_price
 
     @property
     def max_price(self) -> Decimal:
-        return Decimal(self.currency_info.limits.price.max)
+        return self.sizer.max_price
 
     @property
     def min_amount(self) -> Decimal:
-        if not self.currency_info.limits.amount.min:
-            return Decimal(0)
-        return Decimal(self.currency_info.limits.amount.min)
+        return self.sizer.min_amount
 
     @property
     def max_amount(self) -> Decimal:
-        if not self.currency_info.limits.amount.max:
-            return Decimal(10**9)
-        return Decimal(self.currency_info.limits.amount.max)
+        return self.sizer.max_amount
 
     @property
     @abstractmethod
@@ -159,11 +224,68 @@ class Playbook(ABC):
             raise TypeError("decimal places must be an integer")
         elif decimals < 0:
             raise ValueError("decimal places has to be 0 or more")
-        elif decimals == 0:
-            return math.floor(number)
 
-        factor = 10 ** decimals
-        return math.floor(number * factor) / factor
+        rounded = OrderSizer.round_down(value=number,
+                                        quantizer=Decimal(1).scaleb(-decimals))
+        return int(rounded) if decimals == 0 else float(rounded)
+
+    def notified_pnl_in_percent(self, entry_price: Decimal, exit_price: Decimal, won: bool) -> Decimal:
+        # The figure exit notifications have always reported, gains are measured against the price the trade started
+        # from and losses against the price it ended at, the ledger keeps plain returns
+        if self.action == Actions.LONG and won:
+            return exit_price / entry_price * Decimal(100) - Decimal(100)
+        if self.action == Actions.LONG:
+            return (entry_price / exit_price * Decimal(100) - Decimal(100)) * Decimal(-1)
+        if won:
+            return entry_price / exit_price * Decimal(100) - Decimal(100)
+        return (exit_price / entry_price * Decimal(100) - Decimal(100)) * Decimal(-1)
+
+    def notional(self, amount, price) -> float:
+        # Order amounts are in contracts or base units, the ledger keeps sizes in quote currency
+        contract_size = float(self.currency_info.contract_size or 1)
+        if self.currency_info.inverse:
+            return float(amount) * contract_size
+        return float(amount) * contract_size * float(price)
+
+    def record_trade(self, exit_price, amount, fees=0.0):
+        if self.entry_price is None or exit_price is None or amount is None:
+            return
+
+        self.ledger.record(opened_at=self.execution_start_time,
+                           closed_at=datetime.utcnow(),
+                           action=self.action,
+                           entry_price=self.entry_price,
+                           exit_price=exit_price,
+                           size=self.notional(amount=amount,
+                                              price=self.entry_price),
+                           fees=fees)
+
+        report = summarize(self.ledger.to_array())
+        self.info(f'Ledger: {report.get("trades")} trades, PnL {report.get("pnl"):.2f}, '
+                  f'win rate {report.get("win_rate"):.2%}, max drawdown {report.get("max_drawdown"):.2%}')
+
+    def record_fill(self, role: str, order: dict):
+        if not order:
+            return
+
+        # Market orders can come back before their status is known, limit and stop orders only count once closed
+        if role != 'entry' and order.get('status') != 'closed':
+            return
+
+        if self.publishes_market_data:
+            market_feed.update_trade(symbol=self.symbol,
+                                     price=order.get('average') or order.get('price'))
+
+        timestamps = self.ohlcv.get('timestamps') if self.ohlcv else None
+        if self.fill_report is None or timestamps is None or len(timestamps) == 0:
+            return
+
+        self.fill_report.record(source=self.fill_source,
+                                signal_key=int(timestamps[-1]),
+                                role=role,
+                                action=self.action,
+                                order=order,
+                                signal_time=self.signal_time)
 
     async def notify(self, message):
         # TODO: Notification mechanism to notify for significant events
@@ -172,95 +294,83 @@ class Playbook(ABC):
     async def sleep(self, interval_in_seconds):
         await asyncio.sleep(interval_in_seconds)
 
+    def env(self, name: str, default: str = None):
+        # Bots configured through the runtime carry their own settings, env vars are the fallback
+        value = self.params.get(name)
+        if value is None:
+            return environ.get(name, default)
+        return str(value)
+
     def info(self, message):
         self.logger.info(f'{self.__name__}: {message}')
 
-    def debug(self, message):
-        self.logger.debug(f'{self.__name__}: {message}')
+    def debug(self, message, *args):
+        # Arguments are only formatted when debug messages are written
+        if self.logger.isEnabledFor(DEBUG):
+            self.logger.debug(f'{self.__name__}: {message}', *args)
 
     async def release_trade_lock(self):
         self.info('Releasing trade lock')
+        self.holds_trade_lock = False
         self.trade_lock.release()
 
     async def get_latest_candle(self):
-        ohlcv = self.exchange.fetch_ohlcv(symbol=self.symbol,
-                                          timeframe=self.timeframe,
-                                          limit=1)
-
-        return ohlcv[0]
+        if not self.publishes_market_data:
+            ohlcv = self.exchange.fetch_ohlcv(symbol=self.symbol,
+                                              timeframe=self.timeframe,
+                                              limit=1)
+            return ohlcv[0]
+
+        # Shared with every playbook of the process for a short while
+        candle, fetched = await market_cache.latest_candle(exchange=self.exchange,
+                                                           symbol=self.symbol,
+                                                           timeframe=self.timeframe)
+        if fetched:
+            market_feed.update_candle(symbol=self.symbol,
+                                      candle=candle)
+
+        return candle
 
     async def get_ticker(self):
-        return self.exchange.fetch_ticker(symbol=self.symbol)
-
-    async def set_leverage(self, leverage: int):
-        normalized_symbol = None
-        post_name = get_name = None
-
-        if type(self.exchange) == ccxt.bybit:
-            post_name = 'userPostLeverageSave'
-            get_name = 'userGetLeverage'
-            normalized_symbol = self.symbol.replace('/', '')
-        if not post_name or not get_name or not normalized_symbol:
-            raise NotImplementedError('Unsupported exchange')
+        if not self.publishes_market_data:
+            return self.exchange.fetch_ticker(symbol=self.symbol)
 
-        # Get leverage
-        method = getattr(self.exchange, get_name)
-        response = method()
-        if response.get('result').get(normalized_symbol).get('leverage') == leverage:
-            return response
-
-        # Post leverage
-        method = getattr(self.exchange, post_name)
-        response = method(params={
-            'symbol': normalized_symbol,
-            'leverage': leverage
-        })
+        ticker, fetched = await market_cache.ticker(exchange=self.exchange,
+                                                    symbol=self.symbol)
+        if fetched:
+            market_feed.update_ticker(symbol=self.symbol,
+                                      ticker=ticker)
 
-        if response.get('ret_code') != 0 or response.get('ret_msg') != 'ok':
-            raise AssertionError('Got error message while setting leverage')
+        return ticker
 
-        return response
+    async def set_leverage(self, leverage: int):
+        # Only hits the network when the account cache is stale or the leverage differs
+        return await ensure_leverage(exchange=self.exchange,
+                                     symbol=self.symbol,
+                                     leverage=leverage)
 
     async def poll_results(self):
-        self.info(f'Starting to poll for order IDs f{self.order_exit.get("id")} and f{self.order_stop.get("id")}')
-
-        def _poll_orders(exit_order_id, stop_order_id, symbol) -> Union[dict, bool]:
-            exit_order = self.exchange.fetch_order(id=exit_order_id,
-                                                   symbol=symbol)
-            stop_order = self.exchange.fetch_order(id=stop_order_id,
-                                                   symbol=symbol)
-
-            exit_order_status = exit_order.get('status')
-            stop_order_status = stop_order.get('status')
-
-            ended_statuses = ['closed', 'canceled']
-
-            if exit_order_status in ended_statuses or stop_order_status in ended_statuses:
-                return {
-                    'stop_order': stop_order,
-                    'exit_order': exit_order
-                }
-
-            return False
-
-        while True:
-            self.info(f'Going to poll for order ids: {self.order_exit.get("id")} {self.order_stop.get("id")}')
-            result = _poll_orders(exit_order_id=self.order_exit.get('id'),
-                                  stop_order_id=self.order_stop.get('id'),
-                                  symbol=self.symbol)
-            if result is False:
-                self.info('Exit and Stop orders are still open, sleeping..')
-                await asyncio.sleep(60)
-                continue
-            else:
-                self.info(f'Got either closed or canceled on one of the order, breaking out..')
-                break
-
-        return result
+        exit_order_id = str(self.order_exit.get('id'))
+        stop_order_id = str(self.order_stop.get('id'))
+        self.info(f'Waiting for order IDs {exit_order_id} and {stop_order_id}')
+
+        watcher = get_order_watcher(exchange=self.exchange,
+                                    logger=self.logger)
+        with self.span(stage='poll'):
+            orders = await watcher.wait_any(symbol=self.symbol,
+                                            orders=[self.order_exit, self.order_stop],
+                                            conditional=self.open_stop_orders)
+        self.info('Got either closed or canceled on one of the order')
+
+        return {
+            'exit_order': orders.get(exit_order_id),
+            'stop_order': orders.get(stop_order_id)
+        }
 
     async def cancel_order(self, order_id):
-        result = self.exchange.cancel_order(id=order_id,
-                                            symbol=self.symbol)
+        result = await run_sync(self.exchange.cancel_order,
+                                id=order_id,
+                                symbol=self.symbol)
         return result
 
     async def limit_buy_order(self, price, amount):
@@ -269,23 +379,62 @@ class Playbook(ABC):
                                                      price=price)
         return order
 
-    async def market_buy_order(self, amount):
+    def execution_algorithm(self) -> ExecutionAlgorithm:
+        algorithm = get_execution_algorithm(self.env('EXECUTION_ALGORITHM', EXECUTION_ALGORITHM))
+        return algorithm(exchange=self.exchange,
+                         symbol=self.symbol,
+                         sizer=self.sizer,
+                         logger=self.logger,
+                         slices=int(self.env('EXECUTION_SLICES', EXECUTION_SLICES)),
+                         duration=float(self.env('EXECUTION_DURATION', EXECUTION_DURATION)),
+                         concurrency=int(self.env('EXECUTION_CONCURRENCY', EXECUTION_CONCURRENCY)),
+                         child_timeout=float(self.env('EXECUTION_CHILD_TIMEOUT', EXECUTION_CHILD_TIMEOUT)))
+
+    async def market_order(self, side: str, amount):
         if not self.exchange.has['createMarketOrder']:
             raise AttributeError('The selected exchange does not support market orders')
 
-        order = self.exchange.create_market_buy_order(symbol=self.symbol,
-                                                      amount=amount)
+        algorithm = self.execution_algorithm()
+
+        # The whole amount is checked, whatever algorithm executes it afterwards
+        max_bps = self.env('SLIPPAGE_MAX_BPS', SLIPPAGE_MAX_BPS)
+        if max_bps:
+            guard = SlippageGuard(exchange=self.exchange,
+                                  symbol=self.symbol,
+                                  sizer=self.sizer,
+                                  logger=self.logger,
+                                  max_bps=float(max_bps),
+                                  action=self.env('SLIPPAGE_ACTION', SLIPPAGE_ACTION))
+            plan = await guard.plan(side=side,
+                                    amount=amount)
+
+            if plan.action == ABORT:
+                self.info(f'Expected slippage is above {max_bps} bps, not entering')
+                return {}
+            if plan.action == LIMIT:
+                self.info(f'Expected slippage is above {max_bps} bps, sending a limit order at {plan.price}')
+                order = await algorithm.limit(side=side,
+                                              amount=self.sizer.amount(amount),
+                                              price=Decimal(str(plan.price)))
+                return order if order and order.get('filled') else {}
+            if plan.action == DOWNSIZE:
+                self.info(f'Expected slippage is above {max_bps} bps, downsizing from {amount} to {plan.amount}')
+                amount = plan.amount
+
+        if algorithm.name != 'market':
+            self.info(f'Executing {side} of {amount} with {algorithm.name}')
+            return await algorithm.execute(side=side, amount=amount)
+
+        method = self.exchange.create_market_buy_order if side == 'buy' else self.exchange.create_market_sell_order
+        return await run_sync(method,
+                              symbol=self.symbol,
+                              amount=amount)
 
-        return order
+    async def market_buy_order(self, amount):
+        return await self.market_order(side='buy', amount=amount)
 
     async def market_sell_order(self, amount):
-        if not self.exchange.has['createMarketOrder']:
-            raise AttributeError('The selected exchange does not support market orders')
-
-        order = self.exchange.create_market_sell_order(symbol=self.symbol,
-                                                       amount=amount)
-
-        return order
+        return await self.market_order(side='sell', amount=amount)
 
     async def market_stop_sell_order(self, amount):
         if not self.exchange.has['createMarketOrder']:
@@ -309,71 +458,163 @@ class Playbook(ABC):
 
         return order
 
-    async def limit_buy_order(self, amount, price):
-        order = self.exchange.create_order(symbol=self.symbol,
-                                           type='limit',
-                                           side='buy',
-                                           amount=amount,
-                                           price=price)
+    async def limit_buy_order(self, amount, price, client_order_id: str = None):
+        params = {'clientOrderId': client_order_id} if client_order_id else {}
+        order = await run_sync(self.exchange.create_order,
+                               symbol=self.symbol,
+                               type='limit',
+                               side='buy',
+                               amount=amount,
+                               price=price,
+                               params=params)
         return order
 
-    async def limit_sell_order(self, amount, price):
-        order = self.exchange.create_order(symbol=self.symbol,
-                                           type='limit',
-                                           side='sell',
-                                           amount=amount,
-                                           price=price)
+    async def limit_sell_order(self, amount, price, client_order_id: str = None):
+        params = {'clientOrderId': client_order_id} if client_order_id else {}
+        order = await run_sync(self.exchange.create_order,
+                               symbol=self.symbol,
+                               type='limit',
+                               side='sell',
+                               amount=amount,
+                               price=price,
+                               params=params)
         return order
 
-    async def limit_stop_order(self, side, amount, stop_price, price, base_price):
-        if type(self.exchange) != ccxt.bybit:
-            raise NotImplementedError('Unsupported exchange')
-
-        method_name = None
-        if type(self.exchange) == ccxt.bybit:
-            method_name = 'openapiPostStopOrderCreate'
-        if not method_name:
-            raise NotImplementedError('The exchange does not support stop orders')
-
-        normalized_symbol = None
-        if type(self.exchange) == ccxt.bybit:
-            normalized_symbol = self.symbol.replace('/', '')
-        if not normalized_symbol:
-            raise NotImplementedError('Unsupported exchange')
+    async def limit_stop_order(self, side, amount, stop_price, price, base_price, client_order_id: str = None):
+        method_name = self.stop_order_method(names=('openapiPostStopOrderCreate',
+                                                    'privatePostV2PrivateStopOrderCreate'))
+        normalized_symbol = self.symbol.replace('/', '')
 
-        method = getattr(self.exchange, method_name)
-        order = method(params={
+        params = {
             'side': side,
             'symbol': normalized_symbol,
             'order_type': 'Limit',
             'qty': amount,
-            'price': price,
-            'stop_px': stop_price,
+            'price': str(price),
+            'stop_px': str(stop_price),
             'base_price': base_price,
             'close_on_trigger': True,
             'time_in_force': 'GoodTillCancel'
-        })
+        }
+        if client_order_id:
+            params.update({'order_link_id': client_order_id})
+
+        method = getattr(self.exchange, method_name)
+        order = await run_sync(method, params=params)
         order.update({
             'id': order.get('result').get('stop_order_id'),
+            'clientOrderId': client_order_id,
             'price': order.get('result').get('price')
         })
 
         return order
 
-    async def limit_stop_sell_order(self, amount, stop_price, stop_action_price, base_price):
+    def stop_order_method(self, names) -> str:
+        if not isinstance(self.exchange, ccxt.bybit):
+            raise NotImplementedError('Unsupported exchange')
+
+        # Bybit endpoints are named differently across ccxt versions
+        for name in names:
+            if hasattr(self.exchange, name):
+                return name
+
+        raise NotImplementedError('The exchange does not support stop orders')
+
+    async def find_stop_order(self, client_order_id: str) -> Optional[dict]:
+        # Conditional orders are not listed with open orders, they are queried by their order_link_id
+        method = getattr(self.exchange, self.stop_order_method(names=('v2PrivateGetStopOrder',
+                                                                      'privateGetV2PrivateStopOrder')))
+        order = await run_sync(method, params={'symbol': self.symbol.replace('/', ''),
+                                               'order_link_id': client_order_id})
+        result = order.get('result') or {}
+        if not result.get('stop_order_id'):
+            return None
+
+        order.update({
+            'id': result.get('stop_order_id'),
+            'clientOrderId': client_order_id,
+            'price': result.get('price')
+        })
+
+        return order
+
+    async def open_stop_orders(self) -> List[dict]:
+        # Untriggered conditional orders of the symbol, in a single request
+        method = getattr(self.exchange, self.stop_order_method(names=('v2PrivateGetStopOrderList',
+                                                                      'privateGetV2PrivateStopOrderList')))
+        response = await run_sync(method, params={'symbol': self.symbol.replace('/', ''),
+                                                  'stop_order_status': 'Untriggered',
+                                                  'limit': 50})
+        orders = (response.get('result') or {}).get('data') or []
+
+        return [{
+            'id': order.get('stop_order_id'),
+            'clientOrderId': order.get('order_link_id') or None,
+            'status': 'open'
+        } for order in orders]
+
+    async def cancel_stop_order(self, order_id: str):
+        method = getattr(self.exchange, self.stop_order_method(names=('openapiPostStopOrderCancel',
+                                                                      'privatePostV2PrivateStopOrderCancel')))
+        return await run_sync(method, params={'symbol': self.symbol.replace('/', ''),
+                                              'stop_order_id': order_id})
+
+    async def unwind_bracket(self, placed: Dict[str, dict], amount):
+        # A take profit without its stop, or the other way around, is worse than no position at all
+        for leg, order in placed.items():
+            self.info(f'Cancelling the {leg} leg {order.get("id")} of the incomplete bracket')
+            if leg == 'sl':
+                await self.cancel_stop_order(order_id=order.get('id'))
+            else:
+                await self.cancel_order(order_id=order.get('id'))
+
+        side = 'sell' if self.action == Actions.LONG else 'buy'
+        self.info(f'Closing the position with a market {side} of {amount}')
+        await run_sync(self.exchange.create_order,
+                       symbol=self.symbol,
+                       type='market',
+                       side=side,
+                       amount=amount,
+                       params={'reduceOnly': True})
+
+    async def limit_stop_sell_order(self, amount, stop_price, stop_action_price, base_price,
+                                    client_order_id: str = None):
         return await self.limit_stop_order(side='Sell',
                                            amount=amount,
                                            stop_price=stop_price,
                                            price=stop_action_price,
-                                           base_price=base_price)
+                                           base_price=base_price,
+                                           client_order_id=client_order_id)
 
-    async def limit_stop_buy_order(self, amount, stop_price, stop_action_price, base_price):
+    async def limit_stop_buy_order(self, amount, stop_price, stop_action_price, base_price,
+                                   client_order_id: str = None):
         return await self.limit_stop_order(side='Buy',
                                            amount=amount,
                                            stop_price=stop_price,
                                            price=stop_action_price,
-                                           base_price=base_price)
+                                           base_price=base_price,
+                                           client_order_id=client_order_id)
+
+    async def submit_exit_and_stop(self, exit_order_method, stop_order_method, amount, exit_price, stop_price,
+                                   stop_action_price, base_price):
+        # TP and SL go out together, the position is protected after a single round trip
+        with self.span(stage='bracket'):
+            self.order_exit, self.order_stop = await self.order_submitter.submit_bracket(
+                trade_id=self.trade_id,
+                exit_leg=lambda client_order_id: exit_order_method(amount=amount,
+                                                                   price=exit_price,
+                                                                   client_order_id=client_order_id),
+                stop_leg=lambda client_order_id: stop_order_method(amount=amount,
+                                                                   stop_price=stop_price,
+                                                                   stop_action_price=stop_action_price,
+                                                                   base_price=base_price,
+                                                                   client_order_id=client_order_id),
+                stop_lookup=self.find_stop_order,
+                unwind=lambda placed: self.unwind_bracket(placed=placed,
+                                                          amount=amount)
+            )
 
     async def get_order(self, order_id: str):
-        return self.exchange.fetch_order(id=order_id,
-                                         symbol=self.symbol)
+        return await run_sync(self.exchange.fetch_order,
+                              id=order_id,
+                              symbol=self.symbol)
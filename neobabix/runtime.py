@@ -0,0 +1,235 @@
+import json
+from asyncio import Lock
+from datetime import datetime
+from os import environ
+from typing import Dict, Optional, Tuple
+
+import pytz
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from ccxt.base.exchange import Exchange
+
+from neobabix import fetch_candles, get_ccxt_client, get_notification, get_playbook, get_strategy, logger
+from neobabix.exchanges.simulated import market_feed
+from neobabix.execution.prewarm import prewarm, prewarm_trigger
+from neobabix.logging import set_log_context
+from neobabix.models.bots import BotConfig, RuntimeConfig
+from neobabix.playbooks.playbook import Playbook
+from neobabix.strategies.strategy import Actions
+from neobabix.telemetry.exchange import start_call_summary
+from neobabix.telemetry.metrics import signals_total, span, timed
+from neobabix.telemetry.profiling import tick_profiler
+
+BOTS_CONFIG = environ.get('BOTS_CONFIG')
+
+"""
+    Runs many bots in one process.
+
+    Every bot is a strategy and a playbook trading one symbol on one account, bots are read from the JSON file at
+    BOTS_CONFIG:
+
+        {
+            "accounts": {
+                "main": {"exchange": "bybit", "api_key_env": "MAIN_API_KEY", "api_secret_env": "MAIN_API_SECRET"}
+            },
+            "bots": [
+                {"name": "btc", "account": "main", "strategy": "WiseWilliams", "playbook": "Fractalism",
+                 "candle_symbol": "BTC/USDT", "trade_symbol": "BTC/USD", "leverage": 2,
+                 "params": {"MODAL_DUID": "100", "TAKE_PROFIT_IN_PERCENT": "1.0"}}
+            ]
+        }
+
+    API keys stay in env vars, accounts only name them. Playbook env vars are read from params first.
+
+    Exchange clients are shared: one per account for trades and one per exchange for candles. A bot holds the lock of
+    its symbol on its account by default, bots with "lock": "account" hold one lock for the whole account instead and
+    never trade alongside other bots of that account.
+"""
+
+
+class ClientPool:
+    def __init__(self, config: RuntimeConfig):
+        self.config = config
+        self.clients: Dict[Tuple[str, str], Exchange] = {}
+
+    def candles_client(self, exchange: str) -> Exchange:
+        key = ('candles', exchange)
+        if key not in self.clients:
+            self.clients[key] = get_ccxt_client(exchange=exchange,
+                                                testnet=False)
+        return self.clients[key]
+
+    def trades_client(self, account: str) -> Exchange:
+        key = ('trades', account)
+        if key not in self.clients:
+            account_config = self.config.accounts.get(account)
+            self.clients[key] = get_ccxt_client(exchange=account_config.exchange,
+                                                api_key=environ.get(account_config.api_key_env or '', ''),
+                                                api_secret=environ.get(account_config.api_secret_env or '', ''),
+                                                testnet=account_config.testnet)
+        return self.clients[key]
+
+
+class LockRegistry:
+    def __init__(self):
+        self.locks: Dict[Tuple[str, ...], Lock] = {}
+
+    def get(self, bot: BotConfig) -> Lock:
+        key = (bot.account,) if bot.lock == 'account' else (bot.account, bot.trade_symbol)
+
+        # Locks must be created within the running loop
+        if key not in self.locks:
+            self.locks[key] = Lock()
+        return self.locks[key]
+
+    def busy(self, bot: BotConfig) -> bool:
+        for key, lock in self.locks.items():
+            if key[0] != bot.account or not lock.locked():
+                continue
+            # Account locks block every bot of the account, symbol locks block their symbol and account bots
+            if len(key) == 1 or bot.lock == 'account' or key[1] == bot.trade_symbol:
+                return True
+
+        return False
+
+
+class Bot:
+    def __init__(self, config: BotConfig, clients: ClientPool, locks: LockRegistry):
+        self.config = config
+        self.clients = clients
+        self.locks = locks
+        # The playbook of the current tick, if the tick got that far
+        self.playbook: Optional[Playbook] = None
+
+        account = clients.config.accounts.get(config.account)
+        self.notification = get_notification(notify_using=config.notify_using,
+                                             context={
+                                                 'bot': config.name,
+                                                 'strategy': config.strategy,
+                                                 'playbook': config.playbook,
+                                                 'candles_exchange': config.candles_exchange,
+                                                 'trades_exchange': account.exchange
+                                             })
+
+    def info(self, message):
+        logger.info(f'[{self.config.name}] {message}')
+
+    @property
+    def trade_lock(self) -> Lock:
+        return self.locks.get(bot=self.config)
+
+    @timed(stage='tick')
+    async def tick(self):
+        set_log_context(bot=self.config.name, symbol=self.config.trade_symbol, trade_id=None)
+        self.info('<< Tick has started >>')
+        self.playbook = None
+        calls = start_call_summary()
+        signal_time = datetime.utcnow()
+
+        with span(stage='candles'):
+            candles = await fetch_candles(symbol=self.config.candle_symbol,
+                                          exchange=self.config.candles_exchange,
+                                          timeframe=self.config.timeframe,
+                                          trade_on_close=self.config.trade_on_close,
+                                          client=self.clients.candles_client(exchange=self.config.candles_exchange))
+        market_feed.update_candles(symbol=self.config.trade_symbol,
+                                   ohlcv=candles)
+
+        with span(stage='indicators'):
+            strategy = get_strategy(strategy=self.config.strategy)(opens=candles.get('opens'),
+                                                                   highs=candles.get('highs'),
+                                                                   lows=candles.get('lows'),
+                                                                   closes=candles.get('closes'),
+                                                                   volumes=candles.get('volumes'),
+                                                                   logger=logger)
+        with span(stage='filter'):
+            action = strategy.filter()
+        signals_total.inc(strategy=self.config.strategy,
+                          action=action.name)
+        self.info(f'{self.config.strategy} suggests {action.name}')
+
+        await self.route_actions(action=action,
+                                 ohlcv=candles,
+                                 signal_time=signal_time)
+
+        self.info(f'Exchange calls: {calls}')
+        self.info('<< Tick has ended >>')
+
+    @timed(stage='route')
+    async def route_actions(self, action: Actions, ohlcv: dict, signal_time: datetime):
+        if action == Actions.NOTHING:
+            return
+
+        trade_lock = self.trade_lock
+        if self.locks.busy(bot=self.config):
+            self.info('There is an ongoing trade, bailing out')
+            return
+
+        _playbook = get_playbook(playbook=self.config.playbook)
+        with span(stage='playbook'):
+            playbook = _playbook(action=action,
+                                 exchange=self.clients.trades_client(account=self.config.account),
+                                 trade_lock=trade_lock,
+                                 logger=logger,
+                                 symbol=self.config.trade_symbol,
+                                 timeframe=self.config.timeframe,
+                                 notification=self.notification,
+                                 leverage=self.config.leverage,
+                                 ohlcv=ohlcv,
+                                 params=self.config.params)
+        playbook.__name__ = f'[{self.config.name}] {playbook.__name__}'
+        playbook.signal_time = signal_time
+
+        self.playbook = playbook
+        await playbook.play()
+
+    async def prewarm(self):
+        if self.locks.busy(bot=self.config):
+            return
+
+        try:
+            await prewarm(exchange=self.clients.trades_client(account=self.config.account),
+                          symbol=self.config.trade_symbol,
+                          leverage=self.config.leverage,
+                          logger=logger)
+        except Exception as exc:
+            logger.error(f'[{self.config.name}] Prewarm failed: {exc}')
+
+    async def job(self, release_lock_on_error: bool = False):
+        try:
+            async with tick_profiler.profile(name=self.config.name):
+                await self.tick()
+        except Exception as exc:
+            logger.error(f'[{self.config.name}] {exc}')
+            # The lock may be shared with other bots, it is only released when this bot's playbook holds it
+            playbook = self.playbook
+            if release_lock_on_error and playbook is not None and playbook.holds_trade_lock:
+                self.info('Exception happened on tick, set to release lock.')
+                await playbook.release_trade_lock()
+
+
+def load_config(path: str) -> RuntimeConfig:
+    with open(path, 'r') as f:
+        return RuntimeConfig(**json.load(f))
+
+
+def schedule_bots(scheduler: AsyncIOScheduler, config: RuntimeConfig, release_lock_on_error: bool = False):
+    clients = ClientPool(config=config)
+    locks = LockRegistry()
+
+    for bot_config in config.bots:
+        bot = Bot(config=bot_config,
+                  clients=clients,
+                  locks=locks)
+        scheduler.add_job(bot.job, IntervalTrigger(seconds=bot_config.interval,
+                                                   timezone=pytz.timezone('UTC')),
+                          kwargs={'release_lock_on_error': release_lock_on_error},
+                          id=bot_config.name,
+                          max_instances=1)
+        scheduler.add_job(bot.prewarm, prewarm_trigger(interval=bot_config.interval),
+                          id=f'{bot_config.name}-prewarm',
+                          max_instances=1)
+        logger.info(f'Scheduled bot {bot_config.name}: {bot_config.strategy} / {bot_config.playbook} on '
+                    f'{bot_config.trade_symbol} with account {bot_config.account}')
+
+    return clients, locks
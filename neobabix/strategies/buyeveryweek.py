@@ -5,6 +5,7 @@ from os import environ
 import numpy as np
 
 from .strategy import Strategy, Actions
+from neobabix.indicators.calendar import WeekdayMask
 
 DAY_OF_WEEK_TO_BUY = environ.get('DAY_OF_WEEK_TO_BUY', '3')
 
@@ -17,5 +18,11 @@ class BuyEveryWeek(Strategy):
         self.day_of_week_now = datetime.utcnow().weekday()
         self.day_of_week_to_buy = int(DAY_OF_WEEK_TO_BUY)
 
+    @staticmethod
+    def signals(timestamps: np.ndarray) -> np.ndarray:
+        mask = WeekdayMask(timestamps=timestamps,
+                           weekday=int(DAY_OF_WEEK_TO_BUY))
+        return np.where(mask, Actions.LONG.value, Actions.NOTHING.value)
+
     def filter(self) -> Actions:
         return Actions.LONG if self.day_of_week_now == self.day_of_week_to_buy else Actions.NOTHING
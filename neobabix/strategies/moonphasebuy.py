@@ -4,13 +4,14 @@ from logging import Logger
 import numpy as np
 
 from .strategy import Strategy, Actions
+from neobabix.indicators.calendar import MoonDaysIntoPhase, MoonPhase
+
+LIGHT_TO_BUY = 90
 
 
 def moon_phase(month, day, year):
     """ Taken from https://www.daniweb.com/programming/software-development/code/216727/moon-phase-calculator """
 
-    ages = [18, 0, 11, 22, 3, 14, 25, 6, 17, 28, 9, 20, 1, 12, 23, 4, 15, 26, 7]
-    offsets = [-1, 1, 0, 1, 2, 3, 4, 5, 7, 7, 9, 9]
     description = ["new (totally dark)",
                    "waxing crescent (increasing to full)",
                    "in its first quarter (increasing to full)",
@@ -21,9 +22,9 @@ def moon_phase(month, day, year):
                    "waning crescent (decreasing from full)"]
     months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
 
+    days_into_phase = int(MoonDaysIntoPhase(years=year, months=month, days=day))
     if day == 31:
         day = 1
-    days_into_phase = ((ages[(year + 1) % 19] + ((day + offsets[month - 1]) % 30) + (year < 1900)) % 30)
     index = int((days_into_phase + 2) * 16 / 59.0)
     if index > 7:
         index = 7
@@ -49,7 +50,12 @@ class MoonPhaseBuy(Strategy):
                                                         day=datetime.utcnow().day,
                                                         year=datetime.utcnow().year)
 
+    @staticmethod
+    def signals(timestamps: np.ndarray) -> np.ndarray:
+        light, _ = MoonPhase(timestamps=timestamps)
+        return np.where(light >= LIGHT_TO_BUY, Actions.LONG.value, Actions.NOTHING.value)
+
     def filter(self) -> Actions:
-        action = Actions.LONG if self.light >= 90 else Actions.NOTHING
+        action = Actions.LONG if self.light >= LIGHT_TO_BUY else Actions.NOTHING
         self.logger.info(f'Moonphasebuy action is: {action}')
         return action
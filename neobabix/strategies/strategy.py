@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 import enum
 import numpy as np
-from logging import Logger
+from logging import DEBUG, Logger
 
 
 class Actions(enum.Enum):
@@ -21,8 +21,10 @@ class Strategy(ABC):
         self.volumes = volumes
         self.logger = logger
 
-    def debug(self, message):
-        self.logger.debug(f'{self.__name__}: {message}')
+    def debug(self, message, *args):
+        # Arguments are only formatted when debug messages are written
+        if self.logger.isEnabledFor(DEBUG):
+            self.logger.debug(f'{self.__name__}: {message}', *args)
 
     @abstractmethod
     def filter(self) -> Actions:
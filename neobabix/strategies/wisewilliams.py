@@ -15,7 +15,7 @@ class WiseWilliams(Strategy):
                  logger: Logger):
         super().__init__(opens, highs, lows, closes, volumes, logger)
 
-        self.debug(f'Candle size: {len(self.highs)}')
+        self.debug('Candle size: %s', len(self.highs))
 
         self.jaws = WilliamsAlligatorJaws(highs=highs,
                                           lows=lows)
@@ -51,23 +51,23 @@ class WiseWilliams(Strategy):
         alligator_is_short = self.lows[-1] > self.lips[-1] and self.lows[-1] > self.teeth[-1] and self.lows[-1] > \
             self.jaws[-1]
 
-        self.debug(f'MFI is valid: {valid_mfi}')
-        self.debug(f'--')
-        self.debug(f'AC is Blue: {ac_is_blue}')
-        self.debug(f'AO is Green: {ao_is_green}')
-        self.debug(f'Alligator is Long: {alligator_is_long}')
-        self.debug(f'AO Positive: {ao_positive}')
-        self.debug(f'--')
-        self.debug(f'AC is Red: {ac_is_red}')
-        self.debug(f'AO is Red: {ao_is_red}')
-        self.debug(f'Alligator is Short: {alligator_is_short}')
-        self.debug(f'AO Negative: {ao_negative}')
+        self.debug('MFI is valid: %s', valid_mfi)
+        self.debug('--')
+        self.debug('AC is Blue: %s', ac_is_blue)
+        self.debug('AO is Green: %s', ao_is_green)
+        self.debug('Alligator is Long: %s', alligator_is_long)
+        self.debug('AO Positive: %s', ao_positive)
+        self.debug('--')
+        self.debug('AC is Red: %s', ac_is_red)
+        self.debug('AO is Red: %s', ao_is_red)
+        self.debug('Alligator is Short: %s', alligator_is_short)
+        self.debug('AO Negative: %s', ao_negative)
 
         go_long = valid_mfi and ac_is_blue and ao_is_green and alligator_is_long and ao_positive
         go_short = valid_mfi and ac_is_red and ao_is_red and alligator_is_short and ao_negative
 
-        self.debug(f'Go Long: {go_long}')
-        self.debug(f'Go Short: {go_short}')
+        self.debug('Go Long: %s', go_long)
+        self.debug('Go Short: %s', go_short)
 
         if go_long:
             return Actions.LONG
@@ -0,0 +1,172 @@
+import inspect
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from os import environ
+from typing import Dict, List, Optional, Tuple
+
+from ccxt.base.exchange import Exchange
+
+from neobabix.telemetry.metrics import metrics
+
+EXCHANGE_METRICS = environ.get('EXCHANGE_METRICS', '1')
+
+UNIFIED_PREFIXES = ('fetch_', 'create_', 'cancel_', 'edit_', 'load_', 'set_', 'transfer', 'withdraw')
+
+"""
+    Exchange API call metrics for clients made by get_ccxt_client.
+
+    Every HTTP request a client sends is recorded by exchange, method and endpoint. The method is the unified method
+    the request was made for, like fetch_ohlcv or create_order, or "implicit" for implicit methods called directly
+    like Bybit's userGetLeverage. The endpoint is the HTTP method and the path template.
+
+    Requests are timed from the moment they leave ccxt's rate limiter to their response, waiting for the rate limiter
+    is not the exchange being slow. The rate limit weight of every request is counted as well, along with the class of
+    the errors raised.
+
+    Calls are also summed per tick and logged when the tick ends, EXCHANGE_METRICS=0 disables all of it.
+"""
+
+call_seconds = metrics.histogram('neobabix_exchange_call_seconds', 'Seconds exchange API requests took')
+call_errors = metrics.counter('neobabix_exchange_errors_total', 'Exchange API requests that raised, by error class')
+call_weight = metrics.counter('neobabix_exchange_weight_total', 'Rate limit weight consumed by exchange API requests')
+
+# ccxt clients are synchronous, a call and the requests it makes all happen in one thread
+_current = threading.local()
+
+
+class CallSummary:
+    def __init__(self):
+        # (exchange, method) -> count, seconds, errors, weight
+        self.calls: Dict[Tuple[str, str], List[float]] = {}
+
+    def record(self, exchange: str, method: str, seconds: float, error: Optional[str], weight: float):
+        totals = self.calls.get((exchange, method))
+        if totals is None:
+            totals = [0, 0.0, 0, 0.0]
+            self.calls[(exchange, method)] = totals
+
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += 1 if error else 0
+        totals[3] += weight
+
+    def __str__(self):
+        if not self.calls:
+            return 'none'
+
+        parts = []
+        for (exchange, method), (count, seconds, errors, weight) in sorted(self.calls.items()):
+            part = f'{exchange}.{method} x{count:g} {seconds * 1000:.0f}ms weight {weight:g}'
+            parts.append(f'{part} ({errors:g} failed)' if errors else part)
+
+        return ', '.join(parts)
+
+
+tick_calls: ContextVar[Optional[CallSummary]] = ContextVar('tick_calls', default=None)
+
+
+def start_call_summary() -> CallSummary:
+    # Calls made from this task, and from the executor threads it runs ccxt in, are summed here
+    summary = CallSummary()
+    tick_calls.set(summary)
+    return summary
+
+
+def record_call(exchange: str, method: str, endpoint: str, seconds: float, error: Optional[str], weight: float):
+    call_seconds.observe(seconds, exchange=exchange, method=method, endpoint=endpoint)
+    call_weight.inc(weight, exchange=exchange, endpoint=endpoint)
+    if error:
+        call_errors.inc(exchange=exchange, method=method, endpoint=endpoint, error=error)
+
+    summary = tick_calls.get()
+    if summary is not None:
+        summary.record(exchange=exchange,
+                       method=method,
+                       seconds=seconds,
+                       error=error,
+                       weight=weight)
+
+
+def unified(fn, name: str):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Nested unified calls, create_order loading markets for instance, are labeled with the outermost one
+        if getattr(_current, 'method', None) is not None:
+            return fn(*args, **kwargs)
+
+        _current.method = name
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.method = None
+    return wrapper
+
+
+def request_of(exchange: Exchange, fetch2: inspect.Signature, cost: inspect.Signature,
+               args: tuple, kwargs: dict) -> Tuple[str, float]:
+    # Metrics never get in the way of the request, arguments that do not bind are recorded as best as possible
+    try:
+        bound = fetch2.bind(*args, **kwargs)
+        bound.apply_defaults()
+    except TypeError:
+        return f'{args[0] if args else kwargs.get("path")}', 1
+
+    arguments = bound.arguments
+    try:
+        # The rate limiter cost takes the arguments of the request, context included on the ccxt versions having it
+        weight = exchange.calculate_rate_limiter_cost(**{name: arguments[name] for name in cost.parameters
+                                                         if name in arguments})
+    except Exception:
+        weight = 1
+
+    return f'{arguments.get("method")} {arguments.get("path")}', weight
+
+
+def instrument(exchange: Exchange) -> Exchange:
+    if EXCHANGE_METRICS != '1':
+        return exchange
+
+    fetch2 = exchange.fetch2
+    fetch = exchange.fetch
+
+    # fetch2 gained arguments across ccxt versions, context for one, they are passed through as given
+    fetch2_signature = inspect.signature(fetch2)
+    cost_signature = inspect.signature(exchange.calculate_rate_limiter_cost)
+
+    def instrumented_fetch2(path, *args, **kwargs):
+        _current.request = request_of(exchange=exchange,
+                                      fetch2=fetch2_signature,
+                                      cost=cost_signature,
+                                      args=(path,) + args,
+                                      kwargs=kwargs)
+        try:
+            return fetch2(path, *args, **kwargs)
+        finally:
+            _current.request = None
+
+    def instrumented_fetch(url, method='GET', headers=None, body=None):
+        endpoint, weight = getattr(_current, 'request', None) or (f'{method} {url}', 1)
+        error = None
+        started = time.perf_counter()
+        try:
+            return fetch(url, method, headers, body)
+        except Exception as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            record_call(exchange=exchange.id,
+                        method=getattr(_current, 'method', None) or 'implicit',
+                        endpoint=endpoint,
+                        seconds=time.perf_counter() - started,
+                        error=error,
+                        weight=float(weight or 0))
+
+    exchange.fetch2 = instrumented_fetch2
+    exchange.fetch = instrumented_fetch
+    for name in dir(type(exchange)):
+        if name.startswith(UNIFIED_PREFIXES) and callable(getattr(type(exchange), name, None)):
+            setattr(exchange, name, unified(getattr(exchange, name), name=name))
+
+    return exchange
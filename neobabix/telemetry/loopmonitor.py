@@ -0,0 +1,152 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+import weakref
+from os import environ
+from typing import Dict, Optional
+
+from neobabix.logging import logger
+from neobabix.telemetry.metrics import Labels, metrics
+
+LOOP_MONITOR = environ.get('LOOP_MONITOR', '1')
+LOOP_MONITOR_INTERVAL = environ.get('LOOP_MONITOR_INTERVAL', '0.5')
+LOOP_LAG_THRESHOLD = environ.get('LOOP_LAG_THRESHOLD', '0.5')
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+"""
+    Event loop health monitor.
+
+    A heartbeat task sleeps LOOP_MONITOR_INTERVAL seconds at a time on the loop, how late it wakes up is the loop's
+    scheduling lag, observed into the neobabix_loop_lag_seconds histogram. Lag means something ran on the loop without
+    yielding, a sync ccxt call or a slow callback for instance.
+
+    Lag measured after the fact does not say what blocked the loop, so a watchdog thread checks on the heartbeat too.
+    When it is more than LOOP_LAG_THRESHOLD seconds late, the loop is blocked right now and the watchdog logs the stack
+    of the loop thread, which points at the blocking call. Every stall is logged once and counted into
+    neobabix_loop_stalls_total.
+
+    Pending tasks are counted by coroutine along with the age of the oldest one, tasks piling up or never finishing
+    show up there. Ages are as seen by the heartbeat, precise to LOOP_MONITOR_INTERVAL. LOOP_MONITOR=0 disables it all.
+"""
+
+loop_lag = metrics.histogram('neobabix_loop_lag_seconds', 'Seconds the event loop was late to run the heartbeat',
+                             buckets=LAG_BUCKETS)
+loop_stalls = metrics.counter('neobabix_loop_stalls_total', 'Times the event loop was blocked past the lag threshold')
+
+
+def coroutine_name(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, '__qualname__', None) or type(coro).__name__
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = float(LOOP_MONITOR_INTERVAL), threshold: float = float(LOOP_LAG_THRESHOLD)):
+        self.interval = interval
+        self.threshold = threshold
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.running = False
+
+        # Written by the heartbeat, read by the watchdog thread
+        self.last_beat = time.monotonic()
+        self.reported_beat: Optional[float] = None
+
+        # Tasks as first seen by the heartbeat, forgotten once they are collected
+        self.first_seen: 'weakref.WeakKeyDictionary[asyncio.Task, float]' = weakref.WeakKeyDictionary()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.running:
+            return
+
+        self.running = True
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.heartbeat_task = loop.create_task(self.heartbeat())
+        self.watchdog = threading.Thread(target=self.watch, name='neobabix-loop-watchdog', daemon=True)
+        self.watchdog.start()
+        logger.info(f'Monitoring the event loop every {self.interval}s, stalls past {self.threshold}s are logged')
+
+    def stop(self):
+        self.running = False
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+
+    async def heartbeat(self):
+        while self.running:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_beat = now
+
+            lag = max(now - before - self.interval, 0.0)
+            loop_lag.observe(lag)
+            if lag >= self.threshold:
+                logger.warning(f'Event loop was blocked for {lag:.3f}s')
+
+            self.track_tasks(now=now)
+
+    def track_tasks(self, now: float):
+        for task in asyncio.all_tasks(self.loop):
+            if task not in self.first_seen:
+                self.first_seen[task] = now
+
+    def watch(self):
+        while self.running:
+            time.sleep(min(self.interval, self.threshold) / 2)
+
+            last_beat = self.last_beat
+            late = time.monotonic() - last_beat - self.interval
+            if late < self.threshold or self.reported_beat == last_beat:
+                continue
+
+            # One report per stall, the heartbeat moves on once the loop is free again
+            self.reported_beat = last_beat
+            loop_stalls.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else 'unavailable\n'
+            logger.warning(f'Event loop blocked for {late:.3f}s so far, loop thread stack:\n{stack.rstrip()}')
+
+    def task_stats(self) -> Dict[str, Dict[str, float]]:
+        if self.loop is None:
+            return {}
+
+        now = time.monotonic()
+        stats: Dict[str, Dict[str, float]] = {}
+        for task in asyncio.all_tasks(self.loop):
+            if task is self.heartbeat_task:
+                continue
+
+            values = stats.setdefault(coroutine_name(task), {'pending': 0.0, 'age_max': 0.0})
+            values['pending'] += 1
+            values['age_max'] = max(values['age_max'], now - self.first_seen.get(task, now))
+
+        return stats
+
+
+def stats_by_coroutine(field: str):
+    def collect() -> Dict[Labels, float]:
+        return {(('coroutine', name),): values[field] for name, values in loop_monitor.task_stats().items()}
+    return collect
+
+
+loop_monitor = LoopMonitor()
+
+metrics.collected('neobabix_loop_tasks_pending', 'Tasks pending on the event loop',
+                  stats_by_coroutine('pending'))
+metrics.collected('neobabix_loop_task_age_max_seconds', 'Age of the oldest pending task',
+                  stats_by_coroutine('age_max'))
+
+
+def start_loop_monitor(loop: asyncio.AbstractEventLoop) -> Optional[LoopMonitor]:
+    if LOOP_MONITOR != '1':
+        return None
+
+    loop_monitor.start(loop=loop)
+    return loop_monitor
@@ -0,0 +1,208 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from os import environ
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from neobabix.cache.account import account_cache
+from neobabix.cache.market import market_cache
+from neobabix.logging import logger
+from neobabix.notifications.dispatcher import dispatcher_stats
+
+METRICS_PORT = environ.get('METRICS_PORT')
+METRICS_HOST = environ.get('METRICS_HOST', '127.0.0.1')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0)
+
+"""
+    Lightweight in process metrics, exposed in the Prometheus text format at /metrics on METRICS_HOST:METRICS_PORT
+    when METRICS_PORT is set.
+
+    Every stage of a tick (candles, indicators, filter, route, playbook) and of a play (entry, after_entry, exit,
+    bracket, after_exit, poll) is timed into the neobabix_stage_seconds histogram. Signals, orders and errors are
+    counted, an error is counted once, at the stage it was raised from. Cache and notification queue stats are read
+    when scraped.
+"""
+
+
+def labels_of(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    escaped = [(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.series: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = labels_of(labels)
+        self.series[key] = self.series.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{format_labels(key)} {value:g}' for key, value in self.series.items()]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket plus one past the last bucket, then the sum
+        self.series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = labels_of(labels)
+        counts = self.series.get(key)
+        if counts is None:
+            counts = [0.0] * (len(self.buckets) + 2)
+            self.series[key] = counts
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self.series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(key, (("le", f"{bound:g}"),))} {cumulative:g}')
+            cumulative += counts[-2]
+            lines.append(f'{self.name}_bucket{format_labels(key, (("le", "+Inf"),))} {cumulative:g}')
+            lines.append(f'{self.name}_sum{format_labels(key)} {counts[-1]:g}')
+            lines.append(f'{self.name}_count{format_labels(key)} {cumulative:g}')
+        return lines
+
+
+class Collected:
+    # Read from elsewhere when scraped, like cache and queue stats
+    def __init__(self, name: str, documentation: str, collect: Callable[[], Dict[Labels, float]],
+                 kind: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{format_labels(key)} {value:g}' for key, value in self.collect().items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self.register(Counter(name=name, documentation=documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name=name, documentation=documentation, buckets=buckets))
+
+    def collected(self, name: str, documentation: str, collect: Callable[[], Dict[Labels, float]],
+                  kind: str = 'gauge') -> Collected:
+        return self.register(Collected(name=name, documentation=documentation, collect=collect, kind=kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as exc:
+                logger.error(f'Could not collect {metric.name}: {exc}')
+                continue
+
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(samples)
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram('neobabix_stage_seconds', 'Seconds spent in each stage of ticks and plays')
+signals_total = metrics.counter('neobabix_signals_total', 'Signals given by strategies')
+orders_total = metrics.counter('neobabix_orders_total', 'Orders placed by playbooks')
+errors_total = metrics.counter('neobabix_errors_total', 'Errors by the stage they were raised from')
+
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        # Enclosing stages see the same exception, only the innermost one counts it
+        if getattr(exc, 'metrics_stage', None) is None:
+            exc.metrics_stage = stage
+            errors_total.inc(stage=stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+
+def timed(stage: str):
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(stage=stage):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats_by(stats: Callable[[], Dict[str, Dict[str, float]]], label: str, field: str) -> Callable:
+    return lambda: {((label, name),): values.get(field, 0.0) for name, values in stats().items()}
+
+
+metrics.collected('neobabix_market_cache_hit_rate', 'Share of market data requests served without a request',
+                  lambda: {(): market_cache.stats().get('hit_rate')})
+metrics.collected('neobabix_account_cache_hit_rate', 'Share of account settings reads served from the cache',
+                  lambda: {(): account_cache.stats().get('hit_rate')})
+metrics.collected('neobabix_notifications_queued', 'Notifications waiting to be sent',
+                  stats_by(dispatcher_stats, 'channel', 'queued'))
+metrics.collected('neobabix_notifications_sent_total', 'Notifications sent',
+                  stats_by(dispatcher_stats, 'channel', 'sent'), kind='counter')
+metrics.collected('neobabix_notifications_failed_total', 'Notifications given up on after every retry',
+                  stats_by(dispatcher_stats, 'channel', 'failed'), kind='counter')
+metrics.collected('neobabix_notifications_dropped_total', 'Notifications dropped from full queues',
+                  stats_by(dispatcher_stats, 'channel', 'dropped'), kind='counter')
+metrics.collected('neobabix_notification_latency_max_seconds', 'Longest time from queued to sent',
+                  stats_by(dispatcher_stats, 'channel', 'latency_max'))
+
+
+async def serve_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render().encode('utf-8'),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def start_metrics_server(port: int, host: str = METRICS_HOST) -> Optional[web.AppRunner]:
+    app = web.Application()
+    app.router.add_get('/metrics', serve_metrics)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f'Serving metrics at http://{host}:{port}/metrics')
+
+    return runner
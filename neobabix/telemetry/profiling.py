@@ -0,0 +1,140 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import datetime
+from os import environ
+from typing import Optional
+
+from neobabix.execution.orders import run_sync
+from neobabix.logging import logger
+
+PROFILE_EVERY = environ.get('PROFILE_EVERY', '0')
+PROFILE_SLOWER_THAN = environ.get('PROFILE_SLOWER_THAN')
+PROFILE_DIR = environ.get('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = environ.get('PROFILE_KEEP', '20')
+PROFILE_MEMORY = environ.get('PROFILE_MEMORY', '1')
+PROFILE_TOP = environ.get('PROFILE_TOP', '30')
+
+"""
+    Opt-in CPU and memory profiling of live ticks.
+
+    Ticks are profiled with cProfile, and tracemalloc when PROFILE_MEMORY=1, either every PROFILE_EVERY ticks or, with
+    PROFILE_SLOWER_THAN set, every tick with only ticks slower than that many seconds being kept. Profiling every tick
+    to keep the slow ones costs CPU on every tick, ticks mostly wait on the network so it is usually affordable.
+
+    Each profiled tick leaves in PROFILE_DIR:
+        - <time>-<name>.prof: the cProfile dump, for pstats or snakeviz
+        - <time>-<name>.txt: the PROFILE_TOP functions by cumulative time and, with tracemalloc, the PROFILE_TOP lines
+          that allocated the most during the tick
+
+    Only the PROFILE_KEEP latest profiled ticks are kept. One tick is profiled at a time, other bots ticking meanwhile
+    run as usual, and profiling failures are logged without affecting the tick.
+"""
+
+
+class TickProfiler:
+    def __init__(self, every: int = int(PROFILE_EVERY),
+                 slower_than: Optional[float] = float(PROFILE_SLOWER_THAN) if PROFILE_SLOWER_THAN else None,
+                 path: str = PROFILE_DIR, keep: int = int(PROFILE_KEEP), memory: bool = PROFILE_MEMORY == '1',
+                 top: int = int(PROFILE_TOP)):
+        self.every = every
+        self.slower_than = slower_than
+        self.path = path
+        self.keep = max(keep, 1)
+        self.memory = memory
+        self.top = top
+
+        self.ticks = 0
+        # cProfile and tracemalloc are process wide, only one tick at a time
+        self.active = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.every > 0 or self.slower_than is not None
+
+    def wanted(self) -> bool:
+        self.ticks += 1
+        if self.active:
+            return False
+        return self.slower_than is not None or self.ticks % self.every == 0
+
+    @asynccontextmanager
+    async def profile(self, name: str):
+        if not self.enabled or not self.wanted():
+            yield
+            return
+
+        self.active = True
+        profiler = cProfile.Profile()
+        started_tracing = self.memory and not tracemalloc.is_tracing()
+        before = None
+        try:
+            if started_tracing:
+                tracemalloc.start()
+            if self.memory:
+                before = tracemalloc.take_snapshot()
+            profiler.enable()
+        except Exception as exc:
+            logger.error(f'Could not start profiling {name}: {exc}')
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            try:
+                profiler.disable()
+                after = tracemalloc.take_snapshot() if before is not None else None
+                if started_tracing:
+                    tracemalloc.stop()
+
+                if self.slower_than is None or elapsed >= self.slower_than:
+                    await run_sync(self.write,
+                                   name=name,
+                                   elapsed=elapsed,
+                                   profiler=profiler,
+                                   before=before,
+                                   after=after)
+            except Exception as exc:
+                logger.error(f'Could not write the profile of {name}: {exc}')
+            finally:
+                self.active = False
+
+    def write(self, name: str, elapsed: float, profiler: cProfile.Profile,
+              before: Optional[tracemalloc.Snapshot], after: Optional[tracemalloc.Snapshot]):
+        os.makedirs(self.path, exist_ok=True)
+        prefix = os.path.join(self.path, f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{re.sub(r"[^A-Za-z0-9_.-]", "_", name)}')
+
+        profiler.dump_stats(f'{prefix}.prof')
+
+        report = io.StringIO()
+        report.write(f'{name} took {elapsed:.3f}s\n\n')
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(self.top)
+        if before is not None and after is not None:
+            report.write(f'Top {self.top} allocations during the tick\n\n')
+            for stat in after.compare_to(before, 'lineno')[:self.top]:
+                report.write(f'{stat}\n')
+
+        with open(f'{prefix}.txt', 'w') as f:
+            f.write(report.getvalue())
+
+        logger.info(f'Profiled {name} in {elapsed:.3f}s, written to {prefix}.prof')
+        self.prune()
+
+    def prune(self):
+        # Every profiled tick leaves a .prof and a .txt sharing their prefix, the oldest sort first
+        prefixes = sorted(set(os.path.splitext(entry)[0] for entry in os.listdir(self.path)
+                              if entry.endswith(('.prof', '.txt'))))
+        for prefix in prefixes[:-self.keep]:
+            for extension in ('.prof', '.txt'):
+                filename = os.path.join(self.path, f'{prefix}{extension}')
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+
+tick_profiler = TickProfiler()